@@ -0,0 +1 @@
+# Benchmarks and local fake providers for the AI Factory backend
@@ -0,0 +1,102 @@
+"""Seeded function configurations, one or more per implementation type
+
+Every fixture targets something local: the LLM types point at a stub provider
+server and database_query at a SQLite file filled from the seed, so a run is
+repeatable and measures this service rather than a remote API.
+"""
+import json
+import os
+import random
+import sqlite3
+from typing import Dict, Any, Callable, List
+
+# Rows in the database_query fixture table
+CATALOG_ROWS = 10000
+
+WORDS = ["alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel", "india", "juliet"]
+
+class Fixture:
+    """A function to seed, and a generator of inputs for calls to it"""
+
+    __slots__ = ("name", "implementation_type", "input_schema", "config", "make_inputs", "streams")
+
+    def __init__(
+        self,
+        name: str,
+        implementation_type: str,
+        input_schema: Dict[str, Any],
+        config: Dict[str, Any],
+        make_inputs: Callable[[random.Random], Dict[str, Any]],
+        streams: bool = False,
+    ):
+        self.name = name
+        self.implementation_type = implementation_type
+        self.input_schema = input_schema
+        self.config = config
+        self.make_inputs = make_inputs
+        # Whether the /stream endpoint streams tokens for it
+        self.streams = streams
+
+def create_catalog(path: str, seed: int, rows: int = CATALOG_ROWS) -> str:
+    """(Re)create the SQLite file queried by the database_query fixture; returns its URL"""
+    if os.path.exists(path):
+        os.remove(path)
+    rng = random.Random(seed)
+    with sqlite3.connect(path) as connection:
+        connection.execute("CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, price REAL, stock INTEGER)")
+        connection.executemany(
+            "INSERT INTO products VALUES (?, ?, ?, ?)",
+            ((i, f"{rng.choice(WORDS)}-{i}", round(rng.uniform(1, 500), 2), rng.randint(0, 1000)) for i in range(1, rows + 1)),
+        )
+    return f"sqlite:///{path}"
+
+def _prompt_inputs(rng: random.Random) -> Dict[str, Any]:
+    return {"topic": " ".join(rng.choice(WORDS) for _ in range(3))}
+
+def build_fixtures(stub_url: str, catalog_url: str) -> List[Fixture]:
+    prompt_schema = {"type": "object", "properties": {"topic": {"type": "string"}}, "required": ["topic"]}
+    prompt = "Write one sentence about {topic}."
+    # No retries: a benchmark should see provider errors, not hide them
+    llm = {"prompt_template": prompt, "retry": {"max_attempts": 1}}
+    number_schema = {"type": "object", "properties": {"n": {"type": "integer", "minimum": 1}}, "required": ["n"]}
+    return [
+        Fixture("bench_anthropic", "anthropic", prompt_schema,
+                {**llm, "model": "claude-stub", "base_url": stub_url, "api_key": "stub"}, _prompt_inputs, streams=True),
+        Fixture("bench_perplexity", "perplexity", prompt_schema,
+                {**llm, "model": "sonar-stub", "base_url": stub_url, "api_key": "stub"}, _prompt_inputs, streams=True),
+        Fixture("bench_ollama", "ollama", prompt_schema,
+                {**llm, "model": "llama-stub", "host": stub_url}, _prompt_inputs, streams=True),
+        Fixture("bench_database_query", "database_query", {"type": "object", "properties": {"id": {"type": "integer"}}, "required": ["id"]},
+                {"connection_string": catalog_url, "query_template": "SELECT id, name, price, stock FROM products WHERE id = {id}"},
+                lambda rng: {"id": rng.randint(1, CATALOG_ROWS)}),
+        Fixture("bench_python_code", "python_code", number_schema,
+                {"code": "def run(n):\n    return {'sum': sum(i * i for i in range(n))}", "function_name": "run"},
+                lambda rng: {"n": rng.randint(100, 1000)}),
+        Fixture("bench_pipeline", "pipeline", {"type": "object", "properties": {"id": {"type": "integer"}, "n": {"type": "integer"}}},
+                {"nodes": {
+                    "product": {"function": "bench_database_query", "inputs": {"id": "$inputs.id"}},
+                    "squares": {"function": "bench_python_code", "inputs": {"n": "$inputs.n"}},
+                }},
+                lambda rng: {"id": rng.randint(1, CATALOG_ROWS), "n": rng.randint(100, 1000)}),
+    ]
+
+async def seed_functions(client, fixtures: List[Fixture]) -> None:
+    """Create the fixtures through the admin API, replacing earlier copies
+
+    Going through the API means the same seeding works for the in-process app
+    and for a server started elsewhere.
+    """
+    existing = {function["name"]: function["id"] for function in (await client.get("/api/admin/functions")).json()}
+    for fixture in fixtures:
+        if fixture.name in existing:
+            await client.delete(f"/api/admin/functions/{existing[fixture.name]}")
+        response = await client.post("/api/admin/functions", data={
+            "name": fixture.name,
+            "description": f"Benchmark fixture ({fixture.implementation_type})",
+            "input_schema": json.dumps(fixture.input_schema),
+            "implementation_type": fixture.implementation_type,
+            "implementation_config": json.dumps(fixture.config),
+            "is_active": "true",
+        })
+        if response.status_code != 200 or not response.json().get("success"):
+            raise RuntimeError(f"Could not create {fixture.name}: {response.text}")
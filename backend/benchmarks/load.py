@@ -0,0 +1,278 @@
+"""Load-test the execution path and compare results between commits
+
+Seeds one function per implementation type (see benchmarks/fixtures.py), then
+for each function and concurrency level runs a closed loop of calls for a
+fixed time and reports RPS and p50/p95/p99 latency. LLM functions are also
+driven through /stream, where time to first token is reported as well.
+
+Run from the backend directory:
+    python -m benchmarks.load --concurrency 1,8,32 --duration 5
+    python -m benchmarks.load --types database_query,python_code --compare HEAD~1
+    python -m benchmarks.load --url http://localhost:8000   # a running server
+
+Results are written to benchmarks/results/<commit>.json. --compare loads an
+earlier run (a commit, or a results file) and exits non-zero when a scenario's
+p95 latency or RPS got worse by more than --threshold.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.fixtures import Fixture, build_fixtures, create_catalog, seed_functions
+from benchmarks.stub_providers import StubProviderServer
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+PERCENTILES = (50, 95, 99)
+
+def percentile(ordered: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    rank = max(0, -(-len(ordered) * p // 100) - 1)
+    return ordered[int(rank)]
+
+def summarize(latencies: List[float], errors: int, elapsed: float, first_tokens: Optional[List[float]] = None) -> Dict[str, Any]:
+    ordered = sorted(latencies)
+    summary = {
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / elapsed, 1) if elapsed > 0 else 0.0,
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2) if ordered else None,
+    }
+    for p in PERCENTILES:
+        value = percentile(ordered, p)
+        summary[f"p{p}_ms"] = round(value * 1000, 2) if value is not None else None
+    if first_tokens:
+        value = percentile(sorted(first_tokens), 50)
+        summary["ttft_p50_ms"] = round(value * 1000, 2)
+    return summary
+
+async def _call(client: httpx.AsyncClient, fixture: Fixture, inputs: Dict[str, Any]) -> Tuple[bool, None]:
+    response = await client.post(f"/api/functions/{fixture.name}", json={"inputs": inputs})
+    return response.status_code == 200, None
+
+async def _stream(client: httpx.AsyncClient, fixture: Fixture, inputs: Dict[str, Any]) -> Tuple[bool, Optional[float]]:
+    started = time.perf_counter()
+    first_token = None
+    ok = False
+    async with client.stream("POST", f"/api/functions/{fixture.name}/stream", json={"inputs": inputs}) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("event: token") and first_token is None:
+                first_token = time.perf_counter() - started
+            elif line.startswith("event: done"):
+                ok = response.status_code == 200
+    return ok, first_token
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    fixture: Fixture,
+    mode: str,
+    concurrency: int,
+    duration: float,
+    seed: int,
+    warmup: int = 1,
+) -> Dict[str, Any]:
+    """Keep `concurrency` calls in flight for `duration` seconds"""
+    request = _stream if mode == "stream" else _call
+    latencies: List[float] = []
+    first_tokens: List[float] = []
+    errors = 0
+
+    async def worker(index: int, deadline: Optional[float], record: bool) -> None:
+        nonlocal errors
+        # Seeded per worker, so a run sends the same inputs in the same order
+        rng = random.Random(seed * 1000 + index)
+        calls = 0
+        while (deadline is None and calls < warmup) or (deadline is not None and time.perf_counter() < deadline):
+            calls += 1
+            started = time.perf_counter()
+            try:
+                ok, first_token = await request(client, fixture, fixture.make_inputs(rng))
+            except httpx.HTTPError:
+                ok, first_token = False, None
+            if not record:
+                continue
+            latencies.append(time.perf_counter() - started)
+            if first_token is not None:
+                first_tokens.append(first_token)
+            if not ok:
+                errors += 1
+
+    # Warm up connections, compiled functions and caches outside the measurement
+    await asyncio.gather(*(worker(i, None, False) for i in range(concurrency)))
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(worker(i, deadline, True) for i in range(concurrency)))
+    return {
+        "function": fixture.name,
+        "type": fixture.implementation_type,
+        "mode": mode,
+        "concurrency": concurrency,
+        **summarize(latencies, errors, time.perf_counter() - started, first_tokens),
+    }
+
+@asynccontextmanager
+async def in_process_client():
+    """A client for the app running in this process, with its lifespan started"""
+    from main import app
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=120.0) as client:
+            yield client
+
+@asynccontextmanager
+async def remote_client(url: str):
+    limits = httpx.Limits(max_connections=1000, max_keepalive_connections=1000)
+    async with httpx.AsyncClient(base_url=url, timeout=120.0, limits=limits) as client:
+        yield client
+
+async def run_benchmarks(client: httpx.AsyncClient, fixtures: List[Fixture], args) -> List[Dict[str, Any]]:
+    results = []
+    for fixture in fixtures:
+        modes = ["call", "stream"] if fixture.streams and not args.no_stream else ["call"]
+        for mode in modes:
+            for concurrency in args.concurrency:
+                result = await run_scenario(client, fixture, mode, concurrency, args.duration, args.seed)
+                results.append(result)
+                print(format_result(result), flush=True)
+    return results
+
+def format_result(result: Dict[str, Any]) -> str:
+    ttft = f" ttft p50 {result['ttft_p50_ms']:.1f}ms" if result.get("ttft_p50_ms") is not None else ""
+    return (
+        f"{result['type']:<15}{result['mode']:<7}c={result['concurrency']:<4}"
+        f"{result['rps']:>9.1f} rps  p50 {result['p50_ms'] or 0:>8.1f}ms  p95 {result['p95_ms'] or 0:>8.1f}ms  "
+        f"p99 {result['p99_ms'] or 0:>8.1f}ms  errors {result['errors']}/{result['requests']}{ttft}"
+    )
+
+def git_commit() -> Tuple[str, bool]:
+    """(short commit, whether the tree has uncommitted changes)"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+
+def save_results(results: List[Dict[str, Any]], settings: Dict[str, Any], directory: str = RESULTS_DIR) -> str:
+    commit, dirty = git_commit()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{commit}{'-dirty' if dirty else ''}.json")
+    with open(path, "w") as f:
+        json.dump({
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "settings": settings,
+            "results": results,
+        }, f, indent=2)
+    return path
+
+def load_results(reference: str, directory: str = RESULTS_DIR) -> Dict[str, Any]:
+    """Results from a file path, or from the run stored for a commit (any git revision)"""
+    if os.path.isfile(reference):
+        path = reference
+    else:
+        try:
+            commit = subprocess.run(["git", "rev-parse", "--short", reference], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = reference
+        path = os.path.join(directory, f"{commit}.json")
+    with open(path) as f:
+        return json.load(f)
+
+def compare(baseline: List[Dict[str, Any]], current: List[Dict[str, Any]], threshold: float) -> List[str]:
+    """Regressions of p95 latency or RPS beyond `threshold` (a fraction), one line each"""
+    def key(result):
+        return result["function"], result["mode"], result["concurrency"]
+
+    before = {key(result): result for result in baseline}
+    regressions = []
+    for result in current:
+        old = before.get(key(result))
+        if old is None:
+            continue
+        label = f"{result['type']} {result['mode']} c={result['concurrency']}"
+        if old["p95_ms"] and result["p95_ms"] and result["p95_ms"] > old["p95_ms"] * (1 + threshold):
+            regressions.append(f"{label}: p95 {old['p95_ms']:.1f}ms -> {result['p95_ms']:.1f}ms")
+        if old["rps"] and result["rps"] < old["rps"] * (1 - threshold):
+            regressions.append(f"{label}: {old['rps']:.1f} -> {result['rps']:.1f} rps")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--types", default="all", help="Comma-separated implementation types (default: all)")
+    parser.add_argument("--concurrency", default="1,8,32", type=lambda s: [int(n) for n in s.split(",")])
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds measured per scenario")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub provider latency before responding")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="Stub provider delay between streamed tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub provider requests that fail")
+    parser.add_argument("--no-stream", action="store_true", help="Skip the /stream scenarios")
+    parser.add_argument("--url", help="Benchmark a running server instead of the app in this process")
+    parser.add_argument("--compare", help="Commit or results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Regression tolerance, as a fraction")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="ai_factory_bench_")
+    if not args.url:
+        # A throwaway config store, set before the app is imported
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'config.db')}")
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    with StubProviderServer(latency=args.latency, token_delay=args.token_delay, error_rate=args.error_rate, seed=args.seed) as server:
+        catalog_url = create_catalog(os.path.join(workdir, "catalog.db"), args.seed)
+        # Every fixture is seeded (the pipeline calls others); only the chosen types are measured
+        fixtures = build_fixtures(server.url, catalog_url)
+        measured = fixtures
+        if args.types != "all":
+            wanted = set(args.types.split(","))
+            measured = [fixture for fixture in fixtures if fixture.implementation_type in wanted]
+
+        async def run():
+            client_context = remote_client(args.url) if args.url else in_process_client()
+            async with client_context as client:
+                await seed_functions(client, fixtures)
+                return await run_benchmarks(client, measured, args)
+
+        results = asyncio.run(run())
+
+    settings = {
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "seed": args.seed,
+        "latency": args.latency,
+        "token_delay": args.token_delay,
+        "error_rate": args.error_rate,
+        "target": args.url or "in-process",
+    }
+    if not args.no_save:
+        print(f"Results written to {save_results(results, settings)}")
+
+    if args.compare:
+        baseline = load_results(args.compare)
+        regressions = compare(baseline["results"], results, args.threshold)
+        if regressions:
+            print(f"Regressions against {baseline['commit']} (threshold {args.threshold:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"No regressions against {baseline['commit']} (threshold {args.threshold:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Measure how many provider calls overlap on one event loop
+
+Run from the backend directory:
+    python -m benchmarks.provider_concurrency --calls 200 --latency 0.5
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.stub_providers import StubProviderServer
+from services.providers.anthropic import execute_anthropic_function
+from services.providers.perplexity import execute_perplexity_function
+from services.providers.ollama import execute_ollama_function
+
+def provider_calls(url: str):
+    """Provider name -> (handler, config) aimed at the stub server"""
+    return {
+        "anthropic": (execute_anthropic_function, {"base_url": url, "api_key": "stub"}),
+        "perplexity": (execute_perplexity_function, {"base_url": url, "api_key": "stub"}),
+        "ollama": (execute_ollama_function, {"host": url}),
+    }
+
+async def run_concurrent(handler, config, calls: int) -> float:
+    """Fire `calls` requests at once and return the wall-clock time"""
+    config = {**config, "prompt_template": "Say {word}"}
+    started = time.perf_counter()
+    await asyncio.gather(*(handler(config, {"word": str(i)}) for i in range(calls)))
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    with StubProviderServer(latency=args.latency) as server:
+        for provider, (handler, config) in provider_calls(server.url).items():
+            elapsed = asyncio.run(run_concurrent(handler, config, args.calls))
+            serial = args.calls * args.latency
+            print(
+                f"{provider:<11} {args.calls} calls in {elapsed:.2f}s "
+                f"(serial would take {serial:.1f}s, overlap x{serial / elapsed:.1f})"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+STUB_TOKENS = ["stub", " streamed", " response"]
+
+def _anthropic_events(model: str):
+    yield "message_start", {"type": "message_start", "message": {
+        "id": "msg_stub", "type": "message", "role": "assistant", "model": model, "content": [],
+        "stop_reason": None, "stop_sequence": None, "usage": {"input_tokens": 10, "output_tokens": 0},
+    }}
+    yield "content_block_start", {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}
+    for token in STUB_TOKENS:
+        yield "content_block_delta", {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": token}}
+    yield "content_block_stop", {"type": "content_block_stop", "index": 0}
+    yield "message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None}, "usage": {"output_tokens": len(STUB_TOKENS)}}
+    yield "message_stop", {"type": "message_stop"}
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+    """Answers Anthropic, Perplexity and Ollama chat requests after a fixed delay
+
+    Requests with "stream": true get the provider's streaming format, one token
+    every `token_delay` seconds. A fraction `error_rate` of requests (and the
+    next `fail_next` ones) are answered with `error_status` instead.
+    """
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; with Nagle on, the body
+    # waits for the client's delayed ACK and adds ~40ms to every response
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        time.sleep(self.server.next_latency())
+        
+        if self.server.should_fail():
+            data = json.dumps({"error": {"type": "overloaded_error", "message": "stub failure"}}).encode()
+            self.send_response(self.server.error_status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        model = payload.get("model", "stub")
+        if payload.get("stream"):
+            self._stream(model)
+            return
+
+        text = "stub response"
+        if self.path.endswith("/v1/messages"):
+            body = {
+                "id": "msg_stub",
+                "type": "message",
+                "role": "assistant",
+                "model": model,
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn",
+                "stop_sequence": None,
+                "usage": {"input_tokens": 10, "output_tokens": 2},
+            }
+        elif self.path.endswith("/chat/completions"):
+            body = {
+                "id": "cmpl_stub",
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 2},
+            }
+        elif self.path.endswith("/api/chat"):
+            body = {
+                "model": model,
+                "message": {"role": "assistant", "content": text},
+                "done": True,
+                "prompt_eval_count": 10,
+                "eval_count": 2,
+            }
+        else:
+            self.send_error(404)
+            return
+
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, model: str):
+        if self.path.endswith("/v1/messages"):
+            lines = (f"event: {event}\ndata: {json.dumps(data)}\n\n" for event, data in _anthropic_events(model))
+            content_type = "text/event-stream"
+        elif self.path.endswith("/chat/completions"):
+            chunks = [{"choices": [{"index": 0, "delta": {"content": token}}]} for token in STUB_TOKENS]
+            lines = [f"data: {json.dumps(chunk)}\n\n" for chunk in chunks] + ["data: [DONE]\n\n"]
+            content_type = "text/event-stream"
+        elif self.path.endswith("/api/chat"):
+            chunks = [{"model": model, "message": {"role": "assistant", "content": token}, "done": False} for token in STUB_TOKENS]
+            chunks.append({"model": model, "message": {"role": "assistant", "content": ""}, "done": True})
+            lines = [json.dumps(chunk) + "\n" for chunk in chunks]
+            content_type = "application/x-ndjson"
+        else:
+            self.send_error(404)
+            return
+
+        # No Content-Length: the body ends when the connection closes
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for line in lines:
+            self.wfile.write(line.encode())
+            self.wfile.flush()
+            time.sleep(self.server.token_delay)
+
+class StubProviderServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(
+        self,
+        latency: float = 0.1,
+        port: int = 0,
+        token_delay: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        seed: Optional[int] = None,
+    ):
+        super().__init__(("127.0.0.1", port), StubProviderHandler)
+        self.latency = latency
+        self.token_delay = token_delay
+        self.error_rate = error_rate
+        self.error_status = error_status
+        # Fail this many upcoming requests, then fall back to error_rate
+        self.fail_next = 0
+        # Latencies used, in order, by the next requests instead of `latency`
+        self.scripted_latencies: deque = deque()
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def next_latency(self) -> float:
+        with self._lock:
+            self.requests += 1
+            return self.scripted_latencies.popleft() if self.scripted_latencies else self.latency
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                return True
+            return self.error_rate > 0 and self._random.random() < self.error_rate
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -1,4 +1,6 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
@@ -7,8 +9,50 @@ import datetime
 # Database setup
 DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "ai_factory.db")
 DATABASE_URL = os.environ.get("DATABASE_URL", f"sqlite:///{DB_PATH}")
+
+# SQLite tuning, applied to every connection:
+#   WAL lets readers run alongside the single writer instead of blocking on it,
+#   synchronous=NORMAL fsyncs at checkpoints rather than every commit (safe in WAL),
+#   mmap reads pages without a copy, and busy_timeout makes a writer wait for the
+#   lock instead of failing with "database is locked".
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# Async drivers by backend; a URL that names its driver is used as is
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+def async_database_url(url: str) -> str:
+    """The async-driver form of a database URL: sqlite -> aiosqlite, postgresql -> asyncpg"""
+    parsed = make_url(url)
+    if parsed.drivername in ASYNC_DRIVERS:
+        parsed = parsed.set(drivername=f"{parsed.drivername}+{ASYNC_DRIVERS[parsed.drivername]}")
+    return parsed.render_as_string(hide_password=False)
+
+def _tune_sqlite(engine) -> None:
+    if engine.dialect.name != "sqlite":
+        return
+    # In-memory databases have no journal file to put in WAL mode
+    in_memory = engine.url.database in (None, "", ":memory:")
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not in_memory:
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
+
+# Startup, the init script and the registry's background sync use the sync engine;
+# request handlers use the async one so database I/O never blocks the event loop
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_engine(async_database_url(DATABASE_URL))
+# Loaded attributes stay usable after commit (an expired one would need awaited I/O)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+_tune_sqlite(engine)
+_tune_sqlite(async_engine.sync_engine)
 Base = declarative_base()
 
 def get_db():
@@ -19,6 +63,11 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """Dependency for an async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def init_db():
     """Create tables"""
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
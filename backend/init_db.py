@@ -1,7 +1,7 @@
 import json
 import os
 from pathlib import Path
-from models import FunctionConfig
+from models import FunctionConfig, ConfigChange
 from database import init_db, SessionLocal
 
 def create_initial_functions():
@@ -45,6 +45,7 @@ def create_initial_functions():
         )
         
         db.add(function)
+        db.add(ConfigChange(function_name=function.name))
         print(f"Created function: {func_data.get('name')}")
     
     db.commit()
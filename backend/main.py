@@ -1,16 +1,75 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
+import asyncio
+import logging
 
-from database import init_db
-from routers import functions, admin
+from database import init_db, SessionLocal, async_engine
+from routers import functions, admin, jobs
+from services.registry import registry, watch_config_changes
+from services.providers.clients import client_pool
+from services.engines import engine_cache, evict_idle_engines
+from services.jobs import job_queue
+from services.history import execution_log, flush_executions
+from services.metrics import METRICS_DIR, flush_metrics, metrics
+from services.tracing import TracingMiddleware, export_spans, tracer
+from services.python_executor import start_process_pool, shutdown_python_executors
+from utils.log import setup_logging
+
+# Route logging through a background queue before anything logs
+setup_logging()
+logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: initialize the database
+    # Startup: initialize the database and compile all active functions
     init_db()
+    db = SessionLocal()
+    try:
+        count = registry.load(db)
+        logger.info("Loaded %d functions into the registry", count)
+    finally:
+        db.close()
+    start_process_pool()
+    # Background jobs run through the same path as synchronous calls
+    await job_queue.start(functions.execute_function_cached)
+    # Pick up config writes made by other workers
+    watcher = asyncio.create_task(watch_config_changes())
+    engine_sweeper = asyncio.create_task(evict_idle_engines())
+    # Publish this worker's metrics so any worker can serve the merged totals
+    metrics_flusher = asyncio.create_task(flush_metrics()) if METRICS_DIR else None
+    span_exporter = asyncio.create_task(export_spans()) if tracer.enabled else None
+    # Execution history is written in batches, off the request path
+    history_writer = asyncio.create_task(flush_executions()) if execution_log.enabled else None
     yield
-    # Shutdown: cleanup resources if needed
+    # Shutdown: stop background work and close pooled provider connections
+    await job_queue.stop()
+    watcher.cancel()
+    engine_sweeper.cancel()
+    # Final exports run off the event loop, and a failure must not skip the cleanup below
+    if metrics_flusher:
+        metrics_flusher.cancel()
+        try:
+            await asyncio.to_thread(metrics.write)
+        except OSError as e:
+            logger.warning("Could not write metrics snapshot: %s", e)
+    if span_exporter:
+        span_exporter.cancel()
+        try:
+            await asyncio.to_thread(tracer.export)
+        except Exception as e:
+            logger.warning("Could not export spans: %s", e)
+    if history_writer:
+        history_writer.cancel()
+        try:
+            await execution_log.flush()
+        except Exception as e:
+            logger.warning("Could not write execution history: %s", e)
+    await client_pool.close()
+    engine_cache.dispose_all()
+    await async_engine.dispose()
+    shutdown_python_executors()
 
 # Use the lifespan context manager
 app = FastAPI(
@@ -28,9 +87,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Root span of each request's trace
+app.add_middleware(TracingMiddleware)
+
 # Include routers
 app.include_router(functions.router)
 app.include_router(admin.router)
+app.include_router(jobs.router)
 
 @app.get("/")
 async def root():
@@ -40,6 +103,11 @@ async def root():
         "version": "0.1.0"
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus metrics, summed over all workers sharing METRICS_DIR"""
+    return await asyncio.to_thread(metrics.render)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean
+from sqlalchemy import Column, Integer, Float, String, Text, DateTime, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 import datetime
 from database import Base
@@ -10,8 +10,58 @@ class FunctionConfig(Base):
     name = Column(String, unique=True, index=True)
     description = Column(Text)
     input_schema = Column(Text)  # JSON schema as text
-    implementation_type = Column(String)  # "anthropic", "perplexity", "ollama", "database_query", "python_code"
+    implementation_type = Column(String)  # "anthropic", "perplexity", "ollama", "database_query", "python_code", "pipeline"
     implementation_config = Column(Text)  # JSON config as text
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
\ No newline at end of file
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+class ConfigChange(Base):
+    """Append-only log of function config writes; the latest id is the config version"""
+    __tablename__ = "config_changes"
+    __table_args__ = {"sqlite_autoincrement": True}  # never reuse ids, keep versions monotonic
+
+    id = Column(Integer, primary_key=True)
+    function_name = Column(String, index=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class Job(Base):
+    """A function call submitted to run in the background, and its outcome"""
+    __tablename__ = "jobs"
+
+    id = Column(String, primary_key=True)
+    function_name = Column(String, index=True)
+    inputs = Column(Text)  # JSON, secrets redacted
+    status = Column(String, index=True)  # "queued", "running", "succeeded", "failed", "cancelled"
+    result = Column(Text)  # JSON result of a succeeded job
+    error = Column(Text)
+    status_code = Column(Integer)
+    owner = Column(String)  # "host:pid" of the worker process running it
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime, index=True)
+
+class Execution(Base):
+    """One function call: when it ran, how long it took and how it ended"""
+    __tablename__ = "executions"
+    __table_args__ = (
+        # Recent calls and per-function windows are range scans on these
+        Index("ix_executions_function_started", "function_name", "started_at"),
+        Index("ix_executions_started", "started_at"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    function_id = Column(Integer)
+    function_name = Column(String)
+    implementation_type = Column(String)
+    started_at = Column(DateTime)
+    duration_ms = Column(Float)
+    status_code = Column(Integer)
+    error = Column(Text)  # truncated
+    cache = Column(String)  # "HIT", "MISS" or NULL when uncached
+    input_tokens = Column(Integer)
+    output_tokens = Column(Integer)
+    input_hash = Column(String)
+    output_hash = Column(String)
+    input_preview = Column(Text)  # truncated and redacted; NULL unless payloads are logged
+    output_preview = Column(Text)
@@ -1,11 +1,24 @@
-from fastapi import APIRouter, Depends, Form, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Form, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Dict, Any, Optional
+import asyncio
+import datetime
 import json
 
-from database import get_db
-from models import FunctionConfig
-from utils.validation import validate_json_schema
+from database import get_async_db
+from models import FunctionConfig, ConfigChange
+from services.registry import TEMPLATE_KEYS, registry
+from services.engines import engine_cache
+from services.history import execution_log, execution_stats, execution_to_dict, recent_executions, utcnow
+from services.jobs import job_queue
+from services.pipeline import prepare_pipeline_config
+from services.profiler import profiler
+from services.providers.resilience import resilience
+from services.providers.scheduler import scheduler
+from services.singleflight import singleflight
+from utils.validation import validate_json_config, validate_json_schema, validate_template
 
 router = APIRouter(
     prefix="/api/admin",
@@ -13,10 +26,24 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+def validate_templates(config: Dict[str, Any], input_schema: Dict[str, Any]) -> None:
+    """Reject templates that are malformed or reference inputs the schema does not declare"""
+    for key in TEMPLATE_KEYS:
+        if isinstance(config.get(key), str):
+            validate_template(config[key], input_schema, key)
+
+def validate_pipeline(implementation_type: str, config: Dict[str, Any], input_schema: Dict[str, Any]) -> None:
+    """Reject pipelines whose DAG is malformed, cyclic or reads undeclared inputs"""
+    if implementation_type == "pipeline":
+        try:
+            prepare_pipeline_config(config, input_schema)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid pipeline: {str(e)}")
+
 @router.get("/functions")
-async def list_functions(db: Session = Depends(get_db)):
+async def list_functions(db: AsyncSession = Depends(get_async_db)):
     """List all function configurations"""
-    functions = db.query(FunctionConfig).all()
+    functions = (await db.scalars(select(FunctionConfig))).all()
     return [
         {
             "id": func.id,
@@ -31,9 +58,9 @@ async def list_functions(db: Session = Depends(get_db)):
     ]
 
 @router.get("/functions/{function_id}")
-async def get_function(function_id: int, db: Session = Depends(get_db)):
+async def get_function(function_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get a function configuration by ID"""
-    function = db.query(FunctionConfig).filter(FunctionConfig.id == function_id).first()
+    function = await db.get(FunctionConfig, function_id)
     if not function:
         raise HTTPException(status_code=404, detail="Function not found")
     
@@ -57,16 +84,18 @@ async def create_function(
     implementation_type: str = Form(...),
     implementation_config: str = Form(...),
     is_active: bool = Form(True),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new function configuration"""
     try:
-        # Validate JSON schemas
-        validate_json_schema(input_schema)
-        validate_json_schema(implementation_config)
+        # Validate the input schema and config
+        schema = validate_json_schema(input_schema)
+        config = validate_json_config(implementation_config)
+        validate_templates(config, schema)
+        validate_pipeline(implementation_type, config, schema)
         
         # Check for existing function with same name
-        existing = db.query(FunctionConfig).filter(FunctionConfig.name == name).first()
+        existing = await db.scalar(select(FunctionConfig).where(FunctionConfig.name == name))
         if existing:
             raise HTTPException(status_code=400, detail=f"Function with name '{name}' already exists")
         
@@ -80,9 +109,12 @@ async def create_function(
             is_active=is_active
         )
         
+        change = ConfigChange(function_name=name)
         db.add(function)
-        db.commit()
-        db.refresh(function)
+        db.add(change)
+        await db.commit()
+        await db.refresh(function)
+        await asyncio.to_thread(registry.refresh, function, [change.id])
         
         return {"success": True, "function_id": function.id}
     except HTTPException:
@@ -99,25 +131,33 @@ async def update_function(
     implementation_type: str = Form(...),
     implementation_config: str = Form(...),
     is_active: bool = Form(True),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update an existing function configuration"""
     try:
-        # Validate JSON schemas
-        validate_json_schema(input_schema)
-        validate_json_schema(implementation_config)
+        # Validate the input schema and config
+        schema = validate_json_schema(input_schema)
+        config = validate_json_config(implementation_config)
+        validate_templates(config, schema)
+        validate_pipeline(implementation_type, config, schema)
         
         # Get existing function
-        function = db.query(FunctionConfig).filter(FunctionConfig.id == function_id).first()
+        function = await db.get(FunctionConfig, function_id)
         if not function:
             raise HTTPException(status_code=404, detail="Function not found")
         
         # Check for name conflict if name is changed
         if function.name != name:
-            existing = db.query(FunctionConfig).filter(FunctionConfig.name == name).first()
+            existing = await db.scalar(select(FunctionConfig).where(FunctionConfig.name == name))
             if existing:
                 raise HTTPException(status_code=400, detail=f"Function with name '{name}' already exists")
         
+        # Record the change under both names so other workers drop a renamed entry
+        changes = [ConfigChange(function_name=name)]
+        if function.name != name:
+            changes.append(ConfigChange(function_name=function.name))
+        db.add_all(changes)
+        
         # Update fields
         function.name = name
         function.description = description
@@ -126,7 +166,8 @@ async def update_function(
         function.implementation_config = implementation_config
         function.is_active = is_active
         
-        db.commit()
+        await db.commit()
+        await asyncio.to_thread(registry.refresh, function, [change.id for change in changes])
         
         return {"success": True, "function_id": function.id}
     except HTTPException:
@@ -135,13 +176,80 @@ async def update_function(
         return {"success": False, "error": str(e)}
 
 @router.delete("/functions/{function_id}")
-async def delete_function(function_id: int, db: Session = Depends(get_db)):
+async def delete_function(function_id: int, db: AsyncSession = Depends(get_async_db)):
     """Delete a function configuration"""
-    function = db.query(FunctionConfig).filter(FunctionConfig.id == function_id).first()
+    function = await db.get(FunctionConfig, function_id)
     if not function:
         raise HTTPException(status_code=404, detail="Function not found")
     
-    db.delete(function)
-    db.commit()
+    name = function.name
+    change = ConfigChange(function_name=name)
+    await db.delete(function)
+    db.add(change)
+    await db.commit()
+    await asyncio.to_thread(registry.invalidate, name, [change.id])
     
-    return {"success": True}
\ No newline at end of file
+    return {"success": True}
+
+@router.get("/engines")
+async def list_engines():
+    """Connection pool statistics for database_query engines"""
+    return engine_cache.stats()
+
+
+@router.get("/coalescing")
+async def coalescing_stats():
+    """Per-function counts of executed and coalesced (deduplicated) calls"""
+    return singleflight.stats()
+
+@router.get("/scheduler")
+async def scheduler_stats():
+    """Active, queued and rejected provider calls per provider and function"""
+    return scheduler.stats()
+
+@router.get("/resilience")
+async def resilience_stats():
+    """Retry and hedge counts, and the circuit breaker state of each provider"""
+    return resilience.stats()
+
+@router.get("/jobs")
+async def job_stats():
+    """Background job workers, and the jobs queued and running in this process"""
+    return job_queue.stats()
+
+@router.get("/executions")
+async def list_executions(
+    function: Optional[str] = None,
+    errors: bool = False,
+    min_duration_ms: Optional[float] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Most recent calls, optionally only one function's, failed ones or slow ones"""
+    executions = await recent_executions(db, function, errors, min_duration_ms, limit)
+    return [execution_to_dict(execution) for execution in executions]
+
+@router.get("/executions/stats")
+async def get_execution_stats(
+    function: Optional[str] = None,
+    window_minutes: float = Query(60, gt=0),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Per-function calls, error rate and p50/p95/p99 latency over the last `window_minutes`, slowest first"""
+    since = utcnow() - datetime.timedelta(minutes=window_minutes)
+    return {"window_minutes": window_minutes, "history": execution_log.stats(), "functions": await execution_stats(db, since, function)}
+
+@router.get("/profiles")
+async def list_profiles():
+    """Recent calls slower than PROFILE_SLOW_CALLS_MS, newest first"""
+    return {"enabled": profiler.enabled, "threshold_ms": profiler.threshold * 1000, "profiles": profiler.list()}
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: int, format: str = "json"):
+    """A slow call's stack profile; format=collapsed returns flame graph input"""
+    profile = profiler.get(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "collapsed":
+        return PlainTextResponse(profiler.collapsed(profile))
+    return profile
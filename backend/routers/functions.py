@@ -1,16 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import Dict, Any
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Dict, Any, List, Optional, Tuple
+from pydantic import BaseModel, Field
+from contextlib import AsyncExitStack, ExitStack, aclosing
+from starlette.concurrency import iterate_in_threadpool
+import asyncio
+import inspect
 import json
+import logging
+import os
+import time
 
-from database import get_db
-from models import FunctionConfig
-from services.providers.anthropic import execute_anthropic_function
-from services.providers.perplexity import execute_perplexity_function
-from services.providers.ollama import execute_ollama_function
-from services.database_query import execute_database_function
-from services.python_code import execute_python_function
+from services.cache import response_cache
+from services.history import execution_log
+from services.metrics import metrics
+from services.profiler import profiler
+from services.tracing import tracer
+from services.providers.resilience import resilience
+from services.providers.scheduler import scheduler
+from services.registry import CompiledFunction, registry
+from services.singleflight import singleflight
+from utils.log import loggable_inputs
+from utils.validation import validate_inputs
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/api/functions",
@@ -18,78 +32,320 @@ router = APIRouter(
     responses={404: {"description": "Function not found"}},
 )
 
+# Largest batch accepted, and the cap on per-batch concurrency
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", "10000"))
+MAX_BATCH_CONCURRENCY = int(os.environ.get("MAX_BATCH_CONCURRENCY", "64"))
+
 # Request model for function execution
 class FunctionExecuteRequest(BaseModel):
     inputs: Dict[str, Any]
 
+# Request model for batch execution: one function, many inputs
+class FunctionBatchRequest(BaseModel):
+    inputs: List[Dict[str, Any]]
+    concurrency: int = Field(8, ge=1, le=MAX_BATCH_CONCURRENCY)
+    stream: bool = False
+
+def get_function_or_404(function_name: str) -> CompiledFunction:
+    # Only active functions are registered
+    function = registry.get(function_name)
+    if not function:
+        error_msg = f"Function '{function_name}' not found or inactive"
+        logger.info(error_msg)
+        raise HTTPException(status_code=404, detail=error_msg)
+    return function
+
+def check_inputs(function: CompiledFunction, inputs: Dict[str, Any], labels: Optional[Dict[str, str]] = None) -> None:
+    """Reject inputs that do not match the function's input schema, before any provider work"""
+    if function.validator is not None:
+        with metrics.stage("validate", labels):
+            validate_inputs(inputs, function.validator)
+
 @router.post("/{function_name}")
 async def execute_function_by_name(
     function_name: str, 
-    request_data: FunctionExecuteRequest,
-    db: Session = Depends(get_db)
+    request_data: FunctionExecuteRequest
 ):
     """Execute a function by its name with the given inputs"""
-    # Enhanced logging
-    print(f"Function call request received: {function_name}")
-    print(f"Request inputs: {request_data.inputs}")
-    
-    # Find the function configuration
-    function = db.query(FunctionConfig).filter(
-        FunctionConfig.name == function_name,
-        FunctionConfig.is_active.is_(True)
-    ).first()
+    # Per-request lines are DEBUG (and sampled); inputs are logged by key unless LOG_INPUTS is set
+    logger.debug("Function call request received: %s, inputs: %s", function_name, loggable_inputs(request_data.inputs))
     
-    if not function:
-        error_msg = f"Function '{function_name}' not found or inactive"
-        print(f"ERROR: {error_msg}")
-        raise HTTPException(status_code=404, detail=error_msg)
+    started = time.perf_counter()
+    with tracer.span("lookup", {"ai_factory.function": function_name}):
+        function = get_function_or_404(function_name)
+    labels = {"function": function.name, "type": function.implementation_type}
+    metrics.observe("ai_factory_stage_seconds", {**labels, "stage": "lookup"}, time.perf_counter() - started)
+    check_inputs(function, request_data.inputs, labels)
     
-    print(f"Found function configuration: {function.name}, type: {function.implementation_type}")
+    # Functions configured with "stream": true return NDJSON rows as they are read
+    if function.result_streamer and not function.error:
+        with ExitStack() as stack:
+            entry = open_call(stack, function, request_data.inputs)
+            rows = function.result_streamer(function.config, request_data.inputs)
+            # From here the response closes the call, once the last row is sent
+            scope = stack.pop_all()
+        return StreamingResponse(ndjson_rows(scope, entry, rows), media_type="application/x-ndjson")
     
     # Execute the function
+    result, cache_status = await execute_function_or_500(function, request_data.inputs)
+    logger.debug("Function executed successfully: %s", function_name)
+    with metrics.stage("serialize", labels):
+        return JSONResponse(
+            jsonable_encoder({"success": True, "result": result}),
+            headers={"X-Cache": cache_status} if cache_status else None,
+        )
+
+async def execute_function_or_500(function: CompiledFunction, inputs: Dict[str, Any]) -> Tuple[Any, Optional[str]]:
+    """execute_function_cached, reporting unexpected errors as a 500 with their message"""
     try:
-        result = await execute_function_impl(function, request_data.inputs)
-        print(f"Function executed successfully")
-        return {"success": True, "result": result}
+        return await execute_function_cached(function, inputs)
+    except HTTPException:
+        # Keep the status chosen by the implementation (400, 504, ...)
+        raise
     except Exception as e:
-        import traceback
         error_msg = f"Function execution error: {str(e)}"
-        print(f"ERROR: {error_msg}")
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.error(error_msg, exc_info=True)
         raise HTTPException(status_code=500, detail=error_msg)
 
-async def execute_function_impl(function: FunctionConfig, inputs: Dict[str, Any]):
-    """Execute a function based on its configuration"""
+def open_call(stack: ExitStack, function: CompiledFunction, inputs: Dict[str, Any]):
+    """Log and count a call whose result is streamed; closing `stack` ends it
+
+    Returns the execution history entry (None when history is off).
+    """
+    entry = stack.enter_context(execution_log.record(function, inputs))
+    call = stack.enter_context(metrics.call(function))
+    if entry is not None:
+        entry.call = call
+    return entry
+
+async def ndjson_rows(scope: ExitStack, entry, rows):
+    """Send rows from a result streamer; a failure after the first byte is sent as an error line"""
+    async def counted():
+        with scope:
+            count = 0
+            async for line in iterate_in_threadpool(rows):
+                count += 1
+                yield line
+            if entry is not None:
+                entry.output = {"rows": count}
+    
     try:
-        config = json.loads(function.implementation_config)
-        print(f"Parsed implementation config for {function.name}")
+        async with aclosing(counted()) as lines:
+            async for line in lines:
+                yield line
+    except HTTPException as e:
+        yield json.dumps({"error": e.detail}) + "\n"
+    except Exception as e:
+        yield json.dumps({"error": f"Function execution error: {str(e)}"}) + "\n"
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@router.post("/{function_name}/stream")
+async def stream_function_by_name(function_name: str, request_data: FunctionExecuteRequest):
+    """Execute a function and stream its output as Server-Sent Events
+
+    LLM-backed functions send a `token` event ({"text": ...}) per chunk as the
+    provider generates it, then `done` ({"result": {"text": ...}}). Other
+    implementation types run normally and send a single `done` event. A failure
+    after the stream has started is sent as an `error` event.
+    """
+    logger.debug("Function stream request received: %s", function_name)
+    
+    function = get_function_or_404(function_name)
+    check_inputs(function, request_data.inputs)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    
+    if not function.token_streamer or function.error:
+        result, _ = await execute_function_or_500(function, request_data.inputs)
+        return StreamingResponse(
+            iter([sse_event("done", {"result": result})]),
+            media_type="text/event-stream",
+            headers=headers,
+        )
+    
+    async def open_stream():
+        # The provider slot is held until the stream ends, not just until it starts
+        stack = AsyncExitStack()
+        try:
+            await stack.enter_async_context(scheduler.slot(function, request_data.inputs))
+            chunks = function.token_streamer(function.config, request_data.inputs)
+            stack.push_async_callback(chunks.aclose)
+            # Wait for the first chunk so request errors still get a real status code
+            try:
+                first = await chunks.__anext__()
+            except StopAsyncIteration:
+                first = None
+            return stack, chunks, first
+        except BaseException:
+            await stack.aclose()
+            raise
+    
+    with ExitStack() as call_stack:
+        entry = open_call(call_stack, function, request_data.inputs)
+        # Failures before the first token are retried; a started stream is not
+        with metrics.stage("first_token"):
+            stack, chunks, first = await resilience.run(function, open_stream, hedge=False)
+        # From here the response closes the call, when the stream ends
+        scope = call_stack.pop_all()
+    
+    async def tokens():
+        # The call's labels and record stay bound, so the provider's token counts land on it
+        with scope:
+            try:
+                text = []
+                if first is not None:
+                    text.append(first)
+                    yield first
+                    async for chunk in chunks:
+                        text.append(chunk)
+                        yield chunk
+                if entry is not None:
+                    entry.output = {"text": "".join(text)}
+            finally:
+                await stack.aclose()
+    
+    async def events():
+        text = []
+        try:
+            async with aclosing(tokens()) as chunks_sent:
+                async for chunk in chunks_sent:
+                    text.append(chunk)
+                    yield sse_event("token", {"text": chunk})
+            yield sse_event("done", {"result": {"text": "".join(text)}})
+        except HTTPException as e:
+            yield sse_event("error", {"error": e.detail, "status_code": e.status_code})
+        except Exception as e:
+            yield sse_event("error", {"error": f"Function execution error: {str(e)}", "status_code": 500})
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+@router.post("/{function_name}/batch")
+async def execute_function_batch(function_name: str, request_data: FunctionBatchRequest):
+    """Execute one function over many inputs; results keep the order of the inputs"""
+    function = get_function_or_404(function_name)
+    items = request_data.inputs
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch too large: {len(items)} items (max {MAX_BATCH_SIZE})")
+    
+    logger.debug("Batch call request received: %s, %d items", function_name, len(items))
+    
+    # Items failing the input schema are reported per item and never executed
+    invalid: Dict[int, Dict[str, Any]] = {}
+    for i, inputs in enumerate(items):
+        try:
+            check_inputs(function, inputs)
+        except HTTPException as e:
+            invalid[i] = {"success": False, "error": e.detail, "status_code": e.status_code}
+    
+    # Some implementations run a whole batch in one round trip (e.g. executemany)
+    if function.batch_handler and not function.error and not invalid:
+        started = time.perf_counter()
+        results = await asyncio.to_thread(function.batch_handler, function.config, items)
+        if results is not None:
+            # One round trip ran every item: each is counted and logged as a call
+            duration = time.perf_counter() - started
+            metrics.batch(function, duration, [200 if r["success"] else r.get("status_code") or 500 for r in results])
+            execution_log.record_batch(function, items, results, duration)
+            if request_data.stream:
+                lines = (json.dumps({"index": i, **r}, default=str) + "\n" for i, r in enumerate(results))
+                return StreamingResponse(lines, media_type="application/x-ndjson")
+            return {"success": True, "results": results}
+    
+    semaphore = asyncio.Semaphore(request_data.concurrency)
+    
+    async def run_item(inputs: Dict[str, Any]) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                result, _ = await execute_function_cached(function, inputs)
+                return {"success": True, "result": result}
+            except HTTPException as e:
+                return {"success": False, "error": e.detail, "status_code": e.status_code}
+            except Exception as e:
+                return {"success": False, "error": f"Function execution error: {str(e)}", "status_code": 500}
+    
+    async def rejected(i: int) -> Dict[str, Any]:
+        return invalid[i]
+    
+    tasks = [asyncio.ensure_future(rejected(i) if i in invalid else run_item(inputs)) for i, inputs in enumerate(items)]
+    
+    if not request_data.stream:
+        return {"success": True, "results": await asyncio.gather(*tasks)}
+    
+    async def lines():
+        # Emit each item as soon as it and everything before it has finished
+        try:
+            for i, task in enumerate(tasks):
+                yield json.dumps({"index": i, **(await task)}, default=str) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+async def execute_function_cached(function: CompiledFunction, inputs: Dict[str, Any]) -> Tuple[Any, Optional[str]]:
+    """Execute through the function's response cache and single-flight group
+
+    Returns the result and the cache status ("HIT", "MISS" or None when uncached).
+    Identical concurrent calls of a coalescing function share one execution.
+    """
+    with execution_log.record(function, inputs) as entry, metrics.call(function) as call, profiler.profile(function):
+        if entry is not None:
+            entry.call = call
+        result, cache_status = await _execute_cached(function, inputs)
+        if entry is not None:
+            entry.output, entry.cache = result, cache_status
+        return result, cache_status
+
+async def _execute_cached(function: CompiledFunction, inputs: Dict[str, Any]) -> Tuple[Any, Optional[str]]:
+    cache = function.cache_settings if not function.error else None
+    # The same key identifies the call for caching and coalescing
+    key = response_cache.key(function, inputs)
+    
+    if cache:
+        with metrics.stage("cache"):
+            hit, result = await response_cache.get(function, cache, key)
+        if hit:
+            return result, "HIT"
+    
+    async def execute():
+        result = await execute_function_impl(function, inputs)
+        if cache:
+            await response_cache.set(function, cache, key, result)
+        return result
+    
+    if function.coalesce:
+        result = await singleflight.do(function.name, key, execute)
+    else:
+        result = await execute()
+    return result, "MISS" if cache else None
+
+async def execute_function_impl(function: CompiledFunction, inputs: Dict[str, Any]):
+    """Execute a function based on its compiled configuration"""
+    try:
+        if function.error:
+            raise ValueError(function.error)
+        if function.handler is None:
+            raise ValueError(f"Unknown implementation type: {function.implementation_type}")
+
+        logger.debug("Executing %s function implementation", function.implementation_type)
+        async def attempt():
+            # Provider calls wait for a concurrency slot and their rate limits
+            async with scheduler.slot(function, inputs):
+                with metrics.stage("handler"):
+                    if function.blocking:
+                        result = await asyncio.to_thread(function.handler, function.config, inputs)
+                    else:
+                        result = function.handler(function.config, inputs)
+                    if inspect.isawaitable(result):
+                        result = await result
+            return result
         
-        if function.implementation_type == "anthropic":
-            print(f"Executing Anthropic/Claude function implementation")
-            return await execute_anthropic_function(config, inputs)
-        elif function.implementation_type == "perplexity":
-            print(f"Executing Perplexity function implementation")
-            return await execute_perplexity_function(config, inputs)
-        elif function.implementation_type == "ollama":
-            print(f"Executing Ollama function implementation")
-            return await execute_ollama_function(config, inputs)
-        elif function.implementation_type == "database_query":
-            print(f"Executing database query implementation")
-            return execute_database_function(config, inputs)
-        elif function.implementation_type == "python_code":
-            print(f"Executing Python code implementation")
-            return execute_python_function(config, inputs)
-        else:
-            error_msg = f"Unknown implementation type: {function.implementation_type}"
-            print(f"ERROR: {error_msg}")
-            raise ValueError(error_msg)
-    except json.JSONDecodeError as e:
-        error_msg = f"Invalid JSON in function implementation config: {str(e)}"
-        print(f"ERROR: {error_msg}")
-        raise ValueError(error_msg)
+        # Provider calls are retried, hedged and circuit-broken per their config
+        with metrics.stage("execute"):
+            return await resilience.run(function, attempt)
     except Exception as e:
-        error_msg = f"Error executing function implementation: {str(e)}"
-        print(f"ERROR: {error_msg}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
-        raise
\ No newline at end of file
+        # Callers decide how to report it; the traceback is only worth it at DEBUG
+        logger.debug("Error executing function implementation: %s", e, exc_info=True)
+        raise
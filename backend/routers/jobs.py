@@ -0,0 +1,70 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+from typing import Dict, Any, Optional
+from pydantic import BaseModel
+import logging
+
+from routers.functions import check_inputs, get_function_or_404
+from services.jobs import FINISHED, JOB_MAX_WAIT, job_queue, job_to_dict
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/api/jobs",
+    tags=["jobs"],
+    responses={404: {"description": "Job not found"}},
+)
+
+# Request model for job submission
+class JobSubmitRequest(BaseModel):
+    function: str
+    inputs: Dict[str, Any]
+
+@router.post("", status_code=202)
+async def submit_job(request_data: JobSubmitRequest):
+    """Queue a function call and return its job id immediately
+
+    Inputs are validated now, so a bad call fails here rather than as a job.
+    """
+    function = get_function_or_404(request_data.function)
+    check_inputs(function, request_data.inputs)
+    job = await job_queue.submit(function, request_data.inputs)
+    logger.debug("Job %s queued for %s", job.id, function.name)
+    return JSONResponse(
+        jsonable_encoder(job_to_dict(job)),
+        status_code=202,
+        headers={"Location": f"{router.prefix}/{job.id}"},
+    )
+
+@router.get("")
+async def list_jobs(
+    function: Optional[str] = None,
+    status: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Most recent jobs, optionally filtered by function and status"""
+    return [job_to_dict(job) for job in await job_queue.list(function, status, limit)]
+
+@router.get("/{job_id}")
+async def get_job(job_id: str, wait: float = Query(0, ge=0, le=JOB_MAX_WAIT)):
+    """Job status and, once finished, its result or error
+
+    With `wait`, the request is held until the job finishes or `wait` seconds
+    pass (long-polling), so clients need not poll in a tight loop.
+    """
+    job = await job_queue.get(job_id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_to_dict(job)
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job; the job's final state is returned"""
+    job = await job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status not in FINISHED:
+        # Running in another worker process, which cannot be interrupted from here
+        raise HTTPException(status_code=409, detail=f"Job is {job.status} in another worker and cannot be cancelled")
+    return job_to_dict(job)
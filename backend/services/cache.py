@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+# Default location of the on-disk backend, next to the config database
+RESPONSE_CACHE_PATH = os.environ.get(
+    "RESPONSE_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "response_cache.db"),
+)
+
+DEFAULT_TTL = 300.0
+DEFAULT_MAX_ENTRIES = 1000
+
+_MISSING = object()
+
+def canonical_hash(value: Any) -> str:
+    """Stable hash of a JSON-like value, independent of dict key order"""
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+class MemoryCacheBackend:
+    """In-process LRU with per-entry expiry"""
+
+    blocking = False
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, function_name: str, key: str, value: Any, ttl: float, max_entries: int) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+class SQLiteCacheBackend:
+    """On-disk cache shared by all workers and surviving restarts
+
+    Entries are bounded per function by evicting the least recently read rows.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                " key TEXT PRIMARY KEY, function_name TEXT NOT NULL, value TEXT NOT NULL,"
+                " expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS ix_response_cache_function"
+                " ON response_cache (function_name, last_access)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets workers read while another writes
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Any:
+        connection = self._connect()
+        row = connection.execute(
+            "SELECT value, expires_at FROM response_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return _MISSING
+        now = time.time()
+        if row[1] < now:
+            connection.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+            return _MISSING
+        connection.execute("UPDATE response_cache SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, function_name: str, key: str, value: Any, ttl: float, max_entries: int) -> None:
+        try:
+            payload = json.dumps(value)
+        except (TypeError, ValueError):
+            # Only JSON results can be stored on disk
+            return
+        now = time.time()
+        connection = self._connect()
+        connection.execute(
+            "INSERT OR REPLACE INTO response_cache (key, function_name, value, expires_at, last_access)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (key, function_name, payload, now + ttl, now),
+        )
+        connection.execute(
+            "DELETE FROM response_cache WHERE function_name = ? AND (expires_at < ? OR key IN ("
+            " SELECT key FROM response_cache WHERE function_name = ?"
+            " ORDER BY last_access DESC LIMIT -1 OFFSET ?))",
+            (function_name, now, function_name, max_entries),
+        )
+
+class CacheSettings:
+    """Parsed "cache" section of an implementation_config"""
+
+    __slots__ = ("ttl", "max_entries", "backend")
+
+    def __init__(self, config: Dict[str, Any]):
+        self.ttl = float(config.get("ttl", DEFAULT_TTL))
+        self.max_entries = int(config.get("max_entries", DEFAULT_MAX_ENTRIES))
+        self.backend = config.get("backend", "memory")
+        if self.backend not in ("memory", "sqlite"):
+            raise ValueError(f"Unknown cache backend: {self.backend}")
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional["CacheSettings"]:
+        cache = config.get("cache")
+        if not cache:
+            return None
+        return cls(cache if isinstance(cache, dict) else {})
+
+class ResponseCache:
+    """Opt-in result cache for deterministic functions
+
+    Enabled per function with implementation_config
+        "cache": {"ttl": 300, "max_entries": 1000, "backend": "memory" | "sqlite"}
+    Keys combine the function name, its config hash and a canonical hash of the
+    inputs, so editing a function never serves results of the old config.
+    """
+
+    def __init__(self, path: str = RESPONSE_CACHE_PATH):
+        self.path = path
+        self._memory: Dict[str, MemoryCacheBackend] = {}
+        self._sqlite: Optional[SQLiteCacheBackend] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(function, inputs: Dict[str, Any]) -> str:
+        return f"{function.name}:{function.config_hash}:{canonical_hash(inputs)}"
+
+    def _backend(self, function, settings: CacheSettings):
+        if settings.backend == "sqlite":
+            if self._sqlite is None:
+                with self._lock:
+                    if self._sqlite is None:
+                        self._sqlite = SQLiteCacheBackend(self.path)
+            return self._sqlite
+        backend = self._memory.get(function.name)
+        if backend is None or backend.max_entries != settings.max_entries:
+            with self._lock:
+                backend = self._memory[function.name] = MemoryCacheBackend(settings.max_entries)
+        return backend
+
+    async def get(self, function, settings: CacheSettings, key: str) -> Tuple[bool, Any]:
+        backend = self._backend(function, settings)
+        if backend.blocking:
+            value = await asyncio.to_thread(backend.get, key)
+        else:
+            value = backend.get(key)
+        if value is _MISSING:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        return True, value
+
+    async def set(self, function, settings: CacheSettings, key: str, value: Any) -> None:
+        backend = self._backend(function, settings)
+        args = (function.name, key, value, settings.ttl, settings.max_entries)
+        if backend.blocking:
+            await asyncio.to_thread(backend.set, *args)
+        else:
+            backend.set(*args)
+
+response_cache = ResponseCache()
@@ -1,7 +1,220 @@
-from typing import Dict, Any
+import base64
+import json
+import logging
+import re
+import string
+from contextlib import nullcontext
+from functools import lru_cache
+from typing import Dict, Any, Iterator, List, Optional, Tuple
 from fastapi import HTTPException
-from sqlalchemy import create_engine, text
-from utils.validation import format_template
+from sqlalchemy import Boolean, Float, Integer, String, bindparam, text
+from sqlalchemy.sql.elements import BindParameter, TextClause
+from services.engines import engine_cache, pool_options
+from services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# JSON Schema type -> SQLAlchemy type used for the bound parameter
+PARAMETER_TYPES = {
+    "string": String,
+    "integer": Integer,
+    "number": Float,
+    "boolean": Boolean,
+}
+
+# Leading SQL keywords of statements that can run as a single executemany
+_EXECUTEMANY_KEYWORDS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+# Input name carrying the opaque token returned as next_page_token
+PAGE_TOKEN_INPUT = "page_token"
+
+# Rows fetched per round trip from a server-side cursor when streaming
+DEFAULT_YIELD_PER = 1000
+
+_formatter = string.Formatter()
+
+# String literals, quoted names, comments, parentheses, and runs of anything else
+_SQL_TOKENS = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|--[^\n]*|/\*.*?\*/|[()]|[^'\"()/-]+|.", re.DOTALL)
+_ORDER_BY = re.compile(r"\bORDER\s+BY\b", re.IGNORECASE)
+_ROW_LIMIT = re.compile(r"\b(?:LIMIT|OFFSET|FETCH)\b", re.IGNORECASE)
+
+def _top_level(sql: str) -> str:
+    """The SQL outside parentheses, literals and comments, so subqueries and window clauses are skipped"""
+    depth = 0
+    parts = []
+    for token in _SQL_TOKENS.findall(sql):
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth = max(0, depth - 1)
+        elif depth == 0 and not token.startswith(("'", '"', "--", "/*")):
+            parts.append(token)
+            continue
+        parts.append(" ")
+    return "".join(parts)
+
+class CompiledQuery:
+    """A query template turned into a bound-parameter text() statement"""
+
+    __slots__ = ("sql", "statement", "parameters", "_bindparams", "_paged")
+
+    def __init__(self, sql: str, bindparams: List[BindParameter], parameters: Tuple[str, ...]):
+        self.sql = sql
+        self.statement = text(sql).bindparams(*bindparams)
+        self.parameters = parameters
+        self._bindparams = bindparams
+        self._paged: Optional[TextClause] = None
+
+    @property
+    def paged(self) -> TextClause:
+        """The statement with LIMIT/OFFSET appended, for page-token pagination
+
+        Offsets only walk a result consistently when its order is fixed, so the
+        query must end in an ORDER BY (on a unique key, e.g. `ORDER BY created_at, id`)
+        and leave the row window to the page size; otherwise ValueError.
+        """
+        if self._paged is None:
+            inner = self.sql.rstrip().rstrip(";")
+            top_level = _top_level(inner)
+            if not _ORDER_BY.search(top_level):
+                raise ValueError("page_size requires the query to end in an ORDER BY on a unique key")
+            if _ROW_LIMIT.search(top_level[_ORDER_BY.search(top_level).end():]):
+                raise ValueError("page_size cannot be combined with the query's own LIMIT/OFFSET; use max_rows")
+            self._paged = text(
+                f"{inner} LIMIT :_page_limit OFFSET :_page_offset"
+            ).bindparams(*self._bindparams)
+        return self._paged
+
+    def bind(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Pick the statement's parameter values out of the inputs"""
+        missing = [name for name in self.parameters if name not in inputs]
+        if missing:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Missing required input: {missing[0]!r}. Available inputs: {list(inputs.keys())}"
+            )
+        return {name: inputs[name] for name in self.parameters}
+
+@lru_cache(maxsize=512)
+def compile_query(query_template: str, parameter_types: Tuple[Tuple[str, str], ...] = ()) -> CompiledQuery:
+    """Compile a `{field}` query template into a statement with typed bind parameters
+
+    Each `{field}` becomes `:field`. A placeholder that is the whole of a quoted
+    SQL literal (`'{field}'`) has its quotes dropped, since the bound value is
+    already a string. Placeholders cannot be used for identifiers or inside a
+    longer literal; build those in SQL instead (e.g. `'%' || :term || '%'`).
+    """
+    types = dict(parameter_types)
+    segments = list(_formatter.parse(query_template))
+    sql = []
+    parameters = []
+    quotes = 0
+    strip_quote = False
+    for i, (literal, field_name, format_spec, conversion) in enumerate(segments):
+        if strip_quote:
+            literal = literal[1:]
+            strip_quote = False
+        quotes += literal.count("'")
+        if field_name is None:
+            sql.append(literal)
+            continue
+        if not field_name.isidentifier() or format_spec or conversion:
+            raise ValueError(f"Query placeholder '{{{field_name}}}' must be a plain input name")
+
+        # An odd number of quotes so far means the placeholder sits inside a literal
+        if quotes % 2 == 1:
+            following = segments[i + 1][0] if i + 1 < len(segments) else ""
+            if not (literal.endswith("'") and following.startswith("'")):
+                raise ValueError(
+                    f"Query placeholder '{{{field_name}}}' is inside a quoted string; "
+                    "it can only stand for a whole value"
+                )
+            literal = literal[:-1]
+            quotes -= 1
+            strip_quote = True
+
+        sql.append(literal)
+        sql.append(f":{field_name}")
+        if field_name not in parameters:
+            parameters.append(field_name)
+
+    params = []
+    for name in parameters:
+        sql_type = PARAMETER_TYPES.get(types.get(name))
+        params.append(bindparam(name, type_=sql_type()) if sql_type else bindparam(name))
+    return CompiledQuery("".join(sql), params, tuple(parameters))
+
+def schema_parameter_types(input_schema: Dict[str, Any]) -> Dict[str, str]:
+    """JSON Schema property types, used to type the query's bind parameters"""
+    properties = input_schema.get("properties") or {}
+    return {
+        name: prop["type"]
+        for name, prop in properties.items()
+        if isinstance(prop, dict) and isinstance(prop.get("type"), str)
+    }
+
+def prepare_database_config(config: Dict[str, Any], input_schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Resolve parameter types and compile the query once when a function is loaded"""
+    parameter_types = config.get("parameter_types") or schema_parameter_types(input_schema)
+    config = {**config, "parameter_types": parameter_types}
+    query = compile_query(config.get("query_template", ""), tuple(sorted(parameter_types.items())))
+    if config.get("page_size"):
+        # Checked at load, so an unordered paged query fails as a config error
+        query.paged
+    return config
+
+def encode_page_token(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode()).decode()
+
+def decode_page_token(token: str) -> int:
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(token.encode()))["offset"]
+        if not isinstance(offset, int) or offset < 0:
+            raise ValueError(offset)
+        return offset
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid page_token")
+
+class _QueryPlan:
+    """Statement, parameters and row window for one call"""
+
+    __slots__ = ("statement", "params", "limit", "offset", "paged")
+
+    def __init__(self, config: Dict[str, Any], inputs: Dict[str, Any]):
+        parameter_types = tuple(sorted((config.get("parameter_types") or {}).items()))
+        query = compile_query(config.get("query_template", ""), parameter_types)
+        self.params = query.bind(inputs)
+        self.statement = query.statement
+
+        page_size = config.get("page_size")
+        max_rows = config.get("max_rows")
+        self.paged = bool(page_size)
+        self.offset = 0
+        # Row cap for this call; page_size and max_rows both bound it
+        caps = [int(n) for n in (page_size, max_rows) if n]
+        self.limit: Optional[int] = min(caps) if caps else None
+
+        if self.paged:
+            token = inputs.get(PAGE_TOKEN_INPUT)
+            self.offset = decode_page_token(token) if token else 0
+            try:
+                self.statement = query.paged
+            except ValueError as e:
+                raise HTTPException(status_code=500, detail=f"Invalid database_query config: {str(e)}")
+            # Fetch one extra row to learn whether another page exists
+            self.params = {**self.params, "_page_limit": self.limit + 1, "_page_offset": self.offset}
+
+    def continuation(self, rows_returned: int) -> Dict[str, Any]:
+        """Marker fields for a result that stopped at the row cap"""
+        if self.paged:
+            return {"next_page_token": encode_page_token(self.offset + rows_returned)}
+        return {"truncated": True}
+
+def _query_span(engine, statement, **attributes):
+    # The SQL text is only rendered when tracing is on
+    if not tracer.enabled:
+        return nullcontext()
+    return tracer.span("db.query", {"db.system": engine.dialect.name, "db.statement": str(statement)[:1000], **attributes})
 
 def execute_database_function(config: Dict[str, Any], inputs: Dict[str, Any]) -> Dict[str, Any]:
     """Execute a database query function with the given inputs"""
@@ -9,23 +222,101 @@ def execute_database_function(config: Dict[str, Any], inputs: Dict[str, Any]) ->
         # Get the connection string from config
         connection_string = config.get("connection_string", "sqlite:///./ai_factory.db")
         
-        # Get the query template and format it with inputs
-        query_template = config.get("query_template", "")
-        formatted_query = format_template(query_template, inputs)
+        # Look up the compiled statement; inputs are bound, never spliced into the SQL
+        plan = _QueryPlan(config, inputs)
         
-        print(f"Executing database query: {formatted_query[:200]}...")
+        logger.debug("Executing database query: %.200s", plan.statement)
         
-        # Execute the query (with care for SQL injection protection)
-        engine = create_engine(connection_string)
-        with engine.connect() as connection:
-            result = connection.execute(text(formatted_query))
+        # Reuse the cached engine so calls share a warm connection pool
+        engine = engine_cache.get(connection_string, pool_options(config))
+        with _query_span(engine, plan.statement), engine.connect() as connection:
+            if plan.limit is not None:
+                # Only the capped rows should leave the database
+                connection = connection.execution_options(stream_results=True)
+            result = connection.execute(plan.statement, plan.params)
             if result.returns_rows:
-                rows = [dict(row) for row in result]
+                if plan.limit is None:
+                    return {"results": [dict(row._mapping) for row in result]}
+                rows = [dict(row._mapping) for row in result.fetchmany(plan.limit + 1)]
+                if len(rows) > plan.limit:
+                    return {"results": rows[:plan.limit], **plan.continuation(plan.limit)}
                 return {"results": rows}
+            connection.commit()
             return {"success": True, "affected_rows": result.rowcount}
+    except HTTPException:
+        raise
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Database query error: {str(e)}")
-        print(f"Traceback: {error_details}")
-        raise HTTPException(status_code=500, detail=f"Database query error: {str(e)}")
\ No newline at end of file
+        logger.warning("Database query error: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
+        raise HTTPException(status_code=500, detail=f"Database query error: {str(e)}")
+
+def stream_database_function(config: Dict[str, Any], inputs: Dict[str, Any]) -> Iterator[str]:
+    """Stream query rows as NDJSON from a server-side cursor
+
+    Bad inputs raise before the first byte; a failure while reading raises from
+    the iterator. When the row cap is reached a final line carries
+    `next_page_token` (paged functions) or `truncated`.
+    """
+    connection_string = config.get("connection_string", "sqlite:///./ai_factory.db")
+    plan = _QueryPlan(config, inputs)
+    engine = engine_cache.get(connection_string, pool_options(config))
+    yield_per = int(config.get("yield_per", DEFAULT_YIELD_PER))
+
+    def rows() -> Iterator[str]:
+        try:
+            with _query_span(engine, plan.statement, **{"db.stream": True}), engine.connect() as connection:
+                result = connection.execution_options(
+                    stream_results=True, yield_per=yield_per
+                ).execute(plan.statement, plan.params)
+                count = 0
+                for row in result:
+                    if plan.limit is not None and count == plan.limit:
+                        yield json.dumps(plan.continuation(count)) + "\n"
+                        break
+                    yield json.dumps(dict(row._mapping), default=str) + "\n"
+                    count += 1
+        except Exception as e:
+            # Headers are already sent: the caller reports this in-band
+            logger.warning("Database stream error: %s", e)
+            raise HTTPException(status_code=500, detail=f"Database query error: {str(e)}") from e
+
+    return rows()
+
+def execute_database_batch(config: Dict[str, Any], inputs_list: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+    """Run a batch of writes as one executemany in a single transaction
+
+    Returns one result per input, in order, or None when the statement must run
+    per item (queries that return rows, streaming or paged functions).
+    """
+    parameter_types = tuple(sorted((config.get("parameter_types") or {}).items()))
+    query = compile_query(config.get("query_template", ""), parameter_types)
+    sql = query.sql.lstrip().upper()
+    if (
+        config.get("stream") or config.get("page_size")
+        or not sql.startswith(_EXECUTEMANY_KEYWORDS) or "RETURNING" in sql
+    ):
+        return None
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(inputs_list)
+    batch, positions = [], []
+    for i, inputs in enumerate(inputs_list):
+        try:
+            batch.append(query.bind(inputs))
+            positions.append(i)
+        except HTTPException as e:
+            results[i] = {"success": False, "error": e.detail, "status_code": e.status_code}
+
+    if batch:
+        connection_string = config.get("connection_string", "sqlite:///./ai_factory.db")
+        engine = engine_cache.get(connection_string, pool_options(config))
+        logger.debug("Executing database batch of %d: %.200s", len(batch), query.sql)
+        try:
+            with _query_span(engine, query.statement, **{"db.batch_size": len(batch)}), engine.begin() as connection:
+                connection.execute(query.statement, batch)
+            outcome = {"success": True, "result": {"success": True}}
+        except Exception as e:
+            # The transaction rolled back, so every item in it failed
+            logger.warning("Database batch error: %s", e)
+            outcome = {"success": False, "error": f"Database query error: {str(e)}", "status_code": 500}
+        for i in positions:
+            results[i] = outcome
+    return results
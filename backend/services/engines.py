@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, make_url
+
+logger = logging.getLogger(__name__)
+
+# Seconds an engine may sit unused before its pool is disposed
+ENGINE_IDLE_TIMEOUT = float(os.environ.get("ENGINE_IDLE_TIMEOUT", "600"))
+
+# Pool options a database_query function may set in its implementation_config
+POOL_OPTIONS = {
+    "pool_size": int,
+    "max_overflow": int,
+    "pool_timeout": float,
+    "pool_recycle": int,
+    "pool_pre_ping": bool,
+}
+
+EngineKey = Tuple[str, Tuple[Tuple[str, Any], ...]]
+
+def pool_options(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Extract pool settings from a function config, from "pool" or the top level"""
+    source = config.get("pool") or config
+    return {name: cast(source[name]) for name, cast in POOL_OPTIONS.items() if name in source}
+
+def _is_memory_sqlite(connection_string: str) -> bool:
+    url = make_url(connection_string)
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+class _CachedEngine:
+    __slots__ = ("engine", "last_used", "options")
+
+    def __init__(self, engine: Engine, options: Dict[str, Any]):
+        self.engine = engine
+        self.options = options
+        self.last_used = time.monotonic()
+
+class EngineCache:
+    """Engines (and their connection pools) shared by every call with the same settings"""
+
+    def __init__(self, idle_timeout: float = ENGINE_IDLE_TIMEOUT):
+        self.idle_timeout = idle_timeout
+        self._engines: Dict[EngineKey, _CachedEngine] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._engines)
+
+    def get(self, connection_string: str, options: Optional[Dict[str, Any]] = None) -> Engine:
+        """Return the warm engine for this connection string, creating it once"""
+        options = dict(options or {})
+        key = (connection_string, tuple(sorted(options.items())))
+        with self._lock:
+            cached = self._engines.get(key)
+            if cached is None:
+                kwargs = options
+                if _is_memory_sqlite(connection_string):
+                    # SingletonThreadPool has no overflow/timeout/pre-ping settings
+                    kwargs = {k: v for k, v in options.items() if k == "pool_size"}
+                cached = _CachedEngine(create_engine(connection_string, **kwargs), options)
+                self._engines[key] = cached
+            cached.last_used = time.monotonic()
+            return cached.engine
+
+    def evict_idle(self) -> int:
+        """Dispose engines that have not been used within the idle timeout"""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle = [key for key, cached in self._engines.items() if cached.last_used < cutoff]
+            engines = [self._engines.pop(key).engine for key in idle]
+        for engine in engines:
+            engine.dispose()
+        return len(engines)
+
+    def dispose_all(self) -> None:
+        with self._lock:
+            engines = [cached.engine for cached in self._engines.values()]
+            self._engines = {}
+        for engine in engines:
+            engine.dispose()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-engine pool statistics, with credentials masked"""
+        now = time.monotonic()
+        with self._lock:
+            items = list(self._engines.values())
+        stats = []
+        for cached in items:
+            pool = cached.engine.pool
+            entry = {
+                "url": cached.engine.url.render_as_string(hide_password=True),
+                "options": cached.options,
+                "pool": type(pool).__name__,
+                "status": pool.status(),
+                "idle_seconds": round(now - cached.last_used, 1),
+            }
+            # QueuePool exposes live counters; other pool classes do not
+            for counter in ("size", "checkedin", "checkedout", "overflow"):
+                method = getattr(pool, counter, None)
+                if callable(method):
+                    entry[counter] = method()
+            stats.append(entry)
+        return stats
+
+engine_cache = EngineCache()
+
+async def evict_idle_engines(interval: float = 60.0):
+    """Background task disposing engines nobody has used for a while"""
+    while True:
+        await asyncio.sleep(interval)
+        evicted = engine_cache.evict_idle()
+        if evicted:
+            logger.info("Disposed %d idle database engine(s)", evicted)
@@ -0,0 +1,271 @@
+import asyncio
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, Deque, Iterator, List, Optional
+
+from sqlalchemy import case, delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from models import Execution
+from services.metrics import CallRecord
+from utils.log import redact
+
+logger = logging.getLogger(__name__)
+
+# Record every function call in the executions table (0: off)
+EXECUTION_LOG = os.environ.get("EXECUTION_LOG", "1") != "0"
+# Seconds between batched writes, and the most rows written per batch
+EXECUTION_LOG_FLUSH_INTERVAL = float(os.environ.get("EXECUTION_LOG_FLUSH_INTERVAL", "1.0"))
+EXECUTION_LOG_BATCH_SIZE = int(os.environ.get("EXECUTION_LOG_BATCH_SIZE", "1000"))
+# Calls held in memory awaiting a write; the oldest are dropped beyond this
+EXECUTION_LOG_BUFFER_SIZE = int(os.environ.get("EXECUTION_LOG_BUFFER_SIZE", "100000"))
+# Characters of redacted input/output JSON kept per call (0: hashes only)
+EXECUTION_LOG_PAYLOAD_CHARS = int(os.environ.get("EXECUTION_LOG_PAYLOAD_CHARS", "0"))
+# Days of history kept
+EXECUTION_LOG_RETENTION_DAYS = float(os.environ.get("EXECUTION_LOG_RETENTION_DAYS", "7"))
+
+# Longest error message stored
+MAX_ERROR_CHARS = 1000
+
+def utcnow() -> datetime.datetime:
+    """The current UTC time, naive like the values stored in the DateTime columns"""
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+class _Entry:
+    __slots__ = ("function", "started_at", "inputs", "output", "cache", "error", "status_code", "call")
+
+    def __init__(self, function, inputs: Dict[str, Any]):
+        self.function = function
+        self.started_at = utcnow()
+        self.inputs = inputs
+        self.output: Any = None
+        self.cache: Optional[str] = None
+        self.error: Optional[str] = None
+        # Overrides the call's status code (items of one batched call)
+        self.status_code: Optional[int] = None
+        self.call: Optional[CallRecord] = None
+
+def _canonical(value: Any) -> str:
+    return json.dumps(redact(value), sort_keys=True, default=str)
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+class ExecutionLog:
+    """Buffers one row per call in memory; flush() writes them in batches
+
+    A call's inputs and output are hashed (and cut to `payload_chars` previews)
+    as soon as it finishes, so a buffered row is small whatever the call
+    returned. The database write happens in flush(), which the background task runs.
+    """
+
+    def __init__(self, enabled: bool = EXECUTION_LOG, payload_chars: int = EXECUTION_LOG_PAYLOAD_CHARS):
+        self.enabled = enabled
+        self.payload_chars = payload_chars
+        self._buffer: Deque[Dict[str, Any]] = deque(maxlen=EXECUTION_LOG_BUFFER_SIZE)
+        self._lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+
+    @contextmanager
+    def record(self, function, inputs: Dict[str, Any]) -> Iterator[Optional[_Entry]]:
+        """Log the call run inside the block; set `.call`, `.output` and `.cache` on the yielded entry"""
+        if not self.enabled:
+            yield None
+            return
+        entry = _Entry(function, inputs)
+        try:
+            yield entry
+        except BaseException as e:
+            entry.error = str(getattr(e, "detail", None) or e) or type(e).__name__
+            raise
+        finally:
+            self._add(entry)
+
+    def record_batch(self, function, items: List[Dict[str, Any]], results: List[Dict[str, Any]], duration: float) -> None:
+        """Log the items of one batched call (executemany), each with its own outcome"""
+        if not self.enabled:
+            return
+        call = CallRecord()
+        call.duration = duration
+        for inputs, result in zip(items, results):
+            entry = _Entry(function, inputs)
+            entry.call = call
+            if result.get("success"):
+                entry.output = result.get("result")
+            else:
+                entry.error = str(result.get("error"))
+                entry.status_code = result.get("status_code") or 500
+            self._add(entry)
+
+    def _add(self, entry: _Entry) -> None:
+        try:
+            row = self._row(entry)
+        except Exception as e:
+            # History must never fail the call it describes
+            logger.debug("Could not record execution of %s: %s", entry.function.name, e)
+            self.dropped += 1
+            return
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append(row)
+
+    def _row(self, entry: _Entry) -> Dict[str, Any]:
+        call = entry.call or CallRecord()
+        inputs = _canonical(entry.inputs)
+        output = _canonical(entry.output) if entry.error is None else None
+        return {
+            "function_id": entry.function.id,
+            "function_name": entry.function.name,
+            "implementation_type": entry.function.implementation_type,
+            "started_at": entry.started_at,
+            "duration_ms": round(call.duration * 1000, 3),
+            "status_code": entry.status_code or call.status_code,
+            "error": entry.error[:MAX_ERROR_CHARS] if entry.error else None,
+            "cache": entry.cache,
+            "input_tokens": call.input_tokens or None,
+            "output_tokens": call.output_tokens or None,
+            "input_hash": _hash(inputs),
+            "output_hash": _hash(output) if output is not None else None,
+            "input_preview": inputs[:self.payload_chars] if self.payload_chars else None,
+            "output_preview": output[:self.payload_chars] if self.payload_chars and output is not None else None,
+        }
+
+    def _take(self, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [self._buffer.popleft() for _ in range(min(limit, len(self._buffer)))]
+
+    async def flush(self, batch_size: int = EXECUTION_LOG_BATCH_SIZE) -> int:
+        """Write every buffered entry, one multi-row insert per batch; returns how many"""
+        total = 0
+        while True:
+            rows = self._take(batch_size)
+            if not rows:
+                return total
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(Execution), rows)
+                await db.commit()
+            total += len(rows)
+            self.written += len(rows)
+
+    async def purge(self, days: float = EXECUTION_LOG_RETENTION_DAYS) -> int:
+        """Delete history older than the retention period"""
+        cutoff = utcnow() - datetime.timedelta(days=days)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(delete(Execution).where(Execution.started_at < cutoff))
+            await db.commit()
+        return result.rowcount or 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "buffered": len(self._buffer), "written": self.written, "dropped": self.dropped}
+
+execution_log = ExecutionLog()
+
+async def flush_executions(interval: float = EXECUTION_LOG_FLUSH_INTERVAL):
+    """Background task writing buffered executions and purging expired ones"""
+    last_purge = 0.0
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await execution_log.flush()
+            if loop.time() - last_purge > 3600:
+                last_purge = loop.time()
+                await execution_log.purge()
+        except Exception as e:
+            logger.warning("Could not write execution history: %s", e)
+
+# Queries behind the admin endpoints
+
+def execution_to_dict(execution: Execution) -> Dict[str, Any]:
+    return {
+        "id": execution.id,
+        "function_id": execution.function_id,
+        "function": execution.function_name,
+        "implementation_type": execution.implementation_type,
+        "started_at": execution.started_at,
+        "duration_ms": execution.duration_ms,
+        "status_code": execution.status_code,
+        "error": execution.error,
+        "cache": execution.cache,
+        "input_tokens": execution.input_tokens,
+        "output_tokens": execution.output_tokens,
+        "input_hash": execution.input_hash,
+        "output_hash": execution.output_hash,
+        "input_preview": execution.input_preview,
+        "output_preview": execution.output_preview,
+    }
+
+async def recent_executions(
+    db: AsyncSession,
+    function_name: Optional[str] = None,
+    errors_only: bool = False,
+    min_duration_ms: Optional[float] = None,
+    limit: int = 100,
+) -> List[Execution]:
+    statement = select(Execution).order_by(Execution.started_at.desc()).limit(limit)
+    if function_name:
+        statement = statement.where(Execution.function_name == function_name)
+    if errors_only:
+        statement = statement.where(Execution.status_code >= 400)
+    if min_duration_ms is not None:
+        statement = statement.where(Execution.duration_ms >= min_duration_ms)
+    return list((await db.scalars(statement)).all())
+
+PERCENTILES = (50, 95, 99)
+
+async def execution_stats(db: AsyncSession, since: datetime.datetime, function_name: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Per-function call counts, error rate, token totals and p50/p95/p99 latency since `since`
+
+    Percentiles are nearest-rank, read with ORDER BY ... OFFSET so only one row
+    per percentile leaves the database (SQLite has no percentile functions).
+    """
+    window = [Execution.started_at >= since]
+    if function_name:
+        window.append(Execution.function_name == function_name)
+    totals = (await db.execute(
+        select(
+            Execution.function_name,
+            func.count(),
+            func.sum(case((Execution.status_code >= 400, 1), else_=0)),
+            func.avg(Execution.duration_ms),
+            func.max(Execution.duration_ms),
+            func.sum(Execution.input_tokens),
+            func.sum(Execution.output_tokens),
+        ).where(*window).group_by(Execution.function_name)
+    )).all()
+
+    stats = []
+    for name, calls, errors, mean, slowest, input_tokens, output_tokens in totals:
+        latency = {}
+        for percentile in PERCENTILES:
+            rank = max(0, -(-calls * percentile // 100) - 1)
+            latency[f"p{percentile}_ms"] = await db.scalar(
+                select(Execution.duration_ms)
+                .where(Execution.started_at >= since, Execution.function_name == name)
+                .order_by(Execution.duration_ms)
+                .offset(rank)
+                .limit(1)
+            )
+        stats.append({
+            "function": name,
+            "calls": calls,
+            "errors": errors or 0,
+            "error_rate": round((errors or 0) / calls, 4),
+            "mean_ms": round(mean, 3) if mean is not None else None,
+            **latency,
+            "max_ms": slowest,
+            "input_tokens": input_tokens or 0,
+            "output_tokens": output_tokens or 0,
+        })
+    # Slowest first, so the functions worth a look lead the list
+    stats.sort(key=lambda row: row["p95_ms"] or 0, reverse=True)
+    return stats
@@ -0,0 +1,259 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import socket
+import uuid
+from typing import Dict, Any, Awaitable, Callable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete, select, update
+
+from database import AsyncSessionLocal
+from models import Job
+from services.metrics import pid_alive
+from utils.log import redact
+
+logger = logging.getLogger(__name__)
+
+# Jobs executed concurrently by this worker process
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "16"))
+# Jobs waiting for a worker; submissions beyond this are rejected with a 503
+JOB_MAX_QUEUE = int(os.environ.get("JOB_MAX_QUEUE", "10000"))
+# Longest a GET may wait for a job to finish (long-polling)
+JOB_MAX_WAIT = float(os.environ.get("JOB_MAX_WAIT", "30"))
+# How often a long-poll re-reads a job that runs in another worker process
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "0.5"))
+# Seconds finished jobs are kept before they are deleted
+JOB_RESULT_TTL = float(os.environ.get("JOB_RESULT_TTL", str(24 * 3600)))
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+# Identifies this worker process in Job.owner
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+Executor = Callable[[Any, Dict[str, Any]], Awaitable[Tuple[Any, Optional[str]]]]
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.utcnow()
+
+def job_to_dict(job: Job) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "function": job.function_name,
+        "status": job.status,
+        "result": json.loads(job.result) if job.result is not None else None,
+        "error": job.error,
+        "status_code": job.status_code,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+class _LocalJob:
+    __slots__ = ("function", "inputs", "task", "cancelled", "done")
+
+    def __init__(self, function, inputs: Dict[str, Any]):
+        self.function = function
+        # Only kept in memory: the persisted copy has secrets (api_key) redacted
+        self.inputs = inputs
+        self.task: Optional[asyncio.Task] = None
+        self.cancelled = False
+        self.done = asyncio.Event()
+
+class JobQueue:
+    """Runs submitted function calls on a bounded pool of worker tasks
+
+    The jobs table is the source of truth for status and results, so any worker
+    process can answer a poll; the inputs and the running task live only in the
+    process that accepted the job.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_queue: int = JOB_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._queue: Optional[asyncio.Queue] = None
+        self._local: Dict[str, _LocalJob] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._execute: Optional[Executor] = None
+
+    async def start(self, execute: Executor) -> None:
+        """Start the worker tasks; `execute(function, inputs)` runs one call"""
+        self._execute = execute
+        self._queue = asyncio.Queue()
+        await self._recover()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweep()))
+
+    async def stop(self) -> None:
+        """Cancel the workers; jobs still queued or running here are marked failed"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._local:
+            await self._finish(list(self._local), FAILED, error="Worker shut down", status_code=503)
+        self._local.clear()
+
+    async def _recover(self) -> None:
+        # Jobs of a process on this host that no longer exists can never finish
+        host = f"{socket.gethostname()}:"
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(
+                select(Job.id, Job.owner).where(Job.status.in_((QUEUED, RUNNING)), Job.owner.startswith(host))
+            )).all()
+        orphans = [job_id for job_id, owner in rows if not pid_alive(int(owner.rsplit(":", 1)[1]))]
+        if orphans:
+            await self._finish(orphans, FAILED, error="Worker exited before the job finished", status_code=503)
+            logger.warning("Marked %d interrupted job(s) as failed", len(orphans))
+
+    async def submit(self, function, inputs: Dict[str, Any]) -> Job:
+        if self._queue is None:
+            raise HTTPException(status_code=503, detail="Job queue is not running")
+        if self._queue.qsize() >= self.max_queue:
+            raise HTTPException(status_code=503, detail="Job queue is full", headers={"Retry-After": "1"})
+        job = Job(
+            id=uuid.uuid4().hex,
+            function_name=function.name,
+            inputs=json.dumps(redact(inputs), default=str),
+            status=QUEUED,
+            owner=OWNER,
+            created_at=_now(),
+        )
+        async with AsyncSessionLocal() as db:
+            db.add(job)
+            await db.commit()
+        self._local[job.id] = _LocalJob(function, inputs)
+        self._queue.put_nowait(job.id)
+        return job
+
+    async def get(self, job_id: str, wait: float = 0) -> Optional[Job]:
+        """Read a job, waiting up to `wait` seconds for it to finish"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + min(wait, JOB_MAX_WAIT)
+        while True:
+            async with AsyncSessionLocal() as db:
+                job = await db.get(Job, job_id)
+            remaining = deadline - loop.time()
+            if job is None or job.status in FINISHED or remaining <= 0:
+                return job
+            local = self._local.get(job_id)
+            if local is not None:
+                try:
+                    await asyncio.wait_for(local.done.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(min(JOB_POLL_INTERVAL, remaining))
+
+    async def list(self, function_name: Optional[str], status: Optional[str], limit: int) -> List[Job]:
+        statement = select(Job).order_by(Job.created_at.desc()).limit(limit)
+        if function_name:
+            statement = statement.where(Job.function_name == function_name)
+        if status:
+            statement = statement.where(Job.status == status)
+        async with AsyncSessionLocal() as db:
+            return list((await db.scalars(statement)).all())
+
+    async def cancel(self, job_id: str) -> Optional[Job]:
+        """Cancel a queued or running job; finished jobs are returned unchanged"""
+        local = self._local.get(job_id)
+        if local is not None:
+            local.cancelled = True
+            if local.task is not None:
+                local.task.cancel()
+            else:
+                # Still queued: the worker that dequeues it skips it
+                await self._finish([job_id], CANCELLED, status_code=499)
+        else:
+            # Owned by another process, which cannot be reached; only a queued job can be stopped
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(Job).where(Job.id == job_id, Job.status == QUEUED)
+                    .values(status=CANCELLED, status_code=499, finished_at=_now())
+                )
+                await db.commit()
+        return await self.get(job_id, wait=1.0 if local is not None else 0)
+
+    async def _finish(self, job_ids: List[str], status: str, result: Any = None,
+                      error: Optional[str] = None, status_code: Optional[int] = None) -> None:
+        values = {"status": status, "error": error, "status_code": status_code, "finished_at": _now()}
+        if status == SUCCEEDED:
+            values["result"] = json.dumps(jsonable_encoder(result), default=str)
+        async with AsyncSessionLocal() as db:
+            # Never overwrite an outcome that was already recorded
+            await db.execute(
+                update(Job).where(Job.id.in_(job_ids), Job.status.in_((QUEUED, RUNNING))).values(**values)
+            )
+            await db.commit()
+        for job_id in job_ids:
+            local = self._local.pop(job_id, None)
+            if local is not None:
+                local.done.set()
+
+    async def _work(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            local = self._local.get(job_id)
+            if local is None or local.cancelled:
+                continue
+            try:
+                await self._run(job_id, local)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Recording the outcome failed (e.g. the database is unavailable)
+                logger.error("Job %s could not be completed: %s", job_id, e)
+                self._local.pop(job_id, None)
+                local.done.set()
+
+    async def _run(self, job_id: str, local: _LocalJob) -> None:
+        async with AsyncSessionLocal() as db:
+            claimed = await db.execute(
+                update(Job).where(Job.id == job_id, Job.status == QUEUED).values(status=RUNNING, started_at=_now())
+            )
+            await db.commit()
+        if not claimed.rowcount or local.cancelled:
+            # Cancelled while queued, possibly through another worker process
+            self._local.pop(job_id, None)
+            local.done.set()
+            return
+        local.task = asyncio.create_task(self._execute(local.function, local.inputs))
+        try:
+            result, _ = await local.task
+        except asyncio.CancelledError:
+            if not local.cancelled:
+                # This worker itself is being cancelled; stop() records the outcome
+                raise
+            await self._finish([job_id], CANCELLED, status_code=499)
+        except HTTPException as e:
+            await self._finish([job_id], FAILED, error=str(e.detail), status_code=e.status_code)
+        except Exception as e:
+            logger.debug("Job %s failed", job_id, exc_info=True)
+            await self._finish([job_id], FAILED, error=f"Function execution error: {str(e)}", status_code=500)
+        else:
+            await self._finish([job_id], SUCCEEDED, result=result, status_code=200)
+
+    async def _sweep(self, interval: float = 60.0) -> None:
+        """Delete finished jobs older than JOB_RESULT_TTL"""
+        while True:
+            await asyncio.sleep(interval)
+            cutoff = _now() - datetime.timedelta(seconds=JOB_RESULT_TTL)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(delete(Job).where(Job.status.in_(FINISHED), Job.finished_at < cutoff))
+                    await db.commit()
+            except Exception as e:
+                logger.warning("Could not delete expired jobs: %s", e)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "running": sum(1 for local in self._local.values() if local.task is not None),
+        }
+
+job_queue = JobQueue()
@@ -0,0 +1,377 @@
+import asyncio
+import bisect
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# Directory shared by all workers of one deployment. Each worker writes its own
+# snapshot there and /metrics sums them, so any worker can answer a scrape.
+# Unset: metrics cover this process only. Snapshots of exited workers are folded
+# into one retired snapshot and deleted.
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "1.0"))
+
+# Histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# name -> (type, help)
+METRICS = {
+    "ai_factory_calls_total": ("counter", "Function calls"),
+    "ai_factory_errors_total": ("counter", "Function calls that failed, by status code"),
+    "ai_factory_in_flight": ("gauge", "Function calls currently executing"),
+    "ai_factory_stage_seconds": ("histogram", "Time spent in each stage of a function call"),
+    "ai_factory_provider_tokens_total": ("counter", "Tokens reported by the provider, by direction"),
+}
+
+# Stages: lookup, validate, compile, cache, execute, handler, template, first_token, serialize, total
+Labels = Tuple[Tuple[str, str], ...]
+
+# Labels of the function call running in the current task (or thread)
+_call_labels: ContextVar[Optional[Dict[str, str]]] = ContextVar("metrics_call_labels", default=None)
+
+class CallRecord:
+    """Outcome of one call: duration in seconds, status code and provider token usage"""
+
+    __slots__ = ("duration", "status_code", "input_tokens", "output_tokens")
+
+    def __init__(self):
+        self.duration = 0.0
+        self.status_code = 200
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+# Record of the call running in the current task, filled in by tokens()
+_call_record: ContextVar[Optional[CallRecord]] = ContextVar("metrics_call_record", default=None)
+
+def _span_attributes(labels: Dict[str, str]) -> Dict[str, str]:
+    return {"ai_factory.function": labels["function"], "ai_factory.implementation_type": labels["type"]}
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _key(name: str, labels: Labels) -> str:
+    return json.dumps([name, labels])
+
+class Metrics:
+    """Counters, gauges and histograms kept in plain dicts
+
+    Snapshots are JSON so several worker processes can merge them: counters and
+    histograms are summed over every snapshot (including exited workers, so
+    totals never go backwards), gauges only over live workers.
+
+    Each worker's file is named by pid and start time, so a worker that reuses
+    the pid of an exited one never overwrites its snapshot.
+    """
+
+    def __init__(self, directory: Optional[str] = METRICS_DIR, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.directory = directory
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        # key -> per-bucket counts (+Inf last), then sum
+        self._histograms: Dict[str, List[float]] = {}
+        # (pid, start time) naming this process's snapshot file, renewed after a fork
+        self._process: Optional[Tuple[int, int]] = None
+
+    def inc(self, name: str, labels: Dict[str, str], value: float = 1) -> None:
+        key = _key(name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add(self, name: str, labels: Dict[str, str], delta: float) -> None:
+        key = _key(name, _labels(labels))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+
+    def observe(self, name: str, labels: Dict[str, str], value: float) -> None:
+        key = _key(name, _labels(labels))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 2)
+            histogram[index] += 1
+            histogram[-1] += value
+
+    # Call-scoped helpers; labels come from the enclosing call()
+
+    @contextmanager
+    def call(self, function) -> Iterator["CallRecord"]:
+        """Count one call of `function`, track it in flight and time (and trace) it end to end
+
+        Yields the call's CallRecord, complete once the block exits.
+        """
+        labels = {"function": function.name, "type": function.implementation_type}
+        record = CallRecord()
+        token = _call_labels.set(labels)
+        record_token = _call_record.set(record)
+        self.inc("ai_factory_calls_total", labels)
+        self.add("ai_factory_in_flight", labels, 1)
+        started = time.perf_counter()
+        try:
+            with tracer.span("call", _span_attributes(labels)):
+                yield record
+        except BaseException as e:
+            # A cancelled task or a stream closed early: the client went away
+            abandoned = isinstance(e, (asyncio.CancelledError, GeneratorExit))
+            record.status_code = getattr(e, "status_code", None) or (499 if abandoned else 500)
+            self.inc("ai_factory_errors_total", {**labels, "status_code": record.status_code})
+            raise
+        finally:
+            record.duration = time.perf_counter() - started
+            self.observe("ai_factory_stage_seconds", {**labels, "stage": "total"}, record.duration)
+            self.add("ai_factory_in_flight", labels, -1)
+            try:
+                _call_record.reset(record_token)
+                _call_labels.reset(token)
+            except ValueError:
+                # A streamed call ends in the response's context, not the one that opened it
+                pass
+
+    def batch(self, function, duration: float, status_codes: List[int]) -> None:
+        """Count the calls run together in one round trip (executemany), which all took `duration`"""
+        labels = {"function": function.name, "type": function.implementation_type}
+        self.inc("ai_factory_calls_total", labels, len(status_codes))
+        for status_code in status_codes:
+            if status_code >= 400:
+                self.inc("ai_factory_errors_total", {**labels, "status_code": status_code})
+            self.observe("ai_factory_stage_seconds", {**labels, "stage": "total"}, duration)
+
+    @contextmanager
+    def bind(self, function) -> Iterator[None]:
+        """Label stage timings and token counts without counting a call"""
+        token = _call_labels.set({"function": function.name, "type": function.implementation_type})
+        try:
+            yield
+        finally:
+            try:
+                _call_labels.reset(token)
+            except ValueError:
+                # A generator finalized from another context; that context never saw the set
+                pass
+
+    @contextmanager
+    def stage(self, name: str, labels: Optional[Dict[str, str]] = None) -> Iterator[None]:
+        """Time a stage of the current call (a no-op outside of one); every stage is also a trace span"""
+        labels = labels or _call_labels.get()
+        with tracer.span(name, _span_attributes(labels) if labels else None):
+            if labels is None:
+                yield
+                return
+            started = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.observe("ai_factory_stage_seconds", {**labels, "stage": name}, time.perf_counter() - started)
+
+    def tokens(self, input_tokens: Optional[int], output_tokens: Optional[int]) -> None:
+        """Record provider-reported token usage for the current call"""
+        record = _call_record.get()
+        if record is not None:
+            record.input_tokens += input_tokens or 0
+            record.output_tokens += output_tokens or 0
+        labels = _call_labels.get()
+        if labels is None:
+            return
+        if input_tokens:
+            self.inc("ai_factory_provider_tokens_total", {**labels, "direction": "input"}, input_tokens)
+        if output_tokens:
+            self.inc("ai_factory_provider_tokens_total", {**labels, "direction": "output"}, output_tokens)
+
+    # Snapshots and exposition
+
+    def _process_key(self) -> Tuple[int, int]:
+        pid = os.getpid()
+        if self._process is None or self._process[0] != pid:
+            self._process = (pid, time.time_ns())
+        return self._process
+
+    def snapshot(self) -> Dict[str, Any]:
+        pid, started = self._process_key()
+        with self._lock:
+            return {
+                "pid": pid,
+                "started": started,
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "histograms": {key: list(values) for key, values in self._histograms.items()},
+            }
+
+    def write(self) -> None:
+        """Publish this worker's snapshot to the shared directory, retiring exited workers'"""
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        pid, started = self._process_key()
+        _write_json(os.path.join(self.directory, f"{pid}-{started}.json"), self.snapshot())
+        with self._directory_lock(fcntl.LOCK_EX):
+            self._retire()
+
+    @contextmanager
+    def _directory_lock(self, operation: int) -> Iterator[None]:
+        # Readers share it; retiring a snapshot takes it alone, so no reader
+        # sees a snapshot both in its own file and in the retired one (or neither)
+        with open(os.path.join(self.directory, RETIRED_LOCK), "a") as f:
+            fcntl.flock(f, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _worker_files(self) -> Iterator[Tuple[str, int, int]]:
+        """(path, pid, start time) of every worker snapshot other than this process's"""
+        own = self._process_key()
+        for filename in os.listdir(self.directory):
+            stem, _, extension = filename.partition(".")
+            pid, _, started = stem.partition("-")
+            if extension != "json" or not pid.isdigit() or not started.isdigit():
+                continue
+            if (int(pid), int(started)) != own:
+                yield os.path.join(self.directory, filename), int(pid), int(started)
+
+    def _retire(self) -> None:
+        """Fold the snapshots of exited workers into the retired snapshot and delete them"""
+        own_pid = os.getpid()
+        # A file with our own pid but another start time is from an earlier process
+        exited = [path for path, pid, _ in self._worker_files() if pid == own_pid or not pid_alive(pid)]
+        if not exited:
+            return
+        retired_path = os.path.join(self.directory, RETIRED)
+        retired = _read_json(retired_path) or {"counters": {}, "histograms": {}}
+        for path in exited:
+            snapshot = _read_json(path)
+            if snapshot is not None:
+                _merge(retired, snapshot)
+        _write_json(retired_path, retired)
+        for path in exited:
+            os.remove(path)
+
+    def _snapshots(self) -> List[Dict[str, Any]]:
+        own = self.snapshot()
+        if not self.directory or not os.path.isdir(self.directory):
+            return [own]
+        snapshots = [own]
+        with self._directory_lock(fcntl.LOCK_SH):
+            retired = _read_json(os.path.join(self.directory, RETIRED))
+            if retired is not None:
+                # Merged with ours, as it holds no gauges
+                _merge(own, retired)
+            for path, _, _ in self._worker_files():
+                snapshot = _read_json(path)
+                if snapshot is not None:
+                    snapshots.append(snapshot)
+        return snapshots
+
+    def render(self) -> str:
+        """Prometheus text exposition format, merged across workers"""
+        total: Dict[str, Any] = {"counters": {}, "histograms": {}}
+        gauges: Dict[str, float] = {}
+        own, *others = self._snapshots()
+        for snapshot in [own] + others:
+            _merge(total, snapshot)
+            # Another file with our pid is from an exited process
+            if snapshot is own or (snapshot["pid"] != own["pid"] and pid_alive(snapshot["pid"])):
+                for key, value in snapshot["gauges"].items():
+                    gauges[key] = gauges.get(key, 0) + value
+        counters, histograms = total["counters"], total["histograms"]
+
+        series: Dict[str, List[str]] = {name: [] for name in METRICS}
+        for source in (counters, gauges):
+            for key, value in sorted(source.items()):
+                name, labels = json.loads(key)
+                series.setdefault(name, []).append(f"{name}{_format_labels(labels)} {_number(value)}")
+        for key, values in sorted(histograms.items()):
+            name, labels = json.loads(key)
+            lines = series.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_format_labels(labels + [['le', le]])} {_number(cumulative)}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {values[-1]!r}")
+            lines.append(f"{name}_count{_format_labels(labels)} {_number(cumulative)}")
+
+        output = []
+        for name, lines in series.items():
+            if not lines:
+                continue
+            kind, help_text = METRICS.get(name, ("untyped", name))
+            output.append(f"# HELP {name} {help_text}")
+            output.append(f"# TYPE {name} {kind}")
+            output.extend(lines)
+        return "\n".join(output) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+# Counters and histograms of exited workers, and the lock guarding it
+RETIRED = "retired.json"
+RETIRED_LOCK = "retired.lock"
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_json(path: str, value: Dict[str, Any]) -> None:
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(value, f)
+    # Atomic, so readers never see a half-written snapshot
+    os.replace(temporary, path)
+
+def _merge(total: Dict[str, Any], snapshot: Dict[str, Any]) -> None:
+    counters = total["counters"]
+    for key, value in snapshot["counters"].items():
+        counters[key] = counters.get(key, 0) + value
+    histograms = total["histograms"]
+    for key, values in snapshot["histograms"].items():
+        merged = histograms.get(key)
+        histograms[key] = values if merged is None else [a + b for a, b in zip(merged, values)]
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+metrics = Metrics()
+
+async def flush_metrics(interval: float = METRICS_FLUSH_INTERVAL):
+    """Background task publishing this worker's snapshot when METRICS_DIR is set"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(metrics.write)
+        except OSError as e:
+            logger.warning("Could not write metrics snapshot: %s", e)
@@ -0,0 +1,225 @@
+import asyncio
+import json
+import os
+import re
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Dict, Any, List, Set, Tuple
+
+from fastapi import HTTPException
+
+# Seconds a node may run when its config sets no "timeout"
+PIPELINE_NODE_TIMEOUT = float(os.environ.get("PIPELINE_NODE_TIMEOUT", "60"))
+# Pipelines may call pipelines; deeper nesting than this is rejected (catches cycles)
+MAX_PIPELINE_DEPTH = int(os.environ.get("MAX_PIPELINE_DEPTH", "8"))
+
+# "$inputs.x" or "$nodes.name.path[0].to.value"
+_REFERENCE = re.compile(r"\$(inputs|nodes)((?:\.[^.\[\]]+|\[\d+\])*)$")
+_STEP = re.compile(r"\.([^.\[\]]+)|\[(\d+)\]")
+
+_depth: ContextVar[int] = ContextVar("pipeline_depth", default=0)
+
+class _Reference:
+    __slots__ = ("source", "path", "text")
+
+    def __init__(self, text: str):
+        match = _REFERENCE.match(text)
+        if not match:
+            raise ValueError(f"Invalid reference {text!r}: use $inputs.<name> or $nodes.<node>[.path]")
+        self.text = text
+        self.source = match.group(1)
+        self.path: List[Any] = [int(index) if index else key for key, index in _STEP.findall(match.group(2))]
+        if not self.path:
+            raise ValueError(f"Invalid reference {text!r}: name an input or a node")
+
+    def resolve(self, inputs: Dict[str, Any], results: Dict[str, Any]) -> Any:
+        value: Any = inputs if self.source == "inputs" else results
+        for step in self.path:
+            try:
+                value = value[step]
+            except (KeyError, IndexError, TypeError):
+                raise LookupError(f"{self.text} not found")
+        return value
+
+def _compile_mapping(value: Any) -> Any:
+    """Replace "$..." strings, at any depth, with references; other values are literals"""
+    if isinstance(value, str) and value.startswith("$"):
+        # "$$..." is a literal string starting with "$"
+        return value[1:] if value.startswith("$$") else _Reference(value)
+    if isinstance(value, dict):
+        return {key: _compile_mapping(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_compile_mapping(item) for item in value]
+    return value
+
+def _references(mapping: Any) -> List[_Reference]:
+    if isinstance(mapping, _Reference):
+        return [mapping]
+    if isinstance(mapping, dict):
+        return [ref for item in mapping.values() for ref in _references(item)]
+    if isinstance(mapping, list):
+        return [ref for item in mapping for ref in _references(item)]
+    return []
+
+def _render(mapping: Any, inputs: Dict[str, Any], results: Dict[str, Any]) -> Any:
+    if isinstance(mapping, _Reference):
+        return mapping.resolve(inputs, results)
+    if isinstance(mapping, dict):
+        return {key: _render(item, inputs, results) for key, item in mapping.items()}
+    if isinstance(mapping, list):
+        return [_render(item, inputs, results) for item in mapping]
+    return mapping
+
+class _Node:
+    __slots__ = ("name", "function", "inputs", "timeout", "after")
+
+    def __init__(self, name: str, spec: Dict[str, Any]):
+        if not isinstance(spec, dict) or not isinstance(spec.get("function"), str):
+            raise ValueError(f"Node {name!r} needs a \"function\" name")
+        self.name = name
+        self.function = spec["function"]
+        self.inputs = _compile_mapping(spec.get("inputs", {}))
+        if not isinstance(self.inputs, dict):
+            raise ValueError(f"Node {name!r}: \"inputs\" must be an object")
+        timeout = spec.get("timeout", PIPELINE_NODE_TIMEOUT)
+        if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0:
+            raise ValueError(f"Node {name!r}: \"timeout\" must be a positive number of seconds")
+        self.timeout = float(timeout)
+        # Nodes whose results this one reads
+        self.after: Set[str] = {ref.path[0] for ref in _references(self.inputs) if ref.source == "nodes"}
+
+class PipelinePlan:
+    """A pipeline config checked and ordered once: nodes in dependency order and the output mapping"""
+
+    __slots__ = ("nodes", "output")
+
+    def __init__(self, config: Dict[str, Any]):
+        specs = config.get("nodes")
+        if not isinstance(specs, dict) or not specs:
+            raise ValueError("\"nodes\" must be a non-empty object of name -> {function, inputs, timeout}")
+        nodes = {name: _Node(name, spec) for name, spec in specs.items()}
+        for node in nodes.values():
+            unknown = node.after - nodes.keys()
+            if unknown:
+                raise ValueError(f"Node {node.name!r} reads unknown node(s): {', '.join(sorted(unknown))}")
+        self.nodes = _topological_order(nodes)
+
+        if "output" in config:
+            self.output = _compile_mapping(config["output"])
+        else:
+            # Default: the results of the nodes nothing else reads
+            read = set().union(*(node.after for node in self.nodes))
+            self.output = {node.name: _Reference(f"$nodes.{node.name}") for node in self.nodes if node.name not in read}
+        unknown = {ref.path[0] for ref in _references(self.output) if ref.source == "nodes"} - nodes.keys()
+        if unknown:
+            raise ValueError(f"\"output\" reads unknown node(s): {', '.join(sorted(unknown))}")
+
+    def input_names(self) -> Set[str]:
+        mappings = [node.inputs for node in self.nodes] + [self.output]
+        return {str(ref.path[0]) for mapping in mappings for ref in _references(mapping) if ref.source == "inputs"}
+
+def _topological_order(nodes: Dict[str, _Node]) -> List[_Node]:
+    ordered: List[_Node] = []
+    state: Dict[str, int] = {}  # 1: visiting, 2: done
+
+    def visit(node: _Node, chain: Tuple[str, ...]) -> None:
+        if state.get(node.name) == 2:
+            return
+        if state.get(node.name) == 1:
+            raise ValueError(f"Pipeline has a cycle: {' -> '.join(chain + (node.name,))}")
+        state[node.name] = 1
+        for name in sorted(node.after):
+            visit(nodes[name], chain + (node.name,))
+        state[node.name] = 2
+        ordered.append(node)
+
+    for node in nodes.values():
+        visit(node, ())
+    return ordered
+
+@lru_cache(maxsize=256)
+def _compile(config_json: str) -> PipelinePlan:
+    return PipelinePlan(json.loads(config_json))
+
+def compile_pipeline(config: Dict[str, Any]) -> PipelinePlan:
+    return _compile(json.dumps({key: config.get(key) for key in ("nodes", "output") if key in config}, sort_keys=True))
+
+def prepare_pipeline_config(config: Dict[str, Any], input_schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Check the DAG (node names, references, cycles, timeouts) when the function is loaded
+
+    Referenced functions are looked up per call, so a pipeline may be saved
+    before the functions it uses.
+    """
+    plan = compile_pipeline(config)
+    properties = input_schema.get("properties")
+    if isinstance(properties, dict):
+        undeclared = plan.input_names() - properties.keys()
+        if undeclared:
+            raise ValueError(f"References inputs not in input_schema: {', '.join(sorted(undeclared))}")
+    return config
+
+async def execute_pipeline(config: Dict[str, Any], inputs: Dict[str, Any]) -> Any:
+    """Run a pipeline: every node starts as soon as the nodes it reads have finished
+
+    implementation_config:
+        {"nodes": {
+            "user": {"function": "get_user", "inputs": {"id": "$inputs.user_id"}, "timeout": 5},
+            "bio": {"function": "summarize", "inputs": {"text": "$nodes.user.rows[0].bio"}}},
+         "output": {"summary": "$nodes.bio.text"}}
+    Each node runs the named function through the normal call path (cache,
+    scheduling, retries, metrics); results pass between nodes in memory. The
+    first node to fail cancels the rest and fails the pipeline.
+    """
+    # Imported here: the router imports the registry, which imports this module
+    from routers.functions import check_inputs, execute_function_cached, get_function_or_404
+
+    depth = _depth.get()
+    if depth >= MAX_PIPELINE_DEPTH:
+        raise HTTPException(status_code=400, detail=f"Pipelines nested deeper than {MAX_PIPELINE_DEPTH} levels")
+    plan = compile_pipeline(config)
+    results: Dict[str, Any] = {}
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def run(node: _Node) -> None:
+        if node.after:
+            await asyncio.gather(*(tasks[name] for name in node.after))
+        try:
+            node_inputs = _render(node.inputs, inputs, results)
+        except LookupError as e:
+            raise HTTPException(status_code=500, detail=f"Pipeline node {node.name!r}: {str(e)}")
+        function = get_function_or_404(node.function)
+        check_inputs(function, node_inputs)
+        token = _depth.set(depth + 1)
+        try:
+            results[node.name], _ = await asyncio.wait_for(execute_function_cached(function, node_inputs), node.timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail=f"Pipeline node {node.name!r} timed out after {node.timeout:g}s")
+        finally:
+            _depth.reset(token)
+
+    # Nodes come in dependency order, so every task a node waits on already exists
+    for node in plan.nodes:
+        tasks[node.name] = asyncio.create_task(run(node))
+    try:
+        done, _ = await asyncio.wait(tasks.values(), return_when=asyncio.FIRST_EXCEPTION)
+        # Read every failure (so none is logged as unretrieved), report the most upstream one
+        failures = [
+            (node.name, tasks[node.name].exception())
+            for node in plan.nodes
+            if tasks[node.name] in done and not tasks[node.name].cancelled()
+        ]
+        for name, error in failures:
+            if error is None:
+                continue
+            if isinstance(error, HTTPException):
+                detail = error.detail if str(error.detail).startswith("Pipeline node") else f"Pipeline node {name!r} failed: {error.detail}"
+                raise HTTPException(status_code=error.status_code, detail=detail) from error
+            raise HTTPException(status_code=500, detail=f"Pipeline node {name!r} failed: {str(error)}") from error
+    finally:
+        for task in tasks.values():
+            task.cancel()
+
+    try:
+        return _render(plan.output, inputs, results)
+    except LookupError as e:
+        raise HTTPException(status_code=500, detail=f"Pipeline output: {str(e)}")
@@ -0,0 +1,148 @@
+import asyncio
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Dict, Any, Deque, Iterator, List, Optional
+
+from services.tracing import tracer
+
+# Keep a stack profile of calls slower than this many milliseconds (0: off)
+PROFILE_SLOW_CALLS_MS = float(os.environ.get("PROFILE_SLOW_CALLS_MS", "0"))
+# Seconds between stack samples of each in-flight call
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", "0.01"))
+# Most recent slow-call profiles kept for the admin endpoint
+PROFILE_MAX_PROFILES = int(os.environ.get("PROFILE_MAX_PROFILES", "50"))
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+def _thread_stack(thread_id: int) -> List[Any]:
+    frame = sys._current_frames().get(thread_id)
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    return frames[::-1]
+
+def _await_stack(task: asyncio.Task) -> List[Any]:
+    # Task.get_stack() stops at the outermost coroutine; follow the await chain instead
+    frames = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            break
+        frames.append(frame)
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+    return frames
+
+class _ActiveCall:
+    __slots__ = ("function", "task", "loop", "thread_id", "started", "samples")
+
+    def __init__(self, function: str, task: asyncio.Task):
+        self.function = function
+        self.task = task
+        self.loop = task.get_loop()
+        self.thread_id = threading.get_ident()
+        self.started = time.perf_counter()
+        self.samples: Counter = Counter()
+
+class SlowCallProfiler:
+    """Samples the await stack of every in-flight call from a background thread
+
+    A suspended task's stack shows where it waits (e.g. inside the provider's
+    HTTP read) and a running task's thread stack shows the code it runs, so
+    the profile attributes wall time, not just CPU, to code. Profiles are kept
+    only for calls over the threshold, as collapsed stacks ("outer;inner count"),
+    the input format of flame graph tools.
+    """
+
+    def __init__(self, threshold_ms: float = PROFILE_SLOW_CALLS_MS, interval: float = PROFILE_INTERVAL):
+        self.threshold = threshold_ms / 1000.0
+        self.interval = interval
+        self._active: Dict[int, _ActiveCall] = {}
+        self._profiles: Deque[Dict[str, Any]] = deque(maxlen=PROFILE_MAX_PROFILES)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0
+
+    def _ensure_sampler(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._sample_forever, name="slow-call-profiler", daemon=True)
+            self._thread.start()
+
+    def _sample_forever(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                calls = list(self._active.values())
+            for call in calls:
+                try:
+                    if asyncio.current_task(call.loop) is call.task:
+                        # Running (possibly blocking the loop): the thread stack
+                        # also shows the synchronous code it is in
+                        frames = _thread_stack(call.thread_id)
+                    else:
+                        frames = _await_stack(call.task)
+                except RuntimeError:
+                    # The coroutine changed under us; skip this sample
+                    continue
+                if frames:
+                    call.samples[";".join(_frame_name(frame) for frame in frames)] += 1
+
+    @contextmanager
+    def profile(self, function) -> Iterator[None]:
+        """Profile the current task while it runs `function`; a no-op when disabled"""
+        task = asyncio.current_task() if self.enabled else None
+        if task is None:
+            yield
+            return
+        call = _ActiveCall(function.name, task)
+        key = id(call)
+        with self._lock:
+            self._active[key] = call
+        self._ensure_sampler()
+        try:
+            yield
+        finally:
+            with self._lock:
+                del self._active[key]
+            duration = time.perf_counter() - call.started
+            if duration >= self.threshold and call.samples:
+                span = tracer.current()
+                self._profiles.append({
+                    "id": next(self._ids),
+                    "function": call.function,
+                    "duration_ms": round(duration * 1000, 1),
+                    "captured_at": time.time(),
+                    "trace_id": span.trace_id if span else None,
+                    "samples": sum(call.samples.values()),
+                    "stacks": dict(call.samples),
+                })
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [
+            {key: value for key, value in profile.items() if key != "stacks"}
+            for profile in reversed(self._profiles)
+        ]
+
+    def get(self, profile_id: int) -> Optional[Dict[str, Any]]:
+        for profile in self._profiles:
+            if profile["id"] == profile_id:
+                return profile
+        return None
+
+    @staticmethod
+    def collapsed(profile: Dict[str, Any]) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(profile["stacks"].items()))
+
+profiler = SlowCallProfiler()
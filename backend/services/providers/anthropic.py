@@ -1,84 +1,135 @@
 import json
+import logging
 import os
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, AsyncIterator, List, Optional
 from fastapi import HTTPException
+from services.metrics import metrics
+from services.providers.clients import client_pool
 from utils.validation import format_template
 
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "claude-3-5-sonnet-20240620"
+
+def _api_key(config: Dict[str, Any], inputs: Dict[str, Any]) -> str:
+    # Get API key from inputs (provided by calling service)
+    api_key = inputs.get("api_key")
+    if not api_key:
+        # Fall back to config or environment as last resort
+        api_key = config.get("api_key") or os.environ.get("ANTHROPIC_API_KEY")
+        if not api_key:
+            raise ValueError("Anthropic API key not provided in request and not found in environment")
+    return api_key
+
 async def execute_anthropic_function(config: Dict[str, Any], inputs: Dict[str, Any]) -> Dict[str, Any]:
     """Execute a Claude-based function with the given inputs"""
     try:
         # Import the Anthropic client only when needed
-        from anthropic import Anthropic
+        from anthropic import AsyncAnthropic
         
-        # Get API key from inputs (provided by calling service)
-        api_key = inputs.get("api_key")
-        if not api_key:
-            # Fall back to config or environment as last resort
-            api_key = config.get("api_key") or os.environ.get("ANTHROPIC_API_KEY")
-            if not api_key:
-                raise ValueError("Anthropic API key not provided in request and not found in environment")
-        
-        print(f"Using Claude API with model: {config.get('model', 'claude-3-5-sonnet-20240620')}")
+        api_key = _api_key(config, inputs)
         
-        anthropic = Anthropic(api_key=api_key)
+        logger.debug("Using Claude API with model: %s", config.get('model', DEFAULT_MODEL))
         
         # Get the prompt template and format it with payload values
         prompt_template = config.get("prompt_template", "")
-        formatted_prompt = format_template(prompt_template, inputs)
+        with metrics.stage("template"):
+            formatted_prompt = format_template(prompt_template, inputs)
         
-        print(f"Formatted prompt (first 200 chars): {formatted_prompt[:200]}...")
+        logger.debug("Formatted prompt: %d chars", len(formatted_prompt))
         
-        # Determine if we should use tools/function calling
-        tools = config.get("tools")
+        # Reuse the pooled client (and its keep-alive connections) for this key;
+        # SDK retries are off because services/providers/resilience.py retries
+        base_url = config.get("base_url")
+        async with client_pool.acquire(
+            "anthropic", api_key, base_url,
+            lambda: AsyncAnthropic(api_key=api_key, base_url=base_url, max_retries=0),
+        ) as anthropic:
+            # Determine if we should use tools/function calling
+            tools = config.get("tools")
         
-        # Make Claude API call
-        if tools:
-            print(f"Making Claude API call with tools")
-            response = anthropic.messages.create(
-                model=config.get("model", "claude-3-5-sonnet-20240620"),
-                max_tokens=config.get("max_tokens", 1000),
-                system=config.get("system_prompt", ""),
-                messages=[{"role": "user", "content": formatted_prompt}],
-                tools=tools
-            )
+            # Make Claude API call
+            if tools:
+                logger.debug("Making Claude API call with tools")
+                response = await anthropic.messages.create(
+                    model=config.get("model", "claude-3-5-sonnet-20240620"),
+                    max_tokens=config.get("max_tokens", 1000),
+                    system=config.get("system_prompt", ""),
+                    messages=[{"role": "user", "content": formatted_prompt}],
+                    tools=tools
+                )
+                metrics.tokens(response.usage.input_tokens, response.usage.output_tokens)
             
-            print(f"Claude API response received, content types: {[c.type for c in response.content]}")
+                logger.debug("Claude API response received, content types: %s", [c.type for c in response.content])
             
-            # Extract tool calls from the response
-            for i, content in enumerate(response.content):
-                print(f"Examining content item {i}, type: {content.type}")
+                # Extract tool calls from the response
+                for i, content in enumerate(response.content):
+                    logger.debug("Examining content item %d, type: %s", i, content.type)
                 
-                if content.type == "tool_use":
-                    print(f"Found tool_use content")
+                    if content.type == "tool_use":
+                        logger.debug("Found tool_use content")
                     
-                    if hasattr(content, 'name') and content.name:
-                        print(f"Found tool with name: {content.name}")
+                        if hasattr(content, 'name') and content.name:
+                            logger.debug("Found tool with name: %s", content.name)
                         
-                        if isinstance(content.input, dict):
-                            print(f"Input is already a dictionary")
-                            return content.input
-                        else:
-                            print(f"Parsing input as JSON: {content.input}")
-                            return json.loads(content.input)
+                            if isinstance(content.input, dict):
+                                logger.debug("Input is already a dictionary")
+                                return content.input
+                            else:
+                                logger.debug("Parsing tool input as JSON")
+                                return json.loads(content.input)
             
-            # Fallback to text response if no tool call
-            print(f"No tool call found, falling back to text response")
-            if response.content and hasattr(response.content[0], 'text'):
+                # Fallback to text response if no tool call
+                logger.debug("No tool call found, falling back to text response")
+                if response.content and hasattr(response.content[0], 'text'):
+                    return {"text": response.content[0].text}
+                return {"text": "No text content in response"}
+            else:
+                # Simple completion without tools
+                logger.debug("Making simple Claude API call without tools")
+                response = await anthropic.messages.create(
+                    model=config.get("model", "claude-3-5-sonnet-20240620"),
+                    max_tokens=config.get("max_tokens", 1000),
+                    system=config.get("system_prompt", ""),
+                    messages=[{"role": "user", "content": formatted_prompt}]
+                )
+                metrics.tokens(response.usage.input_tokens, response.usage.output_tokens)
                 return {"text": response.content[0].text}
-            return {"text": "No text content in response"}
-        else:
-            # Simple completion without tools
-            print(f"Making simple Claude API call without tools")
-            response = anthropic.messages.create(
-                model=config.get("model", "claude-3-5-sonnet-20240620"),
+    except HTTPException:
+        # Bad inputs (e.g. a missing template field) keep their 400, as on /stream
+        raise
+    except Exception as e:
+        logger.warning("Claude API error: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
+        raise HTTPException(status_code=500, detail=f"Claude API error: {str(e)}") from e
+
+async def stream_anthropic_function(config: Dict[str, Any], inputs: Dict[str, Any]) -> AsyncIterator[str]:
+    """Yield text deltas of a Claude completion as they arrive"""
+    try:
+        from anthropic import AsyncAnthropic
+        
+        api_key = _api_key(config, inputs)
+        with metrics.stage("template"):
+            formatted_prompt = format_template(config.get("prompt_template", ""), inputs)
+        
+        logger.debug("Streaming Claude API call with model: %s", config.get('model', DEFAULT_MODEL))
+        
+        base_url = config.get("base_url")
+        async with client_pool.acquire(
+            "anthropic", api_key, base_url,
+            lambda: AsyncAnthropic(api_key=api_key, base_url=base_url, max_retries=0),
+        ) as anthropic:
+            async with anthropic.messages.stream(
+                model=config.get("model", DEFAULT_MODEL),
                 max_tokens=config.get("max_tokens", 1000),
                 system=config.get("system_prompt", ""),
                 messages=[{"role": "user", "content": formatted_prompt}]
-            )
-            return {"text": response.content[0].text}
+            ) as stream:
+                async for text in stream.text_stream:
+                    yield text
+                usage = stream.current_message_snapshot.usage
+                metrics.tokens(usage.input_tokens, usage.output_tokens)
+    except HTTPException:
+        raise
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Claude API error: {str(e)}")
-        print(f"Traceback: {error_details}")
-        raise HTTPException(status_code=500, detail=f"Claude API error: {str(e)}")
\ No newline at end of file
+        logger.warning("Claude API streaming error: %s", e)
+        raise HTTPException(status_code=500, detail=f"Claude API error: {str(e)}") from e
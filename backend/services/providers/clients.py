@@ -0,0 +1,104 @@
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Optional, Tuple
+
+import httpx
+
+# Maximum number of distinct (provider, api_key, host) clients kept open
+PROVIDER_CLIENT_POOL_SIZE = int(os.environ.get("PROVIDER_CLIENT_POOL_SIZE", "32"))
+
+# Connection limits for the httpx clients we build ourselves
+HTTP_LIMITS = httpx.Limits(max_connections=200, max_keepalive_connections=50, keepalive_expiry=60.0)
+
+ClientKey = Tuple[str, str, str]
+
+async def _close_client(client: Any) -> None:
+    # httpx clients expose aclose(); the Anthropic SDK client exposes async close()
+    close = getattr(client, "aclose", None) or client.close
+    await close()
+
+class _PooledClient:
+    __slots__ = ("client", "leases", "evicted")
+
+    def __init__(self, client: Any):
+        self.client = client
+        self.leases = 0
+        self.evicted = False
+
+class ClientPool:
+    """Bounded LRU pool of long-lived provider clients
+
+    Clients are keyed by (provider, api_key, host) so each credential/host pair
+    reuses one keep-alive connection pool. An evicted client is closed once the
+    last in-flight request using it has finished.
+    """
+
+    def __init__(self, max_size: int = PROVIDER_CLIENT_POOL_SIZE):
+        self.max_size = max_size
+        self._clients: "OrderedDict[ClientKey, _PooledClient]" = OrderedDict()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    @staticmethod
+    def key(provider: str, api_key: Optional[str], host: Optional[str]) -> ClientKey:
+        # Never keep raw API keys in the pool keys
+        digest = hashlib.sha256(api_key.encode()).hexdigest() if api_key else ""
+        return (provider, digest, host or "")
+
+    @asynccontextmanager
+    async def acquire(
+        self,
+        provider: str,
+        api_key: Optional[str],
+        host: Optional[str],
+        factory: Callable[[], Any],
+    ) -> AsyncIterator[Any]:
+        """Lease the pooled client for this key, creating it with `factory` on a miss"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Clients are bound to the loop that first used them; start afresh
+            self._clients.clear()
+            self._loop = loop
+
+        key = self.key(provider, api_key, host)
+        entry = self._clients.get(key)
+        if entry is None:
+            entry = _PooledClient(factory())
+            self._clients[key] = entry
+            await self._evict_overflow()
+        else:
+            self._clients.move_to_end(key)
+
+        entry.leases += 1
+        try:
+            yield entry.client
+        finally:
+            entry.leases -= 1
+            if entry.evicted and entry.leases == 0:
+                await _close_client(entry.client)
+
+    async def _evict_overflow(self) -> None:
+        while len(self._clients) > self.max_size:
+            _, entry = self._clients.popitem(last=False)
+            entry.evicted = True
+            if entry.leases == 0:
+                await _close_client(entry.client)
+
+    async def close(self) -> None:
+        """Close every pooled client; in-flight leases close theirs on release"""
+        entries = list(self._clients.values())
+        self._clients.clear()
+        if self._loop is not asyncio.get_running_loop():
+            # Bound to a loop that has ended; their connections went with it
+            return
+        for entry in entries:
+            entry.evicted = True
+            if entry.leases == 0:
+                await _close_client(entry.client)
+
+client_pool = ClientPool()
@@ -1,55 +1,91 @@
 import json
+import logging
 import os
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, AsyncIterator, List, Optional
+import httpx
 from fastapi import HTTPException
+from services.metrics import metrics
+from services.providers.clients import HTTP_LIMITS, client_pool
 from utils.validation import format_template
 
+logger = logging.getLogger(__name__)
+
+def _request(config: Dict[str, Any], inputs: Dict[str, Any], stream: bool) -> Dict[str, Any]:
+    # Get the prompt template and format it with payload values
+    with metrics.stage("template"):
+        formatted_prompt = format_template(config.get("prompt_template", ""), inputs)
+    system_prompt = config.get("system_prompt", "")
+    
+    logger.debug("Formatted prompt: %d chars", len(formatted_prompt))
+    
+    # Create the message payload
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": formatted_prompt})
+    
+    return {
+        "model": config.get("model", "llama3"),
+        "messages": messages,
+        "stream": stream,
+        "options": {
+            "temperature": config.get("temperature", 0.7),
+            "top_p": config.get("top_p", 0.9),
+            "num_predict": config.get("max_tokens", 1024)
+        }
+    }
+
+def _client(config: Dict[str, Any]):
+    # Get the host from config or environment; one pooled client per host
+    host = config.get("host") or os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+    return client_pool.acquire(
+        "ollama", None, host,
+        lambda: httpx.AsyncClient(base_url=host, limits=HTTP_LIMITS),
+    )
+
 async def execute_ollama_function(config: Dict[str, Any], inputs: Dict[str, Any]) -> Dict[str, Any]:
     """Execute an Ollama-based function with the given inputs"""
     try:
-        # Import the Ollama client
-        import ollama
-        
-        print(f"Using Ollama with model: {config.get('model', 'llama3')}")
-        
-        # Get the host from config or environment
-        host = config.get("host") or os.environ.get("OLLAMA_HOST", "http://localhost:11434")
-        
-        # Configure Ollama client
-        ollama.client.base_url = host
+        logger.debug("Using Ollama with model: %s", config.get('model', 'llama3'))
         
-        # Get the prompt template and format it with payload values
-        prompt_template = config.get("prompt_template", "")
-        formatted_prompt = format_template(prompt_template, inputs)
+        payload = _request(config, inputs, stream=False)
         
-        system_prompt = config.get("system_prompt", "")
+        # Make Ollama API call with the pooled client for this host
+        async with _client(config) as ollama:
+            response = await ollama.post("/api/chat", timeout=config.get("timeout", 300.0), json=payload)
+            response.raise_for_status()
+            data = response.json()
         
-        print(f"Formatted prompt (first 200 chars): {formatted_prompt[:200]}...")
+        metrics.tokens(data.get("prompt_eval_count"), data.get("eval_count"))
+        return {"text": data["message"]["content"]}
         
-        # Create the message payload
-        messages = []
-        if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
-        messages.append({"role": "user", "content": formatted_prompt})
-        
-        # Make Ollama API call
-        response = ollama.chat(
-            model=config.get("model", "llama3"),
-            messages=messages,
-            options={
-                "temperature": config.get("temperature", 0.7),
-                "top_p": config.get("top_p", 0.9),
-                "num_predict": config.get("max_tokens", 1024)
-            }
-        )
-        
-        return {"text": response["message"]["content"]}
+    except HTTPException:
+        # Bad inputs (e.g. a missing template field) keep their 400, as on /stream
+        raise
+    except Exception as e:
+        logger.warning("Ollama API error: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
+        raise HTTPException(status_code=500, detail=f"Ollama API error: {str(e)}") from e
+
+async def stream_ollama_function(config: Dict[str, Any], inputs: Dict[str, Any]) -> AsyncIterator[str]:
+    """Yield text chunks from Ollama's newline-delimited JSON stream"""
+    try:
+        payload = _request(config, inputs, stream=True)
         
-    except ImportError:
-        raise HTTPException(status_code=500, detail="Ollama Python SDK not installed. Run 'uv add ollama' to install.")
+        async with _client(config) as ollama:
+            async with ollama.stream("POST", "/api/chat", timeout=config.get("timeout", 300.0), json=payload) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    content = chunk.get("message", {}).get("content")
+                    if content:
+                        yield content
+                    if chunk.get("done"):
+                        metrics.tokens(chunk.get("prompt_eval_count"), chunk.get("eval_count"))
+                        break
+    except HTTPException:
+        raise
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Ollama API error: {str(e)}")
-        print(f"Traceback: {error_details}")
-        raise HTTPException(status_code=500, detail=f"Ollama API error: {str(e)}")
\ No newline at end of file
+        logger.warning("Ollama API streaming error: %s", e)
+        raise HTTPException(status_code=500, detail=f"Ollama API error: {str(e)}") from e
@@ -1,48 +1,106 @@
 import json
+import logging
 import os
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, AsyncIterator, List, Optional
+import httpx
 from fastapi import HTTPException
+from services.metrics import metrics
+from services.providers.clients import HTTP_LIMITS, client_pool
 from utils.validation import format_template
 
+logger = logging.getLogger(__name__)
+
+PERPLEXITY_BASE_URL = "https://api.perplexity.ai"
+
+def _api_key(config: Dict[str, Any], inputs: Dict[str, Any]) -> str:
+    # Get API key from inputs (provided by calling service)
+    api_key = inputs.get("api_key")
+    if not api_key:
+        # Fall back to config or environment as last resort
+        api_key = config.get("api_key") or os.environ.get("PERPLEXITY_API_KEY")
+        if not api_key:
+            raise ValueError("Perplexity API key not provided in request and not found in environment")
+    return api_key
+
+def _messages(config: Dict[str, Any], inputs: Dict[str, Any]) -> List[Dict[str, str]]:
+    # Get the prompt template and format it with payload values
+    with metrics.stage("template"):
+        formatted_prompt = format_template(config.get("prompt_template", ""), inputs)
+    logger.debug("Formatted prompt: %d chars", len(formatted_prompt))
+    return [
+        {"role": "system", "content": config.get("system_prompt", "")},
+        {"role": "user", "content": formatted_prompt}
+    ]
+
+def _client(config: Dict[str, Any], api_key: str):
+    # The Perplexity API is OpenAI-compatible, so call it directly over async HTTP
+    base_url = config.get("base_url", PERPLEXITY_BASE_URL)
+    return client_pool.acquire(
+        "perplexity", api_key, base_url,
+        lambda: httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {api_key}"},
+            limits=HTTP_LIMITS,
+        ),
+    )
+
 async def execute_perplexity_function(config: Dict[str, Any], inputs: Dict[str, Any]) -> Dict[str, Any]:
     """Execute a Perplexity-based function with the given inputs"""
     try:
-        # Import the Perplexity client
-        from perplexity import Perplexity
+        api_key = _api_key(config, inputs)
         
-        # Get API key from inputs (provided by calling service)
-        api_key = inputs.get("api_key")
-        if not api_key:
-            # Fall back to config or environment as last resort
-            api_key = config.get("api_key") or os.environ.get("PERPLEXITY_API_KEY")
-            if not api_key:
-                raise ValueError("Perplexity API key not provided in request and not found in environment")
-        
-        print(f"Using Perplexity API with model: {config.get('model', 'sonar-small-online')}")
-        
-        perplexity = Perplexity(api_key=api_key)
+        logger.debug("Using Perplexity API with model: %s", config.get('model', 'sonar-small-online'))
         
-        # Get the prompt template and format it with payload values
-        prompt_template = config.get("prompt_template", "")
-        formatted_prompt = format_template(prompt_template, inputs)
+        messages = _messages(config, inputs)
         
-        print(f"Formatted prompt (first 200 chars): {formatted_prompt[:200]}...")
+        async with _client(config, api_key) as perplexity:
+            response = await perplexity.post("/chat/completions", timeout=config.get("timeout", 120.0), json={
+                "model": config.get("model", "sonar-small-online"),
+                "messages": messages
+            })
+            response.raise_for_status()
+            data = response.json()
         
-        response = perplexity.chat.completions.create(
-            model=config.get("model", "sonar-small-online"),
-            messages=[
-                {"role": "system", "content": config.get("system_prompt", "")},
-                {"role": "user", "content": formatted_prompt}
-            ]
-        )
+        usage = data.get("usage") or {}
+        metrics.tokens(usage.get("prompt_tokens"), usage.get("completion_tokens"))
+        return {"text": data["choices"][0]["message"]["content"]}
         
-        return {"text": response.choices[0].message.content}
+    except HTTPException:
+        # Bad inputs (e.g. a missing template field) keep their 400, as on /stream
+        raise
+    except Exception as e:
+        logger.warning("Perplexity API error: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
+        raise HTTPException(status_code=500, detail=f"Perplexity API error: {str(e)}") from e
+
+async def stream_perplexity_function(config: Dict[str, Any], inputs: Dict[str, Any]) -> AsyncIterator[str]:
+    """Yield text deltas from Perplexity's server-sent event stream"""
+    try:
+        api_key = _api_key(config, inputs)
+        messages = _messages(config, inputs)
         
-    except ImportError:
-        raise HTTPException(status_code=500, detail="Perplexity SDK not installed. Run 'uv add perplexity' to install.")
+        async with _client(config, api_key) as perplexity:
+            async with perplexity.stream("POST", "/chat/completions", timeout=config.get("timeout", 120.0), json={
+                "model": config.get("model", "sonar-small-online"),
+                "messages": messages,
+                "stream": True
+            }) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    payload = line[len("data:"):].strip()
+                    if payload == "[DONE]":
+                        break
+                    chunk = json.loads(payload)
+                    if chunk.get("usage"):
+                        # Sent with the final chunk
+                        metrics.tokens(chunk["usage"].get("prompt_tokens"), chunk["usage"].get("completion_tokens"))
+                    choices = chunk.get("choices") or [{}]
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+    except HTTPException:
+        raise
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Perplexity API error: {str(e)}")
-        print(f"Traceback: {error_details}")
-        raise HTTPException(status_code=500, detail=f"Perplexity API error: {str(e)}")
\ No newline at end of file
+        logger.warning("Perplexity API streaming error: %s", e)
+        raise HTTPException(status_code=500, detail=f"Perplexity API error: {str(e)}") from e
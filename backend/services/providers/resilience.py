@@ -0,0 +1,298 @@
+import asyncio
+import logging
+import math
+import random
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Any, Awaitable, Callable, Deque, Optional, Tuple, TypeVar
+import httpx
+from fastapi import HTTPException
+
+from services.providers.scheduler import SCHEDULED_TYPES, ProviderOverloaded, provider_host
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Upstream statuses worth another attempt: timeouts, rate limits, overload, 5xx
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504, 529}
+
+RETRYABLE = "retryable"
+FATAL = "fatal"
+
+# Recent successful call durations kept per function for hedge delays
+LATENCY_WINDOW = 200
+
+class CircuitOpen(HTTPException):
+    """The provider failed repeatedly; calls fail fast until it is probed again"""
+
+    def __init__(self, provider: str, retry_after: float):
+        seconds = max(1, math.ceil(retry_after))
+        super().__init__(
+            status_code=503,
+            detail=f"{provider} is unavailable (circuit open); retry after {seconds}s",
+            headers={"Retry-After": str(seconds)},
+        )
+
+@lru_cache(maxsize=1)
+def _transient_errors() -> Tuple[type, ...]:
+    errors = [httpx.TimeoutException, httpx.TransportError, asyncio.TimeoutError, ConnectionError]
+    try:
+        # Covers APITimeoutError too
+        from anthropic import APIConnectionError
+        errors.append(APIConnectionError)
+    except ImportError:
+        pass
+    return tuple(errors)
+
+def _cause(error: BaseException) -> BaseException:
+    # Providers wrap the original error: raise HTTPException(...) from e
+    if isinstance(error, HTTPException) and error.__cause__ is not None:
+        return error.__cause__
+    return error
+
+def _status_code(error: BaseException) -> Optional[int]:
+    # anthropic.APIStatusError has .status_code, httpx.HTTPStatusError has .response
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+def classify(error: BaseException) -> str:
+    """RETRYABLE for transient provider failures, FATAL for everything else"""
+    if isinstance(error, (ProviderOverloaded, CircuitOpen)):
+        # Local backpressure: retrying would only add load
+        return FATAL
+    cause = _cause(error)
+    if isinstance(cause, HTTPException):
+        return FATAL
+    if isinstance(cause, _transient_errors()):
+        return RETRYABLE
+    return RETRYABLE if _status_code(cause) in RETRYABLE_STATUS else FATAL
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds from the provider's Retry-After header, if it sent one"""
+    response = getattr(_cause(error), "response", None)
+    headers = getattr(response, "headers", None)
+    value = headers.get("retry-after") if headers is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+class ResiliencePolicy:
+    """Parsed "retry", "hedge" and "circuit_breaker" sections of an implementation_config
+
+        "retry": {"max_attempts": 3, "base_delay": 0.2, "max_delay": 5.0}
+        "hedge": {"delay": 0.5} or {"percentile": 95, "min_samples": 20}
+        "circuit_breaker": {"failure_threshold": 5, "reset_timeout": 30.0}
+
+    Every section is opt-in: without "retry" a call is attempted once (LLM calls
+    are billed and not idempotent), and without "circuit_breaker" it is never
+    failed fast. `true` enables a section with the defaults shown above.
+    """
+
+    __slots__ = (
+        "max_attempts", "base_delay", "max_delay",
+        "hedge", "hedge_delay", "hedge_percentile", "hedge_min_samples",
+        "failure_threshold", "reset_timeout",
+    )
+
+    def __init__(self, config: Dict[str, Any]):
+        retry = config.get("retry", False)
+        retry = retry if isinstance(retry, dict) else {"max_attempts": 3 if retry else 1}
+        self.max_attempts = int(retry.get("max_attempts", 3))
+        self.base_delay = float(retry.get("base_delay", 0.2))
+        self.max_delay = float(retry.get("max_delay", 5.0))
+        if self.max_attempts < 1:
+            raise ValueError("retry.max_attempts must be at least 1")
+
+        hedge = config.get("hedge", False)
+        self.hedge = bool(hedge)
+        hedge = hedge if isinstance(hedge, dict) else {}
+        self.hedge_delay = float(hedge["delay"]) if "delay" in hedge else None
+        self.hedge_percentile = float(hedge.get("percentile", 95))
+        self.hedge_min_samples = int(hedge.get("min_samples", 20))
+
+        breaker = config.get("circuit_breaker", False)
+        breaker = breaker if isinstance(breaker, dict) else ({} if breaker else {"failure_threshold": 0})
+        self.failure_threshold = int(breaker.get("failure_threshold", 5))
+        self.reset_timeout = float(breaker.get("reset_timeout", 30.0))
+
+    @classmethod
+    def from_config(cls, implementation_type: str, config: Dict[str, Any]) -> Optional["ResiliencePolicy"]:
+        if implementation_type not in SCHEDULED_TYPES:
+            return None
+        return cls(config)
+
+    def backoff(self, attempt: int, server_delay: Optional[float]) -> Optional[float]:
+        """Full-jitter exponential delay before the next attempt, or None to give up"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if server_delay is not None:
+            if server_delay > self.max_delay:
+                return None
+            delay = max(delay, server_delay)
+        return delay
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures -> half-open single probe -> closed"""
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def before_call(self, policy: ResiliencePolicy) -> bool:
+        """Raise CircuitOpen, or let the call through; returns whether it is the half-open probe"""
+        if self.state == "open":
+            remaining = policy.reset_timeout - (time.monotonic() - self.opened_at)
+            if remaining > 0:
+                raise CircuitOpen(self.provider, remaining)
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self.probing:
+                raise CircuitOpen(self.provider, 1)
+            self.probing = True
+            return True
+        return False
+
+    def record(self, outcome: str, policy: ResiliencePolicy, probe: bool = False) -> None:
+        if probe:
+            # Only the probe's outcome moves a half-open breaker; neutral lets the next call probe
+            self.probing = False
+            if outcome == "success":
+                self.state = "closed"
+                self.failures = 0
+            elif outcome == "failure":
+                self.failures += 1
+                self._open()
+            return
+        if self.state != "closed":
+            # Started before the breaker opened: too late to count either way
+            return
+        if outcome == "success":
+            self.failures = 0
+        elif outcome == "failure":
+            self.failures += 1
+            if self.failures >= policy.failure_threshold:
+                logger.warning("Circuit opened for %s after %d failures", self.provider, self.failures)
+                self._open()
+
+    def _open(self) -> None:
+        self.state = "open"
+        self.opened_at = time.monotonic()
+
+async def _hedged(attempt: Callable[[], Awaitable[T]], delay: float) -> Tuple[T, bool]:
+    """Run attempt(), starting a second copy if the first is slower than `delay`
+
+    Returns the first successful result and whether it came from the hedge.
+    """
+    tasks = [asyncio.ensure_future(attempt())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return tasks[0].result(), False
+        tasks.append(asyncio.ensure_future(attempt()))
+        pending = set(tasks)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result(), task is tasks[1]
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+class Resilience:
+    """Retries, hedging and per-provider circuit breakers around provider calls"""
+
+    def __init__(self):
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self._latencies: Dict[str, Deque[float]] = {}
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def breaker(self, implementation_type: str, config: Dict[str, Any]) -> CircuitBreaker:
+        key = (implementation_type, provider_host(implementation_type, config))
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            name = f"{implementation_type} {key[1]}".strip()
+            breaker = self._breakers[key] = CircuitBreaker(name)
+        return breaker
+
+    def hedge_delay(self, function_name: str, policy: ResiliencePolicy) -> Optional[float]:
+        if not policy.hedge:
+            return None
+        if policy.hedge_delay is not None:
+            return policy.hedge_delay
+        samples = self._latencies.get(function_name)
+        if not samples or len(samples) < policy.hedge_min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * policy.hedge_percentile / 100))
+        return ordered[index]
+
+    def _observe(self, function_name: str, seconds: float) -> None:
+        samples = self._latencies.get(function_name)
+        if samples is None:
+            samples = self._latencies[function_name] = deque(maxlen=LATENCY_WINDOW)
+        samples.append(seconds)
+
+    async def run(self, function, attempt: Callable[[], Awaitable[T]], hedge: bool = True) -> T:
+        """Call attempt() under the function's policy; other types call it once"""
+        policy: Optional[ResiliencePolicy] = function.resilience_policy
+        if policy is None:
+            return await attempt()
+        breaker = self.breaker(function.implementation_type, function.config) if policy.failure_threshold else None
+
+        for number in range(1, policy.max_attempts + 1):
+            probe = breaker.before_call(policy) if breaker else False
+            outcome = "neutral"
+            started = time.monotonic()
+            try:
+                delay = self.hedge_delay(function.name, policy) if hedge else None
+                if delay is None:
+                    result = await attempt()
+                else:
+                    self.hedges += 1
+                    result, hedge_won = await _hedged(attempt, delay)
+                    self.hedge_wins += hedge_won
+                outcome = "success"
+                self._observe(function.name, time.monotonic() - started)
+                return result
+            except Exception as e:
+                if classify(e) != RETRYABLE:
+                    raise
+                # Rate limiting means the provider is up, so it does not trip the breaker
+                if _status_code(_cause(e)) != 429:
+                    outcome = "failure"
+                wait = policy.backoff(number, retry_after(e)) if number < policy.max_attempts else None
+                if wait is None:
+                    raise
+                error = str(e.detail) if isinstance(e, HTTPException) else str(e)
+            finally:
+                if breaker:
+                    breaker.record(outcome, policy, probe)
+            self.retries += 1
+            logger.info("Retrying %s (attempt %d/%d) in %.2fs: %s", function.name, number + 1, policy.max_attempts, wait, error)
+            await asyncio.sleep(wait)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "circuit_breakers": {
+                breaker.provider: {"state": breaker.state, "failures": breaker.failures}
+                for breaker in self._breakers.values()
+            },
+        }
+
+resilience = Resilience()
@@ -0,0 +1,272 @@
+import asyncio
+import json
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any, AsyncIterator, Deque, List, Optional, Tuple
+from fastapi import HTTPException
+
+# Implementation types that call an external (or local GPU) model provider
+SCHEDULED_TYPES = ("anthropic", "perplexity", "ollama")
+
+# Per-provider defaults, overridable with e.g. OLLAMA_MAX_CONCURRENCY=2
+DEFAULT_LIMITS = {
+    "anthropic": {"max_concurrency": 64},
+    "perplexity": {"max_concurrency": 32},
+    "ollama": {"max_concurrency": 4},
+}
+DEFAULT_MAX_QUEUE = 256
+DEFAULT_MAX_QUEUE_WAIT = 30.0
+
+class ProviderOverloaded(HTTPException):
+    """The provider's wait queue is full or the wait would be too long"""
+
+    def __init__(self, provider: str, retry_after: float, reason: str):
+        seconds = max(1, math.ceil(retry_after))
+        super().__init__(
+            status_code=503,
+            detail=f"{provider} is overloaded ({reason}); retry after {seconds}s",
+            headers={"Retry-After": str(seconds)},
+        )
+
+def _env_number(name: str, default: Optional[float]) -> Optional[float]:
+    value = os.environ.get(name)
+    return float(value) if value else default
+
+class ProviderLimits:
+    """Limits for one provider, from DEFAULT_LIMITS and <TYPE>_* environment variables"""
+
+    __slots__ = ("max_concurrency", "requests_per_minute", "tokens_per_minute", "max_queue", "max_queue_wait")
+
+    def __init__(self, provider: str):
+        prefix = provider.upper()
+        defaults = DEFAULT_LIMITS.get(provider, {})
+        self.max_concurrency = int(_env_number(f"{prefix}_MAX_CONCURRENCY", defaults.get("max_concurrency", 16)))
+        self.requests_per_minute = _env_number(f"{prefix}_REQUESTS_PER_MINUTE", None)
+        self.tokens_per_minute = _env_number(f"{prefix}_TOKENS_PER_MINUTE", None)
+        self.max_queue = int(_env_number(f"{prefix}_MAX_QUEUE", DEFAULT_MAX_QUEUE))
+        self.max_queue_wait = _env_number(f"{prefix}_MAX_QUEUE_WAIT", DEFAULT_MAX_QUEUE_WAIT)
+
+class TokenBucket:
+    """Token bucket refilled continuously at `per_minute / 60` per second
+
+    reserve() always takes the tokens, letting the balance go negative, and
+    returns how long the caller must wait for the balance to cover them.
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        self._refill()
+        self.tokens -= amount
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self, amount: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+class _FunctionState:
+    __slots__ = ("active", "max_concurrency", "waiters", "requests")
+
+    def __init__(self):
+        self.active = 0
+        self.max_concurrency: Optional[int] = None
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.requests: Optional[TokenBucket] = None
+
+class ProviderScheduler:
+    """Concurrency slots, rate limits and a fair wait queue for one provider host
+
+    Waiters are queued per function and served round-robin, so one busy
+    function cannot starve the others of provider capacity.
+    """
+
+    def __init__(self, provider: str, limits: ProviderLimits):
+        self.provider = provider
+        self.limits = limits
+        self.active = 0
+        self.queued = 0
+        self.rejected = 0
+        self._functions: "OrderedDict[str, _FunctionState]" = OrderedDict()
+        self._requests = TokenBucket(limits.requests_per_minute) if limits.requests_per_minute else None
+        self._tokens = TokenBucket(limits.tokens_per_minute) if limits.tokens_per_minute else None
+        # Moving average of slot hold time, used to estimate Retry-After
+        self._avg_duration = 1.0
+
+    def _function(self, name: str, limits: Dict[str, Any]) -> _FunctionState:
+        state = self._functions.get(name)
+        if state is None:
+            state = self._functions[name] = _FunctionState()
+        state.max_concurrency = limits.get("max_concurrency")
+        rpm = limits.get("requests_per_minute")
+        if rpm and (state.requests is None or state.requests.capacity != rpm):
+            state.requests = TokenBucket(rpm)
+        elif not rpm:
+            state.requests = None
+        return state
+
+    def _can_start(self, state: _FunctionState) -> bool:
+        return state.max_concurrency is None or state.active < state.max_concurrency
+
+    def _retry_after(self) -> float:
+        return self._avg_duration * (self.queued + 1) / self.limits.max_concurrency
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiting functions in round-robin order"""
+        while self.active < self.limits.max_concurrency:
+            for name, state in list(self._functions.items()):
+                while state.waiters and state.waiters[0].done():
+                    state.waiters.popleft()
+                if state.waiters and self._can_start(state):
+                    waiter = state.waiters.popleft()
+                    self.queued -= 1
+                    self.active += 1
+                    state.active += 1
+                    waiter.set_result(None)
+                    # Served functions go to the back of the rotation
+                    self._functions.move_to_end(name)
+                    break
+            else:
+                return
+
+    async def _acquire_slot(self, state: _FunctionState) -> None:
+        if self.active < self.limits.max_concurrency and self._can_start(state) and not state.waiters:
+            self.active += 1
+            state.active += 1
+            return
+        if self.queued >= self.limits.max_queue:
+            self.rejected += 1
+            raise ProviderOverloaded(self.provider, self._retry_after(), "wait queue full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        state.waiters.append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.limits.max_queue_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as we gave up: hand the slot back
+                self._release_slot(state)
+            else:
+                waiter.cancel()
+                self.queued -= 1
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected += 1
+                raise ProviderOverloaded(self.provider, self._retry_after(), "queue wait timed out")
+            raise
+
+    def _release_slot(self, state: _FunctionState) -> None:
+        self.active -= 1
+        state.active -= 1
+        self._dispatch()
+
+    async def _wait_for_rate(self, state: _FunctionState, tokens: float) -> List[Tuple[TokenBucket, float]]:
+        """Reserve rate budget and sleep until it is available; returns the reservations"""
+        reserved = []
+        delay = 0.0
+        for bucket, amount in ((self._requests, 1), (state.requests, 1), (self._tokens, tokens)):
+            if bucket is not None:
+                delay = max(delay, bucket.reserve(amount))
+                reserved.append((bucket, amount))
+        if delay > self.limits.max_queue_wait:
+            self._refund(reserved)
+            self.rejected += 1
+            raise ProviderOverloaded(self.provider, delay, "rate limit")
+        if delay:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self._refund(reserved)
+                raise
+        return reserved
+
+    @staticmethod
+    def _refund(reserved: List[Tuple[TokenBucket, float]]) -> None:
+        for bucket, amount in reserved:
+            bucket.refund(amount)
+
+    @asynccontextmanager
+    async def slot(self, function_name: str, limits: Dict[str, Any], tokens: float) -> AsyncIterator[None]:
+        state = self._function(function_name, limits)
+        # Rate limits first: a call waiting for budget must not hold a slot others could use
+        reserved = await self._wait_for_rate(state, tokens)
+        try:
+            await self._acquire_slot(state)
+        except BaseException:
+            # The call never ran, so its budget goes back
+            self._refund(reserved)
+            raise
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            # Only the time the slot is held, which is what Retry-After estimates
+            self._avg_duration = 0.9 * self._avg_duration + 0.1 * (time.monotonic() - started)
+            self._release_slot(state)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "max_concurrency": self.limits.max_concurrency,
+            "functions": {
+                name: {"active": state.active, "queued": len(state.waiters)}
+                for name, state in self._functions.items()
+            },
+        }
+
+def estimate_tokens(config: Dict[str, Any], inputs: Dict[str, Any]) -> float:
+    """Rough token cost of a call (about 4 characters per token) for tokens-per-minute limits"""
+    prompt_chars = len(config.get("prompt_template", "")) + len(config.get("system_prompt", ""))
+    input_chars = len(json.dumps(inputs, default=str))
+    return (prompt_chars + input_chars) / 4 + config.get("max_tokens", 1000)
+
+def provider_host(implementation_type: str, config: Dict[str, Any]) -> str:
+    if implementation_type == "ollama":
+        return config.get("host") or os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+    return config.get("base_url") or ""
+
+class Scheduler:
+    """One ProviderScheduler per (provider, host)
+
+    Functions can add their own limits in implementation_config:
+        "limits": {"max_concurrency": 2, "requests_per_minute": 60}
+    """
+
+    def __init__(self):
+        self._providers: Dict[Tuple[str, str], ProviderScheduler] = {}
+
+    def provider(self, implementation_type: str, config: Dict[str, Any]) -> ProviderScheduler:
+        key = (implementation_type, provider_host(implementation_type, config))
+        scheduler = self._providers.get(key)
+        if scheduler is None:
+            name = f"{implementation_type} {key[1]}".strip()
+            scheduler = self._providers[key] = ProviderScheduler(name, ProviderLimits(implementation_type))
+        return scheduler
+
+    @asynccontextmanager
+    async def slot(self, function, inputs: Dict[str, Any]) -> AsyncIterator[None]:
+        """Hold a provider slot for the duration of one call; a no-op for other types"""
+        if function.implementation_type not in SCHEDULED_TYPES:
+            yield
+            return
+        provider = self.provider(function.implementation_type, function.config)
+        limits = function.config.get("limits") or {}
+        async with provider.slot(function.name, limits, estimate_tokens(function.config, inputs)):
+            yield
+
+    def stats(self) -> Dict[str, Any]:
+        return {scheduler.provider: scheduler.stats() for scheduler in self._providers.values()}
+
+scheduler = Scheduler()
@@ -1,49 +1,101 @@
+import hashlib
 import importlib.util
+import logging
+import os
 import sys
-from typing import Dict, Any, Callable
+import threading
+import types
+from typing import Dict, Any, Callable, Tuple
 from fastapi import HTTPException
 
+logger = logging.getLogger(__name__)
+
+# Cache key -> loaded function. Inline code is keyed by a hash of its source,
+# file-based code by path and modification time, so edits are picked up.
+_functions: Dict[Tuple, Callable[..., Any]] = {}
+_modules: Dict[Tuple, str] = {}
+_lock = threading.Lock()
+
+def _cache_key(config: Dict[str, Any]) -> Tuple:
+    function_name = config["function_name"]
+    if "file_path" in config:
+        file_path = os.path.abspath(config["file_path"])
+        return ("file", file_path, os.stat(file_path).st_mtime_ns, function_name)
+    if "code" in config:
+        digest = hashlib.sha256(config["code"].encode()).hexdigest()
+        return ("code", digest, function_name)
+    raise ValueError("Python function config must contain either 'file_path' or 'code'")
+
+def _module_name(key: Tuple) -> str:
+    # One module per source, so functions never overwrite each other's module
+    digest = hashlib.sha256(repr(key[:-1]).encode()).hexdigest()[:16]
+    return f"ai_factory_fn_{digest}"
+
+def _load(config: Dict[str, Any], key: Tuple) -> Callable[..., Any]:
+    module_name = _module_name(key)
+    if key[0] == "file":
+        logger.info("Compiling Python function from file: %s, function: %s", key[1], key[-1])
+        spec = importlib.util.spec_from_file_location(module_name, key[1])
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+    else:
+        # Inline code (less secure, careful with this!)
+        logger.info("Compiling Python function from code string, function: %s", key[-1])
+        module = types.ModuleType(module_name)
+        code = compile(config["code"], f"<{module_name}>", "exec")
+        sys.modules[module_name] = module
+        exec(code, module.__dict__)
+    _modules[key] = module_name
+    return getattr(module, key[-1])
+
+def load_python_function(config: Dict[str, Any]) -> Callable[..., Any]:
+    """Return the compiled function for a config, compiling it on first use"""
+    key = _cache_key(config)
+    function = _functions.get(key)
+    if function is None:
+        with _lock:
+            function = _functions.get(key)
+            if function is None:
+                function = _load(config, key)
+                _functions[key] = function
+                if key[0] == "file":
+                    # Forget compilations of earlier versions of the same file
+                    for stale in [k for k in _functions if k[:2] == key[:2] and k[2] != key[2]]:
+                        del _functions[stale]
+                        sys.modules.pop(_modules.pop(stale, ""), None)
+    return function
+
+def source_key(config: Dict[str, Any]) -> Tuple:
+    """Identify a config's source independent of file version and entry point"""
+    if "file_path" in config:
+        return ("file", os.path.abspath(config["file_path"]))
+    if "code" in config:
+        return ("code", hashlib.sha256(config["code"].encode()).hexdigest())
+    return ("none",)
+
+def invalidate_python_function(config: Dict[str, Any]) -> None:
+    """Drop every cached compilation of a config's source, e.g. after an admin update"""
+    source = source_key(config)
+    with _lock:
+        for key in [key for key in _functions if key[:2] == source]:
+            del _functions[key]
+            sys.modules.pop(_modules.pop(key, ""), None)
+
+def prepare_python_config(config: Dict[str, Any], input_schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Compile the function when it is loaded so the first call pays no import cost"""
+    try:
+        load_python_function(config)
+    except Exception as e:
+        # Reported again, with a traceback, when the function is called
+        logger.warning("Could not precompile Python function: %s", e)
+    return config
+
 def execute_python_function(config: Dict[str, Any], inputs: Dict[str, Any]) -> Dict[str, Any]:
     """Execute Python code function with the given inputs"""
     try:
-        # Option 1: Execute from a file path
-        if "file_path" in config:
-            file_path = config["file_path"]
-            function_name = config["function_name"]
-            
-            print(f"Executing Python function from file: {file_path}, function: {function_name}")
-            
-            # Import the module dynamically
-            spec = importlib.util.spec_from_file_location("dynamic_module", file_path)
-            module = importlib.util.module_from_spec(spec)
-            sys.modules["dynamic_module"] = module
-            spec.loader.exec_module(module)
-            
-            # Get and call the function
-            function = getattr(module, function_name)
-            return function(**inputs)
-            
-        # Option 2: Execute from code string (less secure, careful with this!)
-        elif "code" in config:
-            code = config["code"]
-            function_name = config["function_name"]
-            
-            print(f"Executing Python function from code string, function: {function_name}")
-            
-            # Create a local namespace
-            local_namespace = {}
-            
-            # Execute the code in the namespace
-            exec(code, {}, local_namespace)
-            
-            # Get and call the function from the namespace
-            function = local_namespace[function_name]
-            return function(**inputs)
-        else:
-            raise ValueError("Python function config must contain either 'file_path' or 'code'")
+        function = load_python_function(config)
+        return function(**inputs)
     except Exception as e:
-        import traceback
-        error_details = traceback.format_exc()
-        print(f"Python execution error: {str(e)}")
-        print(f"Traceback: {error_details}")
-        raise HTTPException(status_code=500, detail=f"Python execution error: {str(e)}")
\ No newline at end of file
+        logger.warning("Python execution error: %s", e, exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Python execution error: {str(e)}")
@@ -0,0 +1,274 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, Optional, Tuple
+from fastapi import HTTPException
+
+from services.python_code import (
+    execute_python_function,
+    invalidate_python_function,
+    load_python_function,
+    prepare_python_config,
+    source_key,
+)
+
+logger = logging.getLogger(__name__)
+
+EXECUTION_BACKENDS = ("inline", "thread", "process")
+
+# Default backend for python_code functions without an "execution.backend" setting:
+#   inline  - run in the event loop's default executor (frees the loop; no timeout of its own)
+#   thread  - run in a shared thread pool (frees the loop; still bound by the GIL)
+#   process - run in a warm process pool (CPU-bound code scales across cores)
+PYTHON_EXECUTION_BACKEND = os.environ.get("PYTHON_EXECUTION_BACKEND", "inline")
+PYTHON_THREAD_WORKERS = int(os.environ.get("PYTHON_THREAD_WORKERS", "0")) or None
+PYTHON_PROCESS_WORKERS = int(os.environ.get("PYTHON_PROCESS_WORKERS", "0")) or None
+
+_thread_pool: Optional[ThreadPoolExecutor] = None
+_process_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+# Process-backed configs compiled by every worker when the pool starts; guarded by
+# _warm_lock, as the registry's sync thread prepares and releases functions
+_warm_configs: Dict[Tuple, Dict[str, Any]] = {}
+_warm_lock = threading.Lock()
+
+class _Slots(asyncio.Semaphore):
+    """Semaphore counting its holders, so a released function's entry outlives them"""
+
+    def __init__(self, key: Tuple, limit: int):
+        super().__init__(limit)
+        self.key = key
+        self.held = 0
+        # Its function was released: drop the entry once the last holder is done
+        self.retired = False
+
+    async def acquire(self) -> bool:
+        await super().acquire()
+        self.held += 1
+        return True
+
+    def release(self) -> None:
+        self.held -= 1
+        super().release()
+        if self.retired and self.held == 0 and _semaphores.get(self.key) is self:
+            del _semaphores[self.key]
+
+# (source, max_concurrency) -> semaphore bounding concurrent calls of one function.
+# Only touched on _semaphore_loop.
+_semaphores: Dict[Tuple, _Slots] = {}
+_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+class PythonWorkerError(Exception):
+    """Picklable stand-in for an exception raised inside a worker process"""
+
+def _warm_worker(configs: List[Dict[str, Any]]) -> None:
+    for config in configs:
+        try:
+            load_python_function(config)
+        except Exception:
+            # Surfaces on the first call instead
+            pass
+
+def _execute_in_worker(config: Dict[str, Any], inputs: Dict[str, Any]) -> Any:
+    """Process-pool entry point; uses the worker's own compiled-function cache"""
+    try:
+        return load_python_function(config)(**inputs)
+    except Exception as e:
+        # User exceptions may not survive pickling back to the parent
+        raise PythonWorkerError(f"{type(e).__name__}: {str(e)}") from None
+
+def _get_thread_pool() -> ThreadPoolExecutor:
+    global _thread_pool
+    with _pool_lock:
+        if _thread_pool is None:
+            _thread_pool = ThreadPoolExecutor(
+                max_workers=PYTHON_THREAD_WORKERS, thread_name_prefix="python-code"
+            )
+        return _thread_pool
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is None:
+            # spawn: forking a process that runs an event loop and threads is unsafe
+            _process_pool = ProcessPoolExecutor(
+                max_workers=PYTHON_PROCESS_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_worker,
+                initargs=(_warm_config_list(),),
+            )
+        return _process_pool
+
+def _warm_config_list() -> List[Dict[str, Any]]:
+    with _warm_lock:
+        return list(_warm_configs.values())
+
+def _noop() -> None:
+    return None
+
+def start_process_pool() -> None:
+    """Spawn the process pool now if any loaded function uses it, so calls find warm workers"""
+    if not _warm_config_list():
+        return
+    pool = _get_process_pool()
+    for _ in range(PYTHON_PROCESS_WORKERS or os.cpu_count() or 1):
+        pool.submit(_noop)
+
+def release_python_function(config: Dict[str, Any]) -> None:
+    """Forget a replaced or removed function: its compiled code, warm-up entry and semaphores
+
+    Called from the registry's sync thread as well as the loop; semaphores are
+    retired on their own loop, and kept until their in-flight holders release them.
+    """
+    invalidate_python_function(config)
+    key = source_key(config)
+    with _warm_lock:
+        _warm_configs.pop(key, None)
+    loop = _semaphore_loop
+    if loop is not None and not loop.is_closed():
+        try:
+            loop.call_soon_threadsafe(_retire_semaphores, key)
+            return
+        except RuntimeError:
+            pass
+    # No loop uses the semaphores any more
+    _retire_semaphores(key)
+
+def _retire_semaphores(key: Tuple) -> None:
+    for semaphore in [semaphore for (source, _), semaphore in _semaphores.items() if source == key]:
+        if semaphore.held:
+            semaphore.retired = True
+        else:
+            del _semaphores[semaphore.key]
+
+def _semaphore(config: Dict[str, Any], limit: int) -> _Slots:
+    global _semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _semaphore_loop is not loop:
+        # Semaphores are bound to the loop that first used them; start afresh
+        _semaphores.clear()
+        _semaphore_loop = loop
+    key = (source_key(config), limit)
+    semaphore = _semaphores.get(key)
+    if semaphore is None:
+        semaphore = _semaphores[key] = _Slots(key, limit)
+    # Loaded again while calls of the released version still run: they share the limit
+    semaphore.retired = False
+    return semaphore
+
+def execution_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    execution = config.get("execution") or {}
+    return {
+        "backend": execution.get("backend", PYTHON_EXECUTION_BACKEND),
+        "max_concurrency": execution.get("max_concurrency"),
+        "timeout": execution.get("timeout"),
+    }
+
+def prepare_python_execution(config: Dict[str, Any], input_schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate the execution settings and precompile the function when it is loaded"""
+    backend = execution_settings(config)["backend"]
+    if backend not in EXECUTION_BACKENDS:
+        raise ValueError(f"Unknown python execution backend: {backend}")
+    if backend == "process":
+        # Workers started from now on compile this function up front
+        with _warm_lock:
+            _warm_configs[source_key(config)] = config
+    return prepare_python_config(config, input_schema)
+
+async def run_python_function(config: Dict[str, Any], inputs: Dict[str, Any]) -> Any:
+    """Execute a python_code function on its configured backend
+
+    implementation_config may contain:
+        "execution": {"backend": "inline" | "thread" | "process",
+                      "max_concurrency": 4, "timeout": 30}
+    The timeout applies to the thread and process backends. A timed-out (or
+    cancelled, e.g. by a pipeline node timeout) call is abandoned, not
+    interrupted: its worker finishes the call in the background and holds its
+    max_concurrency slot until then.
+    """
+    settings = execution_settings(config)
+    backend = settings["backend"]
+    limit = settings["max_concurrency"]
+    timeout = settings["timeout"]
+
+    if backend not in EXECUTION_BACKENDS:
+        raise HTTPException(status_code=500, detail=f"Unknown python execution backend: {backend}")
+    semaphore = _semaphore(config, int(limit)) if limit else None
+    if semaphore is not None:
+        await semaphore.acquire()
+
+    if backend == "inline":
+        loop = asyncio.get_running_loop()
+        # Off the loop thread, so other requests and pipeline nodes keep running
+        call = functools.partial(contextvars.copy_context().run, execute_python_function, config, inputs)
+        try:
+            work = loop.run_in_executor(None, call)
+        except BaseException:
+            if semaphore is not None:
+                semaphore.release()
+            raise
+        work.add_done_callback(functools.partial(_finished, semaphore))
+        # Shielded: a caller that stops waiting leaves the call (and its slot) to finish
+        return await asyncio.shield(work)
+
+    try:
+        if backend == "thread":
+            work = _get_thread_pool().submit(execute_python_function, config, inputs)
+        else:
+            work = _get_process_pool().submit(_execute_in_worker, config, inputs)
+    except BaseException:
+        if semaphore is not None:
+            semaphore.release()
+        raise
+
+    if semaphore is not None:
+        # The slot is held until the worker is done, even when the caller stops waiting
+        # (a timed-out call keeps running), so max_concurrency bounds the actual work
+        loop = asyncio.get_running_loop()
+        work.add_done_callback(lambda _: _release_threadsafe(loop, semaphore))
+
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(work), timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"Python execution timed out after {timeout}s")
+    except PythonWorkerError as e:
+        logger.warning("Python execution error: %s", e)
+        raise HTTPException(status_code=500, detail=f"Python execution error: {str(e)}")
+    except BrokenProcessPool:
+        # A worker died (e.g. killed by the OS); start a fresh pool next time
+        shutdown_python_executors(wait=False, threads=False)
+        raise HTTPException(status_code=500, detail="Python execution error: worker process died")
+
+def _finished(semaphore: Optional[_Slots], work: asyncio.Future) -> None:
+    if not work.cancelled():
+        # Retrieved, so an abandoned call's error is not logged as unhandled
+        work.exception()
+    if semaphore is not None:
+        semaphore.release()
+
+def _release_threadsafe(loop: asyncio.AbstractEventLoop, semaphore: _Slots) -> None:
+    # Done callbacks run in the worker's thread; the semaphore belongs to the loop
+    try:
+        loop.call_soon_threadsafe(semaphore.release)
+    except RuntimeError:
+        # The loop has closed, and the semaphore with it
+        pass
+
+def shutdown_python_executors(wait: bool = True, threads: bool = True) -> None:
+    global _thread_pool, _process_pool
+    with _pool_lock:
+        process_pool, _process_pool = _process_pool, None
+        thread_pool = None
+        if threads:
+            thread_pool, _thread_pool = _thread_pool, None
+    if process_pool is not None:
+        process_pool.shutdown(wait=wait, cancel_futures=True)
+    if thread_pool is not None:
+        thread_pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,363 @@
+import asyncio
+import hashlib
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Any, Callable, Iterable, Optional, Set
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import FunctionConfig, ConfigChange
+from services.providers.anthropic import execute_anthropic_function, stream_anthropic_function
+from services.providers.perplexity import execute_perplexity_function, stream_perplexity_function
+from services.providers.ollama import execute_ollama_function, stream_ollama_function
+from services.database_query import (
+    PAGE_TOKEN_INPUT,
+    execute_database_batch,
+    execute_database_function,
+    prepare_database_config,
+    stream_database_function,
+)
+from services.cache import CacheSettings
+from services.metrics import metrics
+from services.providers.resilience import ResiliencePolicy
+from services.pipeline import execute_pipeline, prepare_pipeline_config
+from services.singleflight import should_coalesce
+from services.python_executor import prepare_python_execution, release_python_function, run_python_function
+from utils.json_schema import CompiledSchema, SchemaError, compile_schema
+from utils.validation import CompiledTemplate, compile_template
+
+logger = logging.getLogger(__name__)
+
+# Implementation type -> handler(config, inputs)
+HANDLERS: Dict[str, Callable[..., Any]] = {
+    "anthropic": execute_anthropic_function,
+    "perplexity": execute_perplexity_function,
+    "ollama": execute_ollama_function,
+    "database_query": execute_database_function,
+    "python_code": run_python_function,
+    "pipeline": execute_pipeline,
+}
+
+# Implementation type -> batch(config, inputs_list) running a whole batch at once,
+# or returning None when the function has to run item by item
+BATCH_HANDLERS: Dict[str, Callable[..., Any]] = {
+    "database_query": execute_database_batch,
+}
+
+# Implementation type -> streamer(config, inputs) yielding NDJSON lines,
+# used when the function's config sets "stream": true
+RESULT_STREAMERS: Dict[str, Callable[..., Any]] = {
+    "database_query": stream_database_function,
+}
+
+# Implementation type -> streamer(config, inputs) yielding text chunks as the
+# provider generates them, used by the /stream endpoint
+TOKEN_STREAMERS: Dict[str, Callable[..., Any]] = {
+    "anthropic": stream_anthropic_function,
+    "perplexity": stream_perplexity_function,
+    "ollama": stream_ollama_function,
+}
+
+# Implementation type -> prepare(config, input_schema) -> resolved config, run at load
+PREPARERS: Dict[str, Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]] = {
+    "database_query": prepare_database_config,
+    "python_code": prepare_python_execution,
+    "pipeline": prepare_pipeline_config,
+}
+
+# Implementation type -> release(config), run when a compiled function is replaced or removed
+RELEASERS: Dict[str, Callable[[Dict[str, Any]], None]] = {
+    "python_code": release_python_function,
+}
+
+# Seconds between checks of the shared config version
+CONFIG_POLL_INTERVAL = float(os.environ.get("CONFIG_POLL_INTERVAL", "1.0"))
+# ConfigChange ids are allocated before commit, so with concurrent writers (e.g. on
+# Postgres) a lower id can become visible after a higher one. Ids skipped over are
+# re-checked for this many seconds; ids of rolled-back writes never appear.
+CONFIG_GAP_TIMEOUT = float(os.environ.get("CONFIG_GAP_TIMEOUT", "60"))
+# Ids below the version checked for such gaps when the registry is loaded
+CONFIG_GAP_SCAN = 1000
+
+# Inputs read by the runtime itself rather than the function, always accepted
+# even when the input schema sets additionalProperties: false
+RESERVED_INPUTS = ("api_key", PAGE_TOKEN_INPUT)
+
+# Config keys that hold str.format templates rendered on every call
+TEMPLATE_KEYS = ("prompt_template",)
+
+class CompiledFunction:
+    """A function configuration parsed and resolved once, ready to execute"""
+
+    __slots__ = (
+        "id", "name", "implementation_type", "config", "input_schema", "config_hash",
+        "handler", "blocking", "batch_handler", "result_streamer", "token_streamer", "cache_settings", "coalesce",
+        "resilience_policy", "templates", "validator", "error",
+    )
+
+    def __init__(self, function: FunctionConfig):
+        self.id = function.id
+        self.name = function.name
+        self.implementation_type = function.implementation_type
+        # Identifies this exact configuration across workers and restarts
+        self.config_hash = hashlib.sha256("\0".join([
+            function.implementation_type or "",
+            function.implementation_config or "",
+            function.input_schema or "",
+        ]).encode()).hexdigest()[:16]
+        self.config: Dict[str, Any] = {}
+        self.input_schema: Dict[str, Any] = {}
+        self.handler: Optional[Callable[..., Any]] = HANDLERS.get(function.implementation_type)
+        # Sync handlers (database_query) run in a thread so they never block the loop
+        self.blocking = self.handler is not None and not inspect.iscoroutinefunction(self.handler)
+        self.batch_handler: Optional[Callable[..., Any]] = BATCH_HANDLERS.get(function.implementation_type)
+        self.result_streamer: Optional[Callable[..., Any]] = None
+        self.token_streamer: Optional[Callable[..., Any]] = None
+        self.cache_settings: Optional[CacheSettings] = None
+        self.coalesce = False
+        self.resilience_policy: Optional[ResiliencePolicy] = None
+        self.templates: Dict[str, CompiledTemplate] = {}
+        self.validator: Optional[CompiledSchema] = None
+        # Deferred error, raised when the function is executed
+        self.error: Optional[str] = None
+
+        try:
+            self.config = json.loads(function.implementation_config)
+        except (TypeError, json.JSONDecodeError) as e:
+            self.error = f"Invalid JSON in function implementation config: {str(e)}"
+            return
+
+        try:
+            self.input_schema = json.loads(function.input_schema or "{}")
+        except json.JSONDecodeError:
+            self.input_schema = {}
+
+        try:
+            self.validator = compile_schema(json.dumps(self.input_schema, sort_keys=True), RESERVED_INPUTS)
+        except SchemaError as e:
+            self.error = f"Invalid input_schema: {str(e)}"
+            return
+
+        # Tool calls return structured input rather than text, so they are not streamed
+        if not self.config.get("tools"):
+            self.token_streamer = TOKEN_STREAMERS.get(self.implementation_type)
+        self.coalesce = should_coalesce(self.implementation_type, self.config)
+        if self.config.get("stream"):
+            self.result_streamer = RESULT_STREAMERS.get(self.implementation_type)
+
+        try:
+            self.cache_settings = CacheSettings.from_config(self.config)
+        except (TypeError, ValueError) as e:
+            self.error = f"Invalid cache config: {str(e)}"
+            return
+
+        try:
+            self.resilience_policy = ResiliencePolicy.from_config(self.implementation_type, self.config)
+        except (TypeError, ValueError) as e:
+            self.error = f"Invalid retry/hedge/circuit_breaker config: {str(e)}"
+            return
+
+        prepare = PREPARERS.get(self.implementation_type)
+        if prepare:
+            try:
+                self.config = prepare(self.config, self.input_schema)
+            except ValueError as e:
+                self.error = f"Invalid {self.implementation_type} config: {str(e)}"
+                return
+
+        for key in TEMPLATE_KEYS:
+            template = self.config.get(key)
+            if isinstance(template, str):
+                try:
+                    self.templates[key] = compile_template(template)
+                except ValueError:
+                    # Malformed templates keep failing at call time, as before
+                    pass
+
+class FunctionRegistry:
+    """Process-wide map of active function name -> CompiledFunction"""
+
+    def __init__(self):
+        self._functions: Dict[str, CompiledFunction] = {}
+        # Guards the version bookkeeping and entry swaps; never held while compiling
+        self._lock = threading.Lock()
+        # Serializes installs (release, compile, swap), which may take a while
+        self._install_lock = threading.Lock()
+        # name -> ticket of its newest install, so a row read earlier never replaces one read later
+        self._tickets: Dict[str, int] = {}
+        self._last_ticket = 0
+        # Highest ConfigChange id reflected in this process
+        self.version = 0
+        # Ids below the version not seen yet (possibly uncommitted) -> when first missed
+        self._gaps: Dict[int, float] = {}
+        # Ids above the version already reflected: this worker's own writes
+        self._applied: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._functions)
+
+    def get(self, name: str) -> Optional[CompiledFunction]:
+        return self._functions.get(name)
+
+    def load(self, db: Session) -> int:
+        """Replace the registry contents with every active function in the database"""
+        # Read the version first: a write racing with the load is replayed by sync()
+        version = db.query(func.max(ConfigChange.id)).scalar() or 0
+        recent = {
+            change_id for (change_id,) in
+            db.query(ConfigChange.id).filter(ConfigChange.id > version - CONFIG_GAP_SCAN)
+        }
+        ticket = self._ticket()
+        functions = db.query(FunctionConfig).filter(FunctionConfig.is_active.is_(True)).all()
+        with self._install_lock:
+            for name in list(self._functions):
+                self._install(name, None, ticket)
+            for function in functions:
+                self._install(function.name, function, ticket)
+        with self._lock:
+            self.version = version
+            self._applied.clear()
+            now = time.monotonic()
+            self._gaps = {
+                change_id: now
+                for change_id in range(max(1, version - CONFIG_GAP_SCAN + 1), version)
+                if change_id not in recent
+            }
+        return len(self._functions)
+
+    def sync(self, db: Session) -> int:
+        """Reload only the functions changed since this process last synced
+
+        The check is a primary-key scan over config_changes (ids above the
+        version, plus any recent gaps below it), which returns no rows unless
+        some other worker wrote a config since our last sync.
+        """
+        with self._lock:
+            version, gaps = self.version, list(self._gaps)
+        condition = ConfigChange.id > version
+        if gaps:
+            condition = or_(condition, ConfigChange.id.in_(gaps))
+        changes = (
+            db.query(ConfigChange.id, ConfigChange.function_name)
+            .filter(condition)
+            .order_by(ConfigChange.id)
+            .all()
+        )
+
+        with self._lock:
+            seen = {change.id for change in changes}
+            names = {change.function_name for change in changes if change.id not in self._applied}
+            top = max(seen | {self.version})
+            now = time.monotonic()
+            for change_id in range(self.version + 1, top):
+                if change_id not in seen and change_id not in self._applied:
+                    self._gaps[change_id] = now
+            for change_id in seen:
+                self._gaps.pop(change_id, None)
+            for change_id, missed in list(self._gaps.items()):
+                if now - missed > CONFIG_GAP_TIMEOUT:
+                    del self._gaps[change_id]
+            self._applied = {change_id for change_id in self._applied if change_id > top}
+            self.version = top
+            if not names:
+                return 0
+        ticket = self._ticket()
+        functions = db.query(FunctionConfig).filter(FunctionConfig.name.in_(names)).all()
+        rows = {function.name: function for function in functions}
+        with self._install_lock:
+            for name in names:
+                self._install(name, rows.get(name), ticket)
+        return len(names)
+
+    def _mark_applied(self, changes: Iterable[int]) -> None:
+        with self._lock:
+            for change_id in changes:
+                if change_id > self.version:
+                    self._applied.add(change_id)
+                else:
+                    self._gaps.pop(change_id, None)
+
+    def refresh(self, function: FunctionConfig, changes: Iterable[int] = ()) -> None:
+        """Recompile a single function after it was created or updated
+
+        `changes` are the ConfigChange ids of the write, which sync() then skips.
+        Compiling may run user code, so the admin routes call this in a thread.
+        """
+        ticket = self._ticket()
+        self._mark_applied(changes)
+        with self._install_lock:
+            # Drop any entry registered under a previous name
+            for name, existing in list(self._functions.items()):
+                if existing.id == function.id and name != function.name:
+                    self._install(name, None, ticket)
+            self._install(function.name, function, ticket)
+
+    def invalidate(self, name: str, changes: Iterable[int] = ()) -> None:
+        """Remove a function, e.g. after it was deleted"""
+        ticket = self._ticket()
+        self._mark_applied(changes)
+        with self._install_lock:
+            self._install(name, None, ticket)
+
+    def clear(self) -> None:
+        ticket = self._ticket()
+        with self._install_lock:
+            for name in list(self._functions):
+                self._install(name, None, ticket)
+
+    def _ticket(self) -> int:
+        # Taken before reading the rows to install, so installs apply in read order
+        with self._lock:
+            self._last_ticket += 1
+            return self._last_ticket
+
+    def _install(self, name: str, function: Optional[FunctionConfig], ticket: int) -> None:
+        """Release the current entry for `name`, then compile and swap in its replacement
+
+        Caller holds _install_lock; _lock is only taken for the swap, so a long
+        compile never holds up sync() bookkeeping or the event loop.
+        """
+        if ticket < self._tickets.get(name, 0):
+            # A newer read of this function was installed already
+            return
+        self._tickets[name] = ticket
+        old = self._functions.get(name)
+        if old is not None and not old.error:
+            release = RELEASERS.get(old.implementation_type)
+            if release:
+                release(old.config)
+        compiled = None
+        if function is not None and function.is_active:
+            labels = {"function": name, "type": function.implementation_type}
+            with metrics.stage("compile", labels):
+                compiled = CompiledFunction(function)
+        with self._lock:
+            if compiled is None:
+                self._functions.pop(name, None)
+            else:
+                self._functions[name] = compiled
+
+registry = FunctionRegistry()
+
+def _sync_registry() -> int:
+    db = SessionLocal()
+    try:
+        return registry.sync(db)
+    finally:
+        db.close()
+
+async def watch_config_changes(interval: float = CONFIG_POLL_INTERVAL):
+    """Background task keeping this worker's registry in step with other workers"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            changed = await asyncio.to_thread(_sync_registry)
+            if changed:
+                logger.info("Reloaded %d changed function(s), config version %d", changed, registry.version)
+        except Exception as e:
+            logger.error("Config sync failed: %s", e)
@@ -0,0 +1,56 @@
+import asyncio
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict
+
+# Implementation types coalesced unless a function sets "coalesce": false.
+# Others (database writes, python code with side effects) must opt in.
+COALESCE_BY_DEFAULT = ("anthropic", "perplexity", "ollama")
+
+def should_coalesce(implementation_type: str, config: Dict[str, Any]) -> bool:
+    return bool(config.get("coalesce", implementation_type in COALESCE_BY_DEFAULT))
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers with the same key
+
+    The shared call runs as its own task, so a caller that disconnects does not
+    cancel it for the others still waiting.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self.executed: Dict[str, int] = defaultdict(int)
+        self.coalesced: Dict[str, int] = defaultdict(int)
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, group: str, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced[group] += 1
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(factory())
+        self._calls[key] = task
+        self.executed[group] += 1
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every waiter went away
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        groups = sorted(set(self.executed) | set(self.coalesced))
+        return {
+            "in_flight": len(self._calls),
+            "functions": {
+                group: {"executed": self.executed[group], "coalesced": self.coalesced[group]}
+                for group in groups
+            },
+        }
+
+singleflight = SingleFlight()
@@ -0,0 +1,234 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Deque, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Where finished spans go, as OTLP/JSON:
+#   file:/var/log/ai-factory/spans.jsonl  - one ExportTraceServiceRequest per line
+#   http://collector:4318                 - POSTed to <url>/v1/traces
+# Unset: tracing is off and spans cost one context-variable read.
+TRACE_EXPORT = os.environ.get("TRACE_EXPORT", "")
+# Fraction of traces recorded; the decision is made once, at the root span
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_EXPORT_INTERVAL = float(os.environ.get("TRACE_EXPORT_INTERVAL", "1.0"))
+# Finished spans held for export; the oldest are dropped beyond this
+TRACE_BUFFER_SIZE = int(os.environ.get("TRACE_BUFFER_SIZE", "10000"))
+SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "ai-factory")
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start", "end", "attributes", "status", "message")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], kind: int, attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.time_ns()
+        self.end = 0
+        self.attributes = attributes
+        self.status = STATUS_OK
+        self.message = ""
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": self.status, "message": self.message} if self.status == STATUS_ERROR else {"code": self.status},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """(trace_id, parent span_id, sampled) from a W3C traceparent header"""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+# The innermost open span; False marks a trace that was sampled out
+_current: ContextVar[Any] = ContextVar("trace_span", default=None)
+
+class Tracer:
+    """Records spans into a buffer that export() drains to a file or an OTLP collector"""
+
+    def __init__(self, export: str = TRACE_EXPORT, sample_rate: float = TRACE_SAMPLE_RATE):
+        self.export_to = export
+        self.enabled = bool(export)
+        self.sample_rate = sample_rate
+        self._finished: Deque[Span] = deque(maxlen=TRACE_BUFFER_SIZE)
+        self._lock = threading.Lock()
+
+    def current(self) -> Optional[Span]:
+        span = _current.get()
+        return span or None
+
+    @contextmanager
+    def span(
+        self,
+        name: str,
+        attributes: Optional[Dict[str, Any]] = None,
+        kind: int = SPAN_KIND_INTERNAL,
+        traceparent: Optional[str] = None,
+    ) -> Iterator[Optional[Span]]:
+        """Open a span as a child of the current one; yields None when not recording"""
+        if not self.enabled:
+            yield None
+            return
+        parent = _current.get()
+        if parent is False:
+            # Inside a sampled-out trace
+            yield None
+            return
+        if parent is None:
+            remote = parse_traceparent(traceparent)
+            if remote:
+                trace_id, parent_id, sampled = remote
+            else:
+                trace_id, parent_id = f"{random.getrandbits(128):032x}", None
+                sampled = random.random() < self.sample_rate
+            if not sampled:
+                token = _current.set(False)
+                try:
+                    yield None
+                finally:
+                    _current.reset(token)
+                return
+        else:
+            trace_id, parent_id = parent.trace_id, parent.span_id
+
+        span = Span(name, trace_id, parent_id, kind, dict(attributes or {}))
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = STATUS_ERROR
+            span.message = str(getattr(e, "detail", None) or e) or type(e).__name__
+            raise
+        finally:
+            span.end = time.time_ns()
+            try:
+                _current.reset(token)
+            except ValueError:
+                # Closed from another context (e.g. a finalized generator)
+                pass
+            with self._lock:
+                self._finished.append(span)
+
+    def drain(self) -> List[Span]:
+        with self._lock:
+            spans = list(self._finished)
+            self._finished.clear()
+        return spans
+
+    def _payload(self, spans: List[Span]) -> Dict[str, Any]:
+        return {"resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": SERVICE_NAME, "process.pid": os.getpid()})},
+            "scopeSpans": [{"scope": {"name": "ai-factory"}, "spans": [span.to_otlp() for span in spans]}],
+        }]}
+
+    def export(self) -> int:
+        """Write buffered spans to the configured destination; returns how many"""
+        spans = self.drain()
+        if not spans:
+            return 0
+        payload = self._payload(spans)
+        if self.export_to.startswith("file:"):
+            path = self.export_to[len("file:"):]
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "a") as f:
+                f.write(json.dumps(payload) + "\n")
+        else:
+            import httpx
+            response = httpx.post(self.export_to.rstrip("/") + "/v1/traces", json=payload, timeout=10.0)
+            response.raise_for_status()
+        return len(spans)
+
+tracer = Tracer()
+
+async def export_spans(interval: float = TRACE_EXPORT_INTERVAL):
+    """Background task exporting finished spans when TRACE_EXPORT is set"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(tracer.export)
+        except Exception as e:
+            logger.warning("Could not export spans: %s", e)
+
+class TracingMiddleware:
+    """ASGI middleware opening the root (server) span of each HTTP request
+
+    Continues a trace from an incoming W3C traceparent header and returns the
+    trace id in X-Trace-Id, so a slow call can be matched to its profile.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        traceparent = headers.get(b"traceparent", b"").decode() or None
+        attributes = {"http.request.method": scope["method"], "url.path": scope["path"]}
+        with tracer.span(f"{scope['method']} {scope['path']}", attributes, SPAN_KIND_SERVER, traceparent) as span:
+            if span is None:
+                await self.app(scope, receive, send)
+                return
+
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    span.set("http.response.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.status = STATUS_ERROR
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [(b"x-trace-id", span.trace_id.encode())]
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace)
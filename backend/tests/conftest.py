@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# Point the app at a throwaway database before any test module imports it
+_db_dir = tempfile.mkdtemp(prefix="ai_factory_test_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_db_dir, 'test.db')}")
+os.environ.setdefault("RESPONSE_CACHE_PATH", os.path.join(_db_dir, "response_cache.db"))
@@ -16,4 +16,556 @@ def test_root():
 # def test_list_functions():
 #     response = client.get("/api/admin/functions")
 #     assert response.status_code == 200
-#     assert isinstance(response.json(), list)
\ No newline at end of file
+#     assert isinstance(response.json(), list)
+def _function_form(name, code, **overrides):
+    form = {
+        "name": name,
+        "description": "Test function",
+        "input_schema": json.dumps({"type": "object", "properties": {"x": {"type": "integer"}}}),
+        "implementation_type": "python_code",
+        "implementation_config": json.dumps({"code": code, "function_name": "run"}),
+        "is_active": "true",
+    }
+    form.update(overrides)
+    return form
+
+def test_registry_follows_admin_writes():
+    with TestClient(app) as client:
+        created = client.post(
+            "/api/admin/functions",
+            data=_function_form("double", "def run(x):\n    return {'value': x * 2}"),
+        ).json()
+        assert created["success"]
+        function_id = created["function_id"]
+
+        response = client.post("/api/functions/double", json={"inputs": {"x": 4}})
+        assert response.json()["result"] == {"value": 8}
+
+        client.put(
+            f"/api/admin/functions/{function_id}",
+            data=_function_form("double", "def run(x):\n    return {'value': x * 3}"),
+        )
+        response = client.post("/api/functions/double", json={"inputs": {"x": 4}})
+        assert response.json()["result"] == {"value": 12}
+
+        client.delete(f"/api/admin/functions/{function_id}")
+        response = client.post("/api/functions/double", json={"inputs": {"x": 4}})
+        assert response.status_code == 404
+
+def test_registry_syncs_writes_from_other_workers():
+    from database import SessionLocal
+    from models import FunctionConfig, ConfigChange
+    from services.registry import registry
+
+    with TestClient(app) as client:
+        version = registry.version
+        # Simulate another worker writing the config directly
+        db = SessionLocal()
+        db.add(FunctionConfig(
+            name="triple",
+            description="Test function",
+            input_schema="{}",
+            implementation_type="python_code",
+            implementation_config=json.dumps({"code": "def run(x):\n    return x * 3", "function_name": "run"}),
+            is_active=True,
+        ))
+        db.add(ConfigChange(function_name="triple"))
+        db.commit()
+
+        assert registry.get("triple") is None
+        assert registry.sync(db) == 1
+        assert registry.sync(db) == 0
+        db.close()
+
+        assert registry.version > version
+        response = client.post("/api/functions/triple", json={"inputs": {"x": 2}})
+        assert response.json()["result"] == 6
+
+def test_registry_sync_picks_up_changes_committed_out_of_order():
+    from database import SessionLocal
+    from models import FunctionConfig, ConfigChange
+    from services.registry import registry
+
+    with TestClient(app) as client:
+        # This worker's own writes are not reloaded
+        client.post("/api/admin/functions", data=_function_form("quadruple", "def run(x):\n    return x * 4"))
+        db = SessionLocal()
+        assert registry.sync(db) == 0
+
+        # Another worker's change with the lower id commits after a higher one
+        version = registry.version
+        db.add(ConfigChange(id=version + 2, function_name="quadruple"))
+        db.commit()
+        assert registry.sync(db) == 1
+        assert registry.version == version + 2
+
+        db.add(FunctionConfig(
+            name="quintuple",
+            description="Test function",
+            input_schema="{}",
+            implementation_type="python_code",
+            implementation_config=json.dumps({"code": "def run(x):\n    return x * 5", "function_name": "run"}),
+            is_active=True,
+        ))
+        db.add(ConfigChange(id=version + 1, function_name="quintuple"))
+        db.commit()
+        assert registry.sync(db) == 1
+        assert registry.sync(db) == 0
+        db.close()
+
+        response = client.post("/api/functions/quintuple", json={"inputs": {"x": 2}})
+        assert response.json()["result"] == 10
+
+def test_registry_compiles_outside_its_lock():
+    import threading
+    from models import FunctionConfig
+    from services.registry import FunctionRegistry
+
+    def row(code):
+        return FunctionConfig(
+            id=1,
+            name="slow_import",
+            input_schema="{}",
+            implementation_type="python_code",
+            implementation_config=json.dumps({"code": code, "function_name": "run"}),
+            is_active=True,
+        )
+
+    registry = FunctionRegistry()
+    # Precompiled when installed, so the install takes as long as the import
+    compiling = threading.Thread(target=registry.refresh, args=(row("import time\ntime.sleep(0.5)\ndef run():\n    return 1"),))
+    compiling.start()
+    try:
+        acquired = registry._lock.acquire(timeout=0.25)
+        assert acquired and compiling.is_alive()
+        registry._lock.release()
+    finally:
+        compiling.join()
+    assert registry.get("slow_import") is not None
+
+    # A row read before the last install does not replace it
+    stale = registry._ticket()
+    registry.refresh(row("def run():\n    return 2"))
+    with registry._install_lock:
+        registry._install("slow_import", row("def run():\n    return 3"), stale)
+    assert "return 2" in registry.get("slow_import").config["code"]
+
+def test_database_query_reuses_cached_engine(tmp_path):
+    from sqlalchemy import create_engine, text
+
+    db_url = f"sqlite:///{tmp_path / 'parts.db'}"
+    with create_engine(db_url).begin() as connection:
+        connection.execute(text("CREATE TABLE parts (id INTEGER, name TEXT)"))
+        connection.execute(text("INSERT INTO parts VALUES (1, 'filter'), (2, 'valve')"))
+
+    with TestClient(app) as client:
+        client.post("/api/admin/functions", data=_function_form(
+            "parts",
+            "",
+            implementation_type="database_query",
+            implementation_config=json.dumps({
+                "connection_string": db_url,
+                "query_template": "SELECT name FROM parts WHERE id = {x}",
+                "pool_size": 2,
+            }),
+        ))
+        for part_id, name in [(1, "filter"), (2, "valve")]:
+            response = client.post("/api/functions/parts", json={"inputs": {"x": part_id}})
+            assert response.json()["result"] == {"results": [{"name": name}]}
+
+        stats = [s for s in client.get("/api/admin/engines").json() if s["url"] == db_url]
+        assert len(stats) == 1
+        assert stats[0]["options"] == {"pool_size": 2}
+
+def test_cached_function_reports_hits_and_misses():
+    code = "CALLS = []\ndef run(x):\n    CALLS.append(x)\n    return len(CALLS)"
+    with TestClient(app) as client:
+        client.post("/api/admin/functions", data=_function_form(
+            "counted",
+            code,
+            implementation_config=json.dumps({"code": code, "function_name": "run", "cache": {"ttl": 60}}),
+        ))
+        first = client.post("/api/functions/counted", json={"inputs": {"x": 1}})
+        second = client.post("/api/functions/counted", json={"inputs": {"x": 1}})
+        other = client.post("/api/functions/counted", json={"inputs": {"x": 2}})
+
+    assert first.headers["X-Cache"] == "MISS" and first.json()["result"] == 1
+    assert second.headers["X-Cache"] == "HIT" and second.json()["result"] == 1
+    assert other.headers["X-Cache"] == "MISS" and other.json()["result"] == 2
+
+def test_sqlite_response_cache_survives_restart(tmp_path):
+    import asyncio
+    from services.cache import CacheSettings, ResponseCache
+
+    class Function:
+        name = "lookup"
+        config_hash = "abc"
+
+    settings = CacheSettings({"backend": "sqlite", "ttl": 60, "max_entries": 2})
+    path = str(tmp_path / "cache.db")
+
+    async def scenario():
+        cache = ResponseCache(path)
+        for i in range(3):
+            await cache.set(Function, settings, cache.key(Function, {"i": i}), {"value": i})
+        # A fresh instance reads the same file, and only the newest two entries remain
+        restarted = ResponseCache(path)
+        assert await restarted.get(Function, settings, restarted.key(Function, {"i": 2})) == (True, {"value": 2})
+        assert (await restarted.get(Function, settings, restarted.key(Function, {"i": 0})))[0] is False
+
+    asyncio.run(scenario())
+
+def test_batch_returns_results_and_errors_in_order():
+    code = "def run(x):\n    return 10 // x"
+    with TestClient(app) as client:
+        client.post("/api/admin/functions", data=_function_form("divide", code))
+        response = client.post(
+            "/api/functions/divide/batch",
+            json={"inputs": [{"x": 1}, {"x": 0}, {"x": 5}], "concurrency": 2},
+        )
+        streamed = client.post(
+            "/api/functions/divide/batch",
+            json={"inputs": [{"x": 2}, {"x": 0}], "stream": True},
+        )
+
+    results = response.json()["results"]
+    assert [r["success"] for r in results] == [True, False, True]
+    assert results[0]["result"] == 10 and results[2]["result"] == 2
+    assert results[1]["status_code"] == 500
+
+    lines = [json.loads(line) for line in streamed.text.splitlines()]
+    assert [(line["index"], line["success"]) for line in lines] == [(0, True), (1, False)]
+
+def test_database_batch_runs_as_one_executemany(tmp_path):
+    from sqlalchemy import create_engine, text
+
+    db_url = f"sqlite:///{tmp_path / 'log.db'}"
+    with create_engine(db_url).begin() as connection:
+        connection.execute(text("CREATE TABLE log (id INTEGER, message TEXT)"))
+
+    with TestClient(app) as client:
+        client.post("/api/admin/functions", data=_function_form(
+            "write_log",
+            "",
+            implementation_type="database_query",
+            implementation_config=json.dumps({
+                "connection_string": db_url,
+                "query_template": "INSERT INTO log VALUES ({x}, '{message}')",
+            }),
+        ))
+        response = client.post("/api/functions/write_log/batch", json={"inputs": [
+            {"x": 1, "message": "a"}, {"x": 2}, {"x": 3, "message": "c"},
+        ]})
+
+    results = response.json()["results"]
+    assert [r["success"] for r in results] == [True, False, True]
+    assert results[1]["status_code"] == 400
+    with create_engine(db_url).connect() as connection:
+        assert connection.execute(text("SELECT id FROM log ORDER BY id")).scalars().all() == [1, 3]
+
+def _sse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = block.split("\n", 1)
+        events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+def test_stream_endpoint_sends_tokens_then_done():
+    from benchmarks.stub_providers import StubProviderServer
+
+    with StubProviderServer(latency=0) as server, TestClient(app) as client:
+        client.post("/api/admin/functions", data=_function_form(
+            "chat",
+            "",
+            implementation_type="ollama",
+            implementation_config=json.dumps({"host": server.url, "prompt_template": "Hi {x}"}),
+        ))
+        client.post("/api/admin/functions", data=_function_form("plain", "def run(x):\n    return x"))
+        streamed = client.post("/api/functions/chat/stream", json={"inputs": {"x": 1}})
+        fallback = client.post("/api/functions/plain/stream", json={"inputs": {"x": 1}})
+
+    assert streamed.headers["content-type"].startswith("text/event-stream")
+    events = _sse_events(streamed.text)
+    assert [name for name, _ in events] == ["token", "token", "token", "done"]
+    assert events[-1][1]["result"]["text"] == "".join(data["text"] for _, data in events[:-1])
+    assert _sse_events(fallback.text) == [("done", {"result": 1})]
+
+def test_stream_fallback_reports_errors_like_execute():
+    with TestClient(app) as client:
+        config = {"code": "def run(x):\n    return x", "function_name": "run", "execution": {"backend": "nowhere"}}
+        client.post("/api/admin/functions", data=_function_form("misplaced", "", implementation_config=json.dumps(config)))
+        executed = client.post("/api/functions/misplaced", json={"inputs": {"x": 1}})
+        streamed = client.post("/api/functions/misplaced/stream", json={"inputs": {"x": 1}})
+
+    assert executed.status_code == streamed.status_code == 500
+    assert streamed.json() == executed.json()
+    assert "Unknown python execution backend" in streamed.json()["detail"]
+
+def test_metrics_endpoint_reports_calls_and_stages():
+    with TestClient(app) as client:
+        client.post(
+            "/api/admin/functions",
+            data=_function_form("measured", "def run(x):\n    return {'value': x}"),
+        )
+        assert client.post("/api/functions/measured", json={"inputs": {"x": 1}}).status_code == 200
+        assert client.post("/api/functions/measured", json={"inputs": {}}).status_code == 500
+
+        body = client.get("/metrics").text
+        labels = 'function="measured",type="python_code"'
+        assert f"ai_factory_calls_total{{{labels}}} 2" in body
+        assert 'ai_factory_errors_total{function="measured",status_code="500",type="python_code"} 1' in body
+        assert f'ai_factory_in_flight{{{labels}}} 0' in body
+        for stage in ("lookup", "compile", "execute", "handler", "serialize", "total"):
+            assert f'ai_factory_stage_seconds_count{{function="measured",stage="{stage}",type="python_code"}}' in body
+
+def test_admin_rejects_templates_referencing_undeclared_inputs():
+    with TestClient(app) as client:
+        form = _function_form(
+            "bad_template", "",
+            implementation_type="ollama",
+            implementation_config=json.dumps({"prompt_template": "Summarize {text}"}),
+        )
+        response = client.post("/api/admin/functions", data=form)
+        assert response.status_code == 400
+        assert "text" in response.json()["detail"]
+        assert client.post("/api/functions/bad_template", json={"inputs": {"x": 1}}).status_code == 404
+
+def test_inputs_are_validated_against_the_schema_before_execution():
+    code = "CALLS = []\ndef run(x):\n    CALLS.append(x)\n    return len(CALLS)"
+    schema = {"type": "object", "properties": {"x": {"type": "integer", "minimum": 0}}, "required": ["x"], "additionalProperties": False}
+    with TestClient(app) as client:
+        response = client.post("/api/admin/functions", data=_function_form("strict", code, input_schema=json.dumps(schema)))
+        assert response.json()["success"]
+
+        for inputs, message in [
+            ({}, "inputs: 'x' is a required property"),
+            ({"x": "1"}, "x: '1' is not of type 'integer'"),
+            ({"x": -1}, "x: -1 is less than the minimum of 0"),
+            ({"x": 1, "y": 2}, "('y' was unexpected)"),
+        ]:
+            response = client.post("/api/functions/strict", json={"inputs": inputs})
+            assert response.status_code == 400 and message in response.json()["detail"]
+        # The handler ran only for the valid call
+        assert client.post("/api/functions/strict", json={"inputs": {"x": 1}}).json()["result"] == 1
+
+        results = client.post("/api/functions/strict/batch", json={"inputs": [{"x": 1}, {"x": "a"}]}).json()["results"]
+        assert results[0]["success"] and results[1]["status_code"] == 400
+
+def test_admin_rejects_invalid_input_schemas():
+    with TestClient(app) as client:
+        for schema in ({"type": "text"}, {"properties": {"x": {"minimum": "0"}}}, {"$ref": "#/$defs/missing"}):
+            response = client.post("/api/admin/functions", data=_function_form("bad_schema", "", input_schema=json.dumps(schema)))
+            assert response.status_code == 400 and "Invalid JSON schema" in response.json()["detail"]
+
+def test_jobs_run_in_the_background_and_persist_results():
+    with TestClient(app) as client:
+        client.post("/api/admin/functions", data=_function_form("job_double", "def run(x):\n    return {'value': x * 2}"))
+        client.post("/api/admin/functions", data=_function_form("job_slow", "import time\ndef run(x):\n    time.sleep(x)\n    return x"))
+
+        submitted = client.post("/api/jobs", json={"function": "job_double", "inputs": {"x": 21}})
+        assert submitted.status_code == 202 and submitted.json()["status"] == "queued"
+        job = client.get(submitted.headers["Location"], params={"wait": 5}).json()
+        assert job["status"] == "succeeded" and job["result"] == {"value": 42}
+
+        assert client.post("/api/jobs", json={"function": "job_double", "inputs": {"x": "a"}}).status_code == 400
+        assert client.post("/api/jobs", json={"function": "missing", "inputs": {}}).status_code == 404
+
+        slow = client.post("/api/jobs", json={"function": "job_slow", "inputs": {"x": 2}}).json()
+        cancelled = client.post(f"/api/jobs/{slow['id']}/cancel").json()
+        assert cancelled["status"] == "cancelled" and cancelled["status_code"] == 499
+
+        statuses = {job["id"]: job["status"] for job in client.get("/api/jobs", params={"function": "job_slow"}).json()}
+        assert statuses[slow["id"]] == "cancelled"
+        assert client.get("/api/jobs/unknown").status_code == 404
+
+def test_execution_history_reports_recent_calls_and_percentiles():
+    from services.history import execution_log
+
+    with TestClient(app) as client:
+        client.post("/api/admin/functions", data=_function_form("recorded", "def run(x):\n    return 10 // x"))
+        for x in (1, 2, 5, 0):
+            client.post("/api/functions/recorded", json={"inputs": {"x": x}})
+        client.portal.call(execution_log.flush)
+
+        recent = client.get("/api/admin/executions", params={"function": "recorded"}).json()
+        assert [row["status_code"] for row in recent] == [500, 200, 200, 200]
+        assert "by zero" in recent[0]["error"] and recent[0]["output_hash"] is None
+        assert len(recent[1]["input_hash"]) == 16 and recent[1]["input_preview"] is None
+        assert len(client.get("/api/admin/executions", params={"function": "recorded", "errors": True}).json()) == 1
+
+        [stats] = client.get("/api/admin/executions/stats", params={"function": "recorded"}).json()["functions"]
+        assert stats["calls"] == 4 and stats["errors"] == 1 and stats["error_rate"] == 0.25
+        assert 0 <= stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"] == stats["max_ms"]
+
+def test_execution_history_records_streamed_and_batched_calls(tmp_path):
+    from sqlalchemy import create_engine, text
+    from benchmarks.stub_providers import StubProviderServer
+    from services.history import execution_log
+
+    db_url = f"sqlite:///{tmp_path / 'history.db'}"
+    with create_engine(db_url).begin() as connection:
+        connection.execute(text("CREATE TABLE log (id INTEGER)"))
+        connection.execute(text("INSERT INTO log VALUES (1), (2)"))
+
+    with StubProviderServer(latency=0) as server, TestClient(app) as client:
+        client.post("/api/admin/functions", data=_function_form(
+            "recorded_chat", "", implementation_type="ollama",
+            implementation_config=json.dumps({"host": server.url, "prompt_template": "Hi {x}"}),
+        ))
+        client.post("/api/admin/functions", data=_function_form(
+            "recorded_rows", "", implementation_type="database_query",
+            implementation_config=json.dumps({"connection_string": db_url, "query_template": "SELECT id FROM log", "stream": True}),
+        ))
+        client.post("/api/admin/functions", data=_function_form(
+            "recorded_writes", "", implementation_type="database_query",
+            implementation_config=json.dumps({"connection_string": db_url, "query_template": "INSERT INTO log VALUES ({x})"}),
+        ))
+        assert _sse_events(client.post("/api/functions/recorded_chat/stream", json={"inputs": {"x": 1}}).text)[-1][0] == "done"
+        assert len(client.post("/api/functions/recorded_rows", json={"inputs": {}}).text.splitlines()) == 2
+        client.post("/api/functions/recorded_writes/batch", json={"inputs": [{"x": 3}, {}, {"x": 4}]})
+        client.portal.call(execution_log.flush)
+
+        def recorded(name):
+            return client.get("/api/admin/executions", params={"function": name}).json()
+
+        [chat] = recorded("recorded_chat")
+        assert chat["status_code"] == 200 and chat["output_hash"] and chat["duration_ms"] > 0
+        [rows] = recorded("recorded_rows")
+        assert rows["status_code"] == 200
+        writes = recorded("recorded_writes")
+        assert len(writes) == 3 and sorted(row["status_code"] for row in writes) == [200, 200, 400]
+        body = client.get("/metrics").text
+        assert 'ai_factory_calls_total{function="recorded_chat",type="ollama"} 1' in body
+        assert 'ai_factory_calls_total{function="recorded_writes",type="database_query"} 3' in body
+
+def _sleeper(name, seconds, backend=None):
+    # Reports when it ran, on the monotonic clock shared by the test process
+    code = (
+        f"import time\ndef run(x):\n    started = time.monotonic()\n    time.sleep({seconds})\n"
+        "    return {'value': x, 'started': started, 'ended': time.monotonic()}"
+    )
+    config = {"code": code, "function_name": "run"}
+    if backend:
+        config["execution"] = {"backend": backend}
+    return _function_form(name, code, implementation_config=json.dumps(config))
+
+def _pipeline_form(name, config):
+    return _function_form(name, "", implementation_type="pipeline", implementation_config=json.dumps(config))
+
+def test_pipeline_runs_independent_nodes_concurrently():
+    with TestClient(app) as client:
+        client.post("/api/admin/functions", data=_sleeper("nap_a", 0.3, "thread"))
+        client.post("/api/admin/functions", data=_sleeper("nap_b", 0.3, "thread"))
+        client.post("/api/admin/functions", data=_function_form("add", "def run(x, y=0):\n    return {'value': x + y}"))
+        pipeline = {
+            "nodes": {
+                "a": {"function": "nap_a", "inputs": {"x": "$inputs.x"}},
+                "b": {"function": "nap_b", "inputs": {"x": 10}},
+                "sum": {"function": "add", "inputs": {"x": "$nodes.a.value", "y": "$nodes.b.value"}},
+            },
+            "output": {"total": "$nodes.sum.value", "parts": ["$nodes.a.value", "$nodes.b.value"], "runs": ["$nodes.a", "$nodes.b"]},
+        }
+        assert client.post("/api/admin/functions", data=_pipeline_form("fan_in", pipeline)).json()["success"]
+
+        response = client.post("/api/functions/fan_in", json={"inputs": {"x": 5}})
+        result = response.json()["result"]
+        assert {"total": result["total"], "parts": result["parts"]} == {"total": 15, "parts": [5, 10]}
+        # Each node started before the other finished
+        a, b = result["runs"]
+        assert a["started"] < b["ended"] and b["started"] < a["ended"]
+
+        slow = {"nodes": {"a": {"function": "nap_a", "inputs": {"x": 1}, "timeout": 0.05}}}
+        client.post("/api/admin/functions", data=_pipeline_form("too_slow", slow))
+        response = client.post("/api/functions/too_slow", json={"inputs": {}})
+        assert response.status_code == 504 and "'a' timed out" in response.json()["detail"]
+
+def test_pipeline_overlaps_sync_nodes_and_times_them_out(tmp_path):
+    import threading
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    # Each query waits at the barrier until the other one reaches it, so the
+    # pipeline only succeeds when both run at the same time
+    barrier = threading.Barrier(2, timeout=5)
+    def add_barrier(connection, _):
+        if hasattr(connection, "create_function"):
+            connection.create_function("barrier", 0, lambda: barrier.wait() * 0)
+    event.listen(Engine, "connect", add_barrier)
+
+    try:
+        with TestClient(app) as client:
+            client.post("/api/admin/functions", data=_function_form(
+                "meet",
+                "",
+                implementation_type="database_query",
+                implementation_config=json.dumps({
+                    "connection_string": f"sqlite:///{tmp_path / 'meet.db'}",
+                    "query_template": "SELECT barrier() + {x} AS x",
+                }),
+            ))
+            client.post("/api/admin/functions", data=_sleeper("doze_a", 0.3))
+            client.post("/api/admin/functions", data=_sleeper("doze_b", 0.3))
+            pipeline = {
+                "nodes": {
+                    "q1": {"function": "meet", "inputs": {"x": 1}},
+                    "q2": {"function": "meet", "inputs": {"x": 2}},
+                    "a": {"function": "doze_a", "inputs": {"x": 1}},
+                    "b": {"function": "doze_b", "inputs": {"x": 2}},
+                },
+                "output": {"rows": ["$nodes.q1.results", "$nodes.q2.results"], "runs": ["$nodes.a", "$nodes.b"]},
+            }
+            assert client.post("/api/admin/functions", data=_pipeline_form("meet_up", pipeline)).json()["success"]
+
+            response = client.post("/api/functions/meet_up", json={"inputs": {}})
+            result = response.json()["result"]
+            assert result["rows"] == [[{"x": 1}], [{"x": 2}]]
+            a, b = result["runs"]
+            assert a["started"] < b["ended"] and b["started"] < a["ended"]
+
+            slow = {"nodes": {"a": {"function": "doze_a", "inputs": {"x": 1}, "timeout": 0.05}}}
+            client.post("/api/admin/functions", data=_pipeline_form("dozes_off", slow))
+            response = client.post("/api/functions/dozes_off", json={"inputs": {}})
+            assert response.status_code == 504 and "'a' timed out" in response.json()["detail"]
+    finally:
+        event.remove(Engine, "connect", add_barrier)
+
+def test_admin_rejects_invalid_pipelines():
+    with TestClient(app) as client:
+        for config, message in [
+            ({"nodes": {"a": {"function": "f", "inputs": {"x": "$nodes.b"}}, "b": {"function": "f", "inputs": {"x": "$nodes.a"}}}}, "cycle"),
+            ({"nodes": {"a": {"function": "f", "inputs": {"x": "$nodes.missing"}}}}, "unknown node"),
+            ({"nodes": {"a": {"function": "f", "inputs": {"x": "$inputs.undeclared"}}}}, "undeclared"),
+        ]:
+            response = client.post("/api/admin/functions", data=_pipeline_form("bad_pipeline", config))
+            assert response.status_code == 400 and message in response.json()["detail"]
+
+def test_database_query_runs_off_the_event_loop(tmp_path):
+    import asyncio
+    from models import FunctionConfig
+    from routers.functions import execute_function_impl
+    from services.registry import CompiledFunction
+
+    function = CompiledFunction(FunctionConfig(
+        id=0,
+        name="count_to",
+        input_schema="{}",
+        implementation_type="database_query",
+        implementation_config=json.dumps({
+            "connection_string": f"sqlite:///{tmp_path / 'count.db'}",
+            "query_template": "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < {x}) SELECT count(*) AS c FROM n",
+        }),
+    ))
+    assert function.blocking
+
+    async def scenario():
+        ticks = 0
+        call = asyncio.create_task(execute_function_impl(function, {"x": 2000000}))
+        while not call.done():
+            await asyncio.sleep(0.01)
+            ticks += 1
+        return await call, ticks
+
+    result, ticks = asyncio.run(scenario())
+    assert result == {"results": [{"c": 2000000}]}
+    # The loop kept running while the query did
+    assert ticks > 3
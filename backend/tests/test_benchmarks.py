@@ -0,0 +1,31 @@
+import asyncio
+
+from benchmarks.fixtures import build_fixtures, create_catalog, seed_functions
+from benchmarks.load import compare, in_process_client, percentile, run_scenario, summarize
+
+def test_summary_uses_nearest_rank_percentiles():
+    latencies = [i / 1000 for i in range(1, 101)]
+    summary = summarize(latencies, errors=2, elapsed=2.0)
+    assert summary["requests"] == 100 and summary["rps"] == 50.0
+    assert (summary["p50_ms"], summary["p95_ms"], summary["p99_ms"]) == (50.0, 95.0, 99.0)
+    assert percentile([], 50) is None
+
+def test_compare_flags_latency_and_throughput_regressions():
+    baseline = [{"function": "f", "type": "python_code", "mode": "call", "concurrency": 8, "p95_ms": 10.0, "rps": 1000.0}]
+    assert compare(baseline, [{**baseline[0], "p95_ms": 10.5, "rps": 950.0}], threshold=0.1) == []
+    regressions = compare(baseline, [{**baseline[0], "p95_ms": 20.0, "rps": 500.0}], threshold=0.1)
+    assert regressions == ["python_code call c=8: p95 10.0ms -> 20.0ms", "python_code call c=8: 1000.0 -> 500.0 rps"]
+
+def test_load_driver_measures_seeded_fixtures(tmp_path):
+    catalog_url = create_catalog(str(tmp_path / "catalog.db"), seed=1, rows=100)
+    fixtures = build_fixtures("http://127.0.0.1:9", catalog_url)
+    local = [fixture for fixture in fixtures if fixture.implementation_type in ("database_query", "python_code", "pipeline")]
+
+    async def scenario():
+        async with in_process_client() as client:
+            await seed_functions(client, fixtures)
+            return [await run_scenario(client, fixture, "call", 2, 0.2, seed=1) for fixture in local]
+
+    for result in asyncio.run(scenario()):
+        assert result["requests"] > 0 and result["errors"] == 0, result
+        assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
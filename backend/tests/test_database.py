@@ -0,0 +1,22 @@
+import asyncio
+
+from sqlalchemy import text
+
+from database import async_database_url, async_engine, engine
+
+def test_async_url_picks_the_async_driver():
+    assert async_database_url("sqlite:///data/app.db") == "sqlite+aiosqlite:///data/app.db"
+    assert async_database_url("postgresql://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+    assert async_database_url("postgresql+psycopg://u:p@db/app") == "postgresql+psycopg://u:p@db/app"
+
+def test_sqlite_connections_are_tuned_for_concurrency():
+    async def pragmas():
+        async with async_engine.connect() as connection:
+            values = [(await connection.execute(text(f"PRAGMA {name}"))).scalar() for name in ("journal_mode", "synchronous")]
+        await async_engine.dispose()
+        return values
+
+    assert asyncio.run(pragmas()) == ["wal", 1]
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
@@ -0,0 +1,83 @@
+import pytest
+from sqlalchemy import create_engine, text
+
+from services.database_query import compile_query, execute_database_function
+
+def test_query_template_compiles_to_bound_parameters():
+    query = compile_query("SELECT * FROM parts WHERE name = '{name}' AND id > {id}", (("id", "integer"),))
+    assert str(query.statement) == "SELECT * FROM parts WHERE name = :name AND id > :id"
+    assert query.parameters == ("name", "id")
+    # Same template, same compiled statement
+    assert compile_query("SELECT * FROM parts WHERE name = '{name}' AND id > {id}", (("id", "integer"),)) is query
+
+def test_placeholder_inside_literal_is_rejected():
+    with pytest.raises(ValueError):
+        compile_query("SELECT * FROM parts WHERE name LIKE '%{name}%'")
+
+def test_inputs_are_bound_not_spliced(tmp_path):
+    db_url = f"sqlite:///{tmp_path / 'parts.db'}"
+    with create_engine(db_url).begin() as connection:
+        connection.execute(text("CREATE TABLE parts (id INTEGER, name TEXT)"))
+        connection.execute(text("INSERT INTO parts VALUES (1, 'filter')"))
+
+    config = {"connection_string": db_url, "query_template": "SELECT id FROM parts WHERE name = '{name}'"}
+    assert execute_database_function(config, {"name": "filter"}) == {"results": [{"id": 1}]}
+    assert execute_database_function(config, {"name": "x' OR '1'='1"}) == {"results": []}
+
+    insert = {"connection_string": db_url, "query_template": "INSERT INTO parts VALUES ({id}, {name})"}
+    assert execute_database_function(insert, {"id": 2, "name": "valve"})["affected_rows"] == 1
+    assert execute_database_function(config, {"name": "valve"}) == {"results": [{"id": 2}]}
+
+def _numbers_db(tmp_path, count):
+    db_url = f"sqlite:///{tmp_path / 'numbers.db'}"
+    with create_engine(db_url).begin() as connection:
+        connection.execute(text("CREATE TABLE numbers (n INTEGER)"))
+        connection.execute(text("INSERT INTO numbers VALUES (:n)"), [{"n": n} for n in range(count)])
+    return db_url
+
+def test_page_tokens_walk_the_whole_result(tmp_path):
+    config = {
+        "connection_string": _numbers_db(tmp_path, 7),
+        "query_template": "SELECT n FROM numbers WHERE n >= {start} ORDER BY n",
+        "page_size": 3,
+    }
+    seen, inputs = [], {"start": 0}
+    while True:
+        page = execute_database_function(config, inputs)
+        seen += [row["n"] for row in page["results"]]
+        if "next_page_token" not in page:
+            break
+        inputs = {"start": 0, "page_token": page["next_page_token"]}
+    assert seen == list(range(7))
+
+def test_paged_queries_must_be_ordered():
+    from fastapi import HTTPException
+    from services.database_query import prepare_database_config
+
+    for template in [
+        "SELECT n FROM numbers",
+        "SELECT n, row_number() OVER (ORDER BY n) FROM numbers",
+        "SELECT n FROM numbers WHERE tag = 'ORDER BY' -- ORDER BY n",
+        "SELECT n FROM numbers ORDER BY n LIMIT 5",
+    ]:
+        with pytest.raises(ValueError):
+            prepare_database_config({"query_template": template, "page_size": 3}, {})
+        with pytest.raises(HTTPException) as error:
+            execute_database_function({"query_template": template, "page_size": 3}, {})
+        assert "Invalid database_query config" in str(error.value.detail)
+
+    query = compile_query("SELECT n FROM (SELECT n FROM numbers LIMIT 9) ORDER BY n;")
+    assert str(query.paged) == "SELECT n FROM (SELECT n FROM numbers LIMIT 9) ORDER BY n LIMIT :_page_limit OFFSET :_page_offset"
+
+def test_stream_emits_ndjson_rows_up_to_the_cap(tmp_path):
+    import json
+    from services.database_query import stream_database_function
+
+    config = {
+        "connection_string": _numbers_db(tmp_path, 10),
+        "query_template": "SELECT n FROM numbers ORDER BY n",
+        "max_rows": 4,
+        "yield_per": 2,
+    }
+    lines = [json.loads(line) for line in stream_database_function(config, {})]
+    assert lines == [{"n": 0}, {"n": 1}, {"n": 2}, {"n": 3}, {"truncated": True}]
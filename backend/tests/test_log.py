@@ -0,0 +1,35 @@
+import logging
+import queue
+
+from utils.log import RedactingQueueHandler, SamplingFilter, parse_levels, redact, redact_text
+
+def test_secrets_are_redacted_from_values_and_messages():
+    assert redact({"api_key": "sk-ant-123", "nested": [{"password": "x", "q": 1}]}) == {
+        "api_key": "***", "nested": [{"password": "***", "q": 1}],
+    }
+    assert redact_text("Bearer abcdefghijk failed") == "*** failed"
+    assert redact_text("postgresql://user:hunter2@db/app") == "postgresql://***@db/app"
+    assert redact_text("url?api_key=secret&x=1") == "url?api_key=***&x=1"
+
+def test_queue_handler_redacts_before_enqueueing():
+    records = queue.SimpleQueue()
+    handler = RedactingQueueHandler(records)
+    logger = logging.getLogger("tests.log")
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        logger.warning("call failed with key %s", "sk-ant-abcdefgh1234", extra={"api_key": "sk-1", "function": "f"})
+    finally:
+        logger.removeHandler(handler)
+    record = records.get_nowait()
+    assert record.getMessage() == "call failed with key ***"
+    assert record.api_key == "***" and record.function == "f"
+
+def test_sampling_only_drops_debug_records():
+    never = SamplingFilter(0.0)
+    debug = logging.makeLogRecord({"levelno": logging.DEBUG})
+    info = logging.makeLogRecord({"levelno": logging.INFO})
+    assert not never.filter(debug) and never.filter(info)
+    assert parse_levels("services.providers=debug, routers=WARNING") == {
+        "services.providers": "DEBUG", "routers": "WARNING",
+    }
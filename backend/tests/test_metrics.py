@@ -0,0 +1,68 @@
+import json
+import os
+
+from services.metrics import Metrics
+
+def test_snapshots_from_other_workers_are_merged(tmp_path):
+    metrics = Metrics(directory=str(tmp_path))
+    labels = {"function": "f", "type": "ollama"}
+    metrics.inc("ai_factory_calls_total", labels, 2)
+    metrics.add("ai_factory_in_flight", labels, 1)
+    metrics.observe("ai_factory_stage_seconds", {**labels, "stage": "total"}, 0.2)
+    metrics.write()
+    own = f"{os.getpid()}-{metrics.snapshot()['started']}.json"
+    assert sorted(os.listdir(tmp_path)) == [own, "retired.lock"]
+
+    # A live worker, and one that has exited: its counters still count, its gauges do not
+    other = json.loads((tmp_path / own).read_text())
+    other["pid"] = os.getppid()
+    (tmp_path / f"{os.getppid()}-1.json").write_text(json.dumps(other))
+    other["pid"] = 2 ** 22 + 1
+    (tmp_path / f"{2 ** 22 + 1}-1.json").write_text(json.dumps(other))
+
+    body = metrics.render()
+    assert 'ai_factory_calls_total{function="f",type="ollama"} 6' in body
+    assert 'ai_factory_in_flight{function="f",type="ollama"} 2' in body
+    assert 'ai_factory_stage_seconds_bucket{function="f",stage="total",type="ollama",le="0.25"} 3' in body
+    assert 'ai_factory_stage_seconds_bucket{function="f",stage="total",type="ollama",le="0.1"} 0' in body
+    assert 'ai_factory_stage_seconds_count{function="f",stage="total",type="ollama"} 3' in body
+    assert "# TYPE ai_factory_stage_seconds histogram" in body
+
+def test_exited_workers_snapshots_are_retired(tmp_path):
+    metrics = Metrics(directory=str(tmp_path))
+    labels = {"function": "f", "type": "ollama"}
+    metrics.inc("ai_factory_calls_total", labels, 2)
+    metrics.add("ai_factory_in_flight", labels, 1)
+    metrics.write()
+    own = f"{os.getpid()}-{metrics.snapshot()['started']}.json"
+    snapshot = (tmp_path / own).read_text()
+    # An exited worker, and an earlier process that had our pid
+    (tmp_path / f"{2 ** 22 + 1}-1.json").write_text(snapshot)
+    (tmp_path / f"{os.getpid()}-1.json").write_text(snapshot)
+    before = metrics.render()
+
+    metrics.write()
+    assert sorted(os.listdir(tmp_path)) == sorted([own, "retired.json", "retired.lock"])
+    assert metrics.render() == before
+    assert 'ai_factory_calls_total{function="f",type="ollama"} 6' in before
+    assert 'ai_factory_in_flight{function="f",type="ollama"} 1' in before
+
+def test_provider_token_usage_is_recorded():
+    import asyncio
+    from benchmarks.stub_providers import StubProviderServer
+    from services.metrics import metrics
+    from services.providers.ollama import execute_ollama_function
+
+    class Function:
+        name = "tokens"
+        implementation_type = "ollama"
+
+    async def call(url):
+        with metrics.bind(Function):
+            await execute_ollama_function({"host": url, "prompt_template": "hi"}, {})
+
+    with StubProviderServer(latency=0) as server:
+        asyncio.run(call(server.url))
+    body = metrics.render()
+    assert 'ai_factory_provider_tokens_total{direction="input",function="tokens",type="ollama"} 10' in body
+    assert 'ai_factory_provider_tokens_total{direction="output",function="tokens",type="ollama"} 2' in body
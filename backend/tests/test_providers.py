@@ -0,0 +1,71 @@
+import asyncio
+import pytest
+
+from benchmarks.stub_providers import StubProviderServer
+from benchmarks.provider_concurrency import provider_calls, run_concurrent
+
+LATENCY = 0.3
+CALLS = 50
+
+@pytest.mark.parametrize("provider", ["anthropic", "perplexity", "ollama"])
+def test_provider_calls_overlap_on_one_event_loop(provider):
+    with StubProviderServer(latency=LATENCY) as server:
+        handler, config = provider_calls(server.url)[provider]
+        elapsed = asyncio.run(run_concurrent(handler, config, CALLS))
+    # Serialized calls would take CALLS * LATENCY = 15s
+    assert elapsed < CALLS * LATENCY / 5
+
+def test_client_pool_reuses_and_evicts_least_recently_used():
+    from services.providers.clients import ClientPool
+
+    class FakeClient:
+        closed = False
+
+        async def aclose(self):
+            self.closed = True
+
+    async def scenario():
+        pool = ClientPool(max_size=2)
+        async with pool.acquire("ollama", None, "a", FakeClient) as a:
+            pass
+        async with pool.acquire("ollama", None, "a", FakeClient) as again:
+            assert again is a
+        async with pool.acquire("ollama", None, "b", FakeClient) as b:
+            # Evicting "a" while "b" is leased must not close "b"
+            async with pool.acquire("ollama", None, "c", FakeClient):
+                pass
+            assert a.closed and not b.closed
+        await pool.close()
+        assert b.closed and len(pool) == 0
+
+    asyncio.run(scenario())
+
+@pytest.mark.parametrize("provider", ["anthropic", "perplexity", "ollama"])
+def test_provider_streams_tokens_as_they_arrive(provider):
+    from benchmarks.stub_providers import STUB_TOKENS
+    from services.registry import TOKEN_STREAMERS
+
+    async def collect(url):
+        config = {**provider_calls(url)[provider][1], "prompt_template": "Say {word}"}
+        return [chunk async for chunk in TOKEN_STREAMERS[provider](config, {"word": "hi"})]
+
+    with StubProviderServer(latency=0) as server:
+        assert asyncio.run(collect(server.url)) == STUB_TOKENS
+
+@pytest.mark.parametrize("provider", ["anthropic", "perplexity", "ollama"])
+def test_missing_template_input_is_a_400_when_executed_and_streamed(provider):
+    from fastapi import HTTPException
+    from services.registry import TOKEN_STREAMERS
+
+    async def statuses(url):
+        handler, config = provider_calls(url)[provider]
+        config = {**config, "prompt_template": "Say {word}"}
+        codes = []
+        for call in (handler(config, {}), TOKEN_STREAMERS[provider](config, {}).__anext__()):
+            with pytest.raises(HTTPException) as error:
+                await call
+            codes.append(error.value.status_code)
+        return codes
+
+    with StubProviderServer(latency=0) as server:
+        assert asyncio.run(statuses(server.url)) == [400, 400]
@@ -0,0 +1,90 @@
+import os
+
+from services.python_code import execute_python_function, invalidate_python_function, load_python_function
+
+def test_inline_code_is_compiled_once_as_a_module():
+    config = {
+        "code": "CALLS = []\ndef helper(x):\n    return x + 1\ndef run(x):\n    CALLS.append(x)\n    return helper(x)",
+        "function_name": "run",
+    }
+    assert execute_python_function(config, {"x": 1}) == 2
+    assert execute_python_function(config, {"x": 2}) == 3
+    # Module state survives between calls because the module is not re-executed
+    assert load_python_function(config).__globals__["CALLS"] == [1, 2]
+
+    invalidate_python_function(config)
+    assert load_python_function(config).__globals__["CALLS"] == []
+
+def test_file_code_is_recompiled_when_the_file_changes(tmp_path):
+    path = tmp_path / "handler.py"
+    path.write_text("def run():\n    return 'v1'\n")
+    config = {"file_path": str(path), "function_name": "run"}
+    assert execute_python_function(config, {}) == "v1"
+    first = load_python_function(config)
+
+    path.write_text("def run():\n    return 'v2'\n")
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert execute_python_function(config, {}) == "v2"
+    assert load_python_function(config) is not first
+    assert first.__module__ != load_python_function(config).__module__
+
+def test_execution_backends_run_off_the_event_loop():
+    import asyncio
+    import time
+    import pytest
+    from fastapi import HTTPException
+    from services.python_executor import run_python_function, shutdown_python_executors
+
+    code = "import time\ndef run(seconds):\n    time.sleep(seconds)\n    return seconds"
+
+    async def scenario():
+        thread_config = {"code": code, "function_name": "run", "execution": {"backend": "thread"}}
+        started = time.perf_counter()
+        results = await asyncio.gather(*(run_python_function(thread_config, {"seconds": 0.2}) for _ in range(5)))
+        assert results == [0.2] * 5
+        assert time.perf_counter() - started < 0.8
+
+        limited = {**thread_config, "execution": {"backend": "thread", "max_concurrency": 1}}
+        started = time.perf_counter()
+        await asyncio.gather(*(run_python_function(limited, {"seconds": 0.1}) for _ in range(3)))
+        assert time.perf_counter() - started >= 0.3
+
+        process_config = {"code": code, "function_name": "run", "execution": {"backend": "process"}}
+        assert await run_python_function(process_config, {"seconds": 0}) == 0
+        timed = {**process_config, "execution": {"backend": "process", "timeout": 0.5}}
+        with pytest.raises(HTTPException) as error:
+            await run_python_function(timed, {"seconds": 2})
+        assert error.value.status_code == 504
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        shutdown_python_executors(wait=False)
+
+def test_timed_out_calls_keep_their_concurrency_slot_until_done():
+    import asyncio
+    import time
+    import pytest
+    from fastapi import HTTPException
+    from services import python_executor
+    from services.python_code import source_key
+
+    code = "import time\ndef run(seconds):\n    time.sleep(seconds)\n    return seconds"
+    config = {"code": code, "function_name": "run", "execution": {"backend": "thread", "max_concurrency": 1, "timeout": 0.05}}
+
+    async def scenario():
+        started = time.perf_counter()
+        with pytest.raises(HTTPException) as error:
+            await python_executor.run_python_function(config, {"seconds": 0.3})
+        assert error.value.status_code == 504
+        # Released (as the registry's sync thread does) while the abandoned call still runs
+        await asyncio.to_thread(python_executor.release_python_function, config)
+        await asyncio.sleep(0)
+        # ...which keeps its slot, so the next call waits for it
+        assert await python_executor.run_python_function(config, {"seconds": 0}) == 0
+        assert time.perf_counter() - started >= 0.25
+
+    asyncio.run(scenario())
+    python_executor.release_python_function(config)
+    assert not [key for key in python_executor._semaphores if key[0] == source_key(config)]
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import time
+import pytest
+from fastapi import HTTPException
+
+from benchmarks.stub_providers import StubProviderServer
+from models import FunctionConfig
+from services.providers.resilience import CircuitOpen, Resilience
+from services.registry import CompiledFunction
+
+def _function(url, **config):
+    return CompiledFunction(FunctionConfig(
+        id=1,
+        name="resilient",
+        input_schema="{}",
+        implementation_type="ollama",
+        implementation_config=json.dumps({"host": url, "prompt_template": "Say hi", **config}),
+    ))
+
+def _call(resilience, function):
+    async def attempt():
+        return await function.handler(function.config, {})
+    return resilience.run(function, attempt)
+
+def test_transient_errors_are_retried():
+    with StubProviderServer(latency=0) as server:
+        server.fail_next = 2
+        function = _function(server.url, retry={"max_attempts": 3, "base_delay": 0.01})
+        resilience = Resilience()
+        assert asyncio.run(_call(resilience, function)) == {"text": "stub response"}
+        assert server.requests == 3 and resilience.retries == 2
+
+def test_retries_and_circuit_breaker_are_opt_in():
+    with StubProviderServer(latency=0) as server:
+        server.fail_next = 10
+        function = _function(server.url)
+        resilience = Resilience()
+
+        async def scenario():
+            for _ in range(6):
+                with pytest.raises(HTTPException) as error:
+                    await _call(resilience, function)
+                assert not isinstance(error.value, CircuitOpen)
+
+        asyncio.run(scenario())
+        # One attempt per call, and no breaker tripped
+        assert server.requests == 6 and resilience.retries == 0
+        assert resilience.stats()["circuit_breakers"] == {}
+
+def test_client_errors_are_not_retried():
+    with StubProviderServer(latency=0, error_status=400) as server:
+        server.fail_next = 1
+        function = _function(server.url, retry={"max_attempts": 3, "base_delay": 0.01})
+        with pytest.raises(HTTPException):
+            asyncio.run(_call(Resilience(), function))
+        assert server.requests == 1
+
+def test_circuit_opens_after_failures_and_recovers_after_probe():
+    with StubProviderServer(latency=0) as server:
+        server.fail_next = 100
+        function = _function(
+            server.url,
+            retry=False,
+            circuit_breaker={"failure_threshold": 2, "reset_timeout": 0.2},
+        )
+        resilience = Resilience()
+
+        async def scenario():
+            for _ in range(2):
+                with pytest.raises(HTTPException) as error:
+                    await _call(resilience, function)
+                assert not isinstance(error.value, CircuitOpen)
+            # Open: fails fast without reaching the provider
+            with pytest.raises(CircuitOpen):
+                await _call(resilience, function)
+            assert server.requests == 2
+
+            server.fail_next = 0
+            await asyncio.sleep(0.25)
+            assert await _call(resilience, function) == {"text": "stub response"}
+
+        asyncio.run(scenario())
+        breaker = resilience.stats()["circuit_breakers"]
+        assert list(breaker.values()) == [{"state": "closed", "failures": 0}]
+
+def test_only_the_probe_moves_a_half_open_breaker():
+    from types import SimpleNamespace
+    from services.providers.resilience import CircuitBreaker
+
+    policy = SimpleNamespace(failure_threshold=1, reset_timeout=0)
+    breaker = CircuitBreaker("ollama")
+    # Started while closed, still running when the breaker opens
+    late = breaker.before_call(policy)
+    assert not breaker.before_call(policy)
+    breaker.record("failure", policy)
+    assert breaker.state == "open"
+
+    probe = breaker.before_call(policy)
+    assert probe and breaker.state == "half_open"
+    breaker.record("success", policy, late)
+    assert breaker.state == "half_open"
+    # The probe is still out, so nothing else gets through
+    with pytest.raises(CircuitOpen):
+        breaker.before_call(policy)
+    breaker.record("success", policy, probe)
+    assert breaker.state == "closed"
+
+def test_hedged_request_takes_the_faster_response():
+    with StubProviderServer(latency=0) as server:
+        # The first request stalls; the hedge sent after 0.1s answers at once
+        server.scripted_latencies.append(1.0)
+        function = _function(server.url, hedge={"delay": 0.1})
+        resilience = Resilience()
+        started = time.perf_counter()
+        assert asyncio.run(_call(resilience, function)) == {"text": "stub response"}
+        assert time.perf_counter() - started < 0.6
+        assert resilience.hedges == 1 and resilience.hedge_wins == 1
@@ -0,0 +1,107 @@
+import asyncio
+import pytest
+
+from services.providers.scheduler import ProviderLimits, ProviderOverloaded, ProviderScheduler, TokenBucket
+
+def _scheduler(**limits):
+    provider_limits = ProviderLimits("ollama")
+    for name, value in limits.items():
+        setattr(provider_limits, name, value)
+    return ProviderScheduler("ollama", provider_limits)
+
+def test_concurrency_is_bounded_and_functions_are_served_round_robin():
+    scheduler = _scheduler(max_concurrency=1, max_queue=10, max_queue_wait=5)
+    order = []
+
+    async def call(function_name, i):
+        async with scheduler.slot(function_name, {}, 0):
+            order.append((function_name, i))
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        # "busy" queues three calls before "quiet" queues one
+        tasks = [asyncio.create_task(call("busy", i)) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(call("quiet", 0)))
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert order[:3] == [("busy", 0), ("busy", 1), ("quiet", 0)]
+    assert scheduler.active == 0 and scheduler.queued == 0
+
+def test_per_function_concurrency_limit():
+    scheduler = _scheduler(max_concurrency=10, max_queue=10, max_queue_wait=5)
+    running = peak = 0
+
+    async def call():
+        nonlocal running, peak
+        async with scheduler.slot("limited", {"max_concurrency": 2}, 0):
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    async def scenario():
+        await asyncio.gather(*(call() for _ in range(6)))
+
+    asyncio.run(scenario())
+    assert peak == 2
+
+def test_full_queue_is_rejected_with_retry_after():
+    scheduler = _scheduler(max_concurrency=1, max_queue=1, max_queue_wait=5)
+
+    async def call():
+        async with scheduler.slot("f", {}, 0):
+            await asyncio.sleep(0.05)
+
+    async def scenario():
+        return await asyncio.gather(*(call() for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    errors = [r for r in results if isinstance(r, ProviderOverloaded)]
+    assert len(errors) == 1
+    assert errors[0].status_code == 503 and int(errors[0].headers["Retry-After"]) >= 1
+    assert scheduler.rejected == 1
+
+def test_rate_limit_delays_then_rejects():
+    bucket = TokenBucket(per_minute=60)
+    bucket.tokens = 0
+    assert bucket.reserve(1) == pytest.approx(1.0, abs=0.05)
+
+    scheduler = _scheduler(max_concurrency=4, max_queue=10, max_queue_wait=1, tokens_per_minute=600)
+    scheduler._tokens = TokenBucket(600)
+
+    async def scenario():
+        async with scheduler.slot("f", {}, 600):
+            pass
+        # The bucket is empty; another 600 tokens would take a minute
+        async with scheduler.slot("f", {}, 600):
+            pass
+
+    with pytest.raises(ProviderOverloaded):
+        asyncio.run(scenario())
+    assert scheduler.active == 0
+
+def test_calls_waiting_for_rate_budget_do_not_hold_a_slot():
+    scheduler = _scheduler(max_concurrency=1, max_queue=10, max_queue_wait=5)
+    order = []
+
+    async def call(function_name, limits):
+        async with scheduler.slot(function_name, limits, 0):
+            order.append(function_name)
+
+    async def scenario():
+        limited = {"requests_per_minute": 60}
+        await call("limited", limited)
+        scheduler._functions["limited"].requests.tokens = 0
+        # "limited" now waits about a second for budget; "free" runs meanwhile
+        waiting = asyncio.create_task(call("limited", limited))
+        await asyncio.sleep(0.01)
+        await asyncio.wait_for(call("free", {}), 0.5)
+        await waiting
+
+    asyncio.run(scenario())
+    assert order == ["limited", "free", "limited"]
+    assert scheduler.active == 0
+    # The moving average (from 1.0) decayed over three instant calls; the rate wait is not in it
+    assert scheduler._avg_duration < 0.75
@@ -0,0 +1,46 @@
+import asyncio
+
+from services.singleflight import SingleFlight, should_coalesce
+
+def test_identical_concurrent_calls_share_one_execution():
+    calls = []
+
+    async def scenario():
+        flight = SingleFlight()
+
+        async def slow(value):
+            calls.append(value)
+            await asyncio.sleep(0.05)
+            return value
+
+        same = [flight.do("fn", "a", lambda: slow("a")) for _ in range(10)]
+        results = await asyncio.gather(*same, flight.do("fn", "b", lambda: slow("b")))
+        assert results == ["a"] * 10 + ["b"]
+        assert flight.stats()["functions"]["fn"] == {"executed": 2, "coalesced": 9}
+        assert len(flight) == 0
+
+    asyncio.run(scenario())
+    assert calls == ["a", "b"]
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        leader = asyncio.ensure_future(flight.do("fn", "k", slow))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("fn", "k", slow))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == "done"
+
+    asyncio.run(scenario())
+
+def test_coalescing_defaults_to_llm_providers():
+    assert should_coalesce("anthropic", {})
+    assert not should_coalesce("anthropic", {"coalesce": False})
+    assert not should_coalesce("database_query", {})
+    assert should_coalesce("python_code", {"coalesce": True})
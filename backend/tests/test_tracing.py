@@ -0,0 +1,99 @@
+import asyncio
+import json
+
+from services.profiler import SlowCallProfiler
+from services.tracing import Tracer, tracer
+
+def _exported_spans(path):
+    spans = []
+    for line in path.read_text().splitlines():
+        for resource in json.loads(line)["resourceSpans"]:
+            for scope in resource["scopeSpans"]:
+                spans.extend(scope["spans"])
+    return {span["name"]: span for span in spans}
+
+def test_spans_nest_and_export_as_otlp_json(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    local = Tracer(export=f"file:{path}")
+    remote_trace = "4bf92f3577b34da6a3ce929d0e0e4736"
+
+    with local.span("request", traceparent=f"00-{remote_trace}-00f067aa0ba902b7-01") as root:
+        with local.span("child", {"rows": 3}) as child:
+            pass
+    try:
+        with local.span("failed"):
+            raise ValueError("boom")
+    except ValueError:
+        pass
+    assert local.export() == 3
+
+    spans = _exported_spans(path)
+    assert spans["request"]["traceId"] == remote_trace
+    assert spans["request"]["parentSpanId"] == "00f067aa0ba902b7"
+    assert spans["child"]["parentSpanId"] == root.span_id == spans["request"]["spanId"]
+    assert spans["child"]["spanId"] == child.span_id
+    assert spans["child"]["attributes"] == [{"key": "rows", "value": {"intValue": "3"}}]
+    assert spans["failed"]["status"] == {"code": 2, "message": "boom"}
+    assert "parentSpanId" not in spans["failed"]
+
+def test_sampled_out_traces_record_nothing():
+    local = Tracer(export="file:/dev/null", sample_rate=0.0)
+    with local.span("root") as root:
+        with local.span("child") as child:
+            assert root is None and child is None
+    assert local.drain() == []
+
+def test_database_query_is_traced(tmp_path, monkeypatch):
+    from services.database_query import execute_database_function
+
+    path = tmp_path / "spans.jsonl"
+    monkeypatch.setattr(tracer, "enabled", True)
+    monkeypatch.setattr(tracer, "export_to", f"file:{path}")
+    tracer.drain()
+    execute_database_function({"connection_string": "sqlite://", "query_template": "SELECT 1 AS one"}, {})
+    tracer.export()
+
+    span = _exported_spans(path)["db.query"]
+    attributes = {item["key"]: item["value"]["stringValue"] for item in span["attributes"]}
+    assert attributes == {"db.system": "sqlite", "db.statement": "SELECT 1 AS one"}
+
+def test_slow_calls_keep_a_stack_profile():
+    profiler = SlowCallProfiler(threshold_ms=50, interval=0.005)
+
+    class Function:
+        name = "slow"
+
+    async def waits_on_io(seconds):
+        await asyncio.sleep(seconds)
+
+    async def scenario():
+        with profiler.profile(Function):
+            await waits_on_io(0.001)
+        with profiler.profile(Function):
+            await waits_on_io(0.15)
+
+    asyncio.run(scenario())
+    [summary] = profiler.list()
+    assert summary["function"] == "slow" and summary["duration_ms"] >= 150
+    collapsed = profiler.collapsed(profiler.get(summary["id"]))
+    assert "waits_on_io" in collapsed
+
+def test_failed_span_export_does_not_skip_shutdown(monkeypatch):
+    from fastapi.testclient import TestClient
+    from main import app
+    from services.history import execution_log
+
+    monkeypatch.setattr(tracer, "enabled", True)
+    monkeypatch.setattr(tracer, "export_to", "http://127.0.0.1:9")
+    flushed = []
+    original_flush = execution_log.flush
+
+    async def flush(*args, **kwargs):
+        flushed.append(True)
+        return await original_flush(*args, **kwargs)
+
+    monkeypatch.setattr(execution_log, "flush", flush)
+    with TestClient(app) as client:
+        client.get("/")
+    # The collector is unreachable, yet the history flush after it still ran
+    assert flushed
@@ -0,0 +1,74 @@
+import pytest
+from fastapi import HTTPException
+
+from utils.json_schema import CompiledSchema
+from utils.validation import CompiledTemplate, format_template, validate_json_schema, validate_template
+
+def test_compiled_template_renders_like_str_format():
+    template = "Hi {name}! {user.title} #{items[1]} {score:.2f} {name!r} {score:>{width}}"
+    inputs = {
+        "name": "Ada",
+        "user": type("User", (), {"title": "Dr"})(),
+        "items": ["a", "b"],
+        "score": 3.14159,
+        "width": 8,
+    }
+    compiled = CompiledTemplate(template)
+    assert compiled.render(inputs) == template.format(**inputs)
+    assert compiled.fields == {"name", "user", "items", "score", "width"}
+
+def test_missing_input_is_a_400():
+    with pytest.raises(HTTPException) as error:
+        format_template("Hi {name}", {})
+    assert error.value.status_code == 400
+
+def test_templates_are_checked_against_the_schema_when_saved():
+    schema = {"type": "object", "properties": {"name": {"type": "string"}}}
+    assert validate_template("Hi {name}", schema).fields == {"name"}
+    for template, message in [
+        ("Hi {nmae}", "references inputs not in input_schema: nmae"),
+        ("Hi {name", "Invalid prompt_template"),
+        ("Hi {}", "Positional field"),
+    ]:
+        with pytest.raises(HTTPException) as error:
+            validate_template(template, schema)
+        assert error.value.status_code == 400 and message in error.value.detail
+
+def test_compiled_schema_reports_every_error_with_its_path():
+    schema = CompiledSchema({
+        "type": "object",
+        "$defs": {"tag": {"type": "string", "pattern": "^[a-z]+$"}},
+        "properties": {
+            "name": {"type": "string", "minLength": 1},
+            "tags": {"type": "array", "items": {"$ref": "#/$defs/tag"}, "uniqueItems": True},
+            "mode": {"enum": ["fast", "exact"]},
+            "limit": {"anyOf": [{"type": "integer", "multipleOf": 10}, {"type": "null"}]},
+        },
+        "required": ["name"],
+    })
+    assert schema.errors({"name": "a", "tags": ["x", "y"], "mode": "fast", "limit": None}) == []
+    assert sorted(schema.errors({"tags": ["ok", "Bad", "ok"], "mode": "slow", "limit": 15})) == sorted([
+        "tags: ['ok', 'Bad', 'ok'] has non-unique elements",
+        "tags[1]: 'Bad' does not match '^[a-z]+$'",
+        "mode: 'slow' is not one of ['fast', 'exact']",
+        "limit: 15 is not valid under any of the given schemas",
+        "inputs: 'name' is a required property",
+    ])
+    # JSON types: booleans are not numbers, 1.0 is an integer
+    assert CompiledSchema({"type": "integer"}).errors(True) == ["inputs: True is not of type 'integer'"]
+    assert CompiledSchema({"type": "integer"}).errors(1.0) == []
+    # Reserved inputs pass additionalProperties: false unless the schema declares them
+    strict = CompiledSchema({"properties": {"x": {}}, "additionalProperties": False}, ("api_key",))
+    assert strict.errors({"x": 1, "api_key": "k"}) == []
+
+def test_invalid_schemas_are_rejected_when_saved():
+    assert validate_json_schema('{"type": "object"}') == {"type": "object"}
+    for schema in (
+        '{"type": "text"}', '{"required": "x"}', '{"pattern": "("}', '[]',
+        # Unresolvable, and looping without ever moving into a part of the value
+        '{"$ref": "#/$defs/missing"}', '{"$ref": "#"}',
+        '{"$defs": {"a": {"anyOf": [{"$ref": "#"}]}}, "allOf": [{"$ref": "#/$defs/a"}]}',
+    ):
+        with pytest.raises(HTTPException) as error:
+            validate_json_schema(schema)
+        assert error.value.status_code == 400
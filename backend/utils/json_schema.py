@@ -0,0 +1,122 @@
+import json
+from functools import lru_cache
+from typing import Dict, Any, Collection, Iterator, List, Tuple
+
+from jsonschema import Draft202012Validator, exceptions, validators
+from referencing import Registry, Resource
+from referencing.exceptions import Unresolvable
+from referencing.jsonschema import DRAFT202012, specification_with
+
+class SchemaError(ValueError):
+    """The schema itself is invalid"""
+
+# Keywords whose subschemas apply to the value itself, and those applying to parts of it
+_IN_PLACE = ("not", "if", "then", "else")
+_IN_PLACE_LISTS = ("allOf", "anyOf", "oneOf")
+_NESTED = ("items", "additionalItems", "additionalProperties", "contains", "propertyNames",
+           "unevaluatedItems", "unevaluatedProperties")
+_NESTED_LISTS = ("prefixItems",)
+_NESTED_MAPS = ("properties", "patternProperties", "$defs", "definitions")
+
+def _lookup(resolver, ref: Any):
+    try:
+        return resolver.lookup(ref)
+    except (Unresolvable, TypeError):
+        raise SchemaError(f"Unresolvable $ref: {ref}")
+
+def _in_place(schema: Dict[str, Any], resolver) -> Iterator[Tuple[Any, Any]]:
+    """Subschemas applied to the same value as `schema`"""
+    if "$ref" in schema:
+        resolved = _lookup(resolver, schema["$ref"])
+        yield resolved.contents, resolved.resolver
+    for key in _IN_PLACE:
+        if key in schema:
+            yield schema[key], resolver
+    for key in _IN_PLACE_LISTS:
+        for sub in schema.get(key) or ():
+            yield sub, resolver
+    for sub in (schema.get("dependentSchemas") or {}).values():
+        yield sub, resolver
+
+def _nested(schema: Dict[str, Any]) -> Iterator[Any]:
+    """Subschemas applied to parts of the value, and definitions"""
+    for key in _NESTED:
+        value = schema.get(key)
+        # Before 2020-12, "items" may be an array of schemas
+        yield from value if isinstance(value, list) else ([value] if value is not None else [])
+    for key in _NESTED_LISTS:
+        yield from schema.get(key) or ()
+    for key in _NESTED_MAPS:
+        yield from (schema.get(key) or {}).values()
+
+def _check_refs(schema: Any, specification) -> None:
+    """Resolve every $ref once, and reject loops that never move into a part of the value
+
+    {"$ref": "#"} (or a chain of refs and allOf/anyOf/... back to a schema
+    already applied to the same value) would recurse forever on every call.
+    """
+    resource = Resource.from_contents(schema, default_specification=specification)
+    resolver = Registry().with_resource("", resource).resolver()
+    state: Dict[int, int] = {}  # 1: applied higher up the current chain, 2: checked
+    walked = set()
+
+    def follow(node: Any, node_resolver) -> None:
+        if not isinstance(node, dict) or state.get(id(node)) == 2:
+            return
+        if state.get(id(node)) == 1:
+            raise SchemaError("$ref loops back to a schema already applied to the same value")
+        state[id(node)] = 1
+        for sub, sub_resolver in _in_place(node, node_resolver):
+            follow(sub, sub_resolver)
+        state[id(node)] = 2
+
+    def walk(node: Any) -> None:
+        if not isinstance(node, dict) or id(node) in walked:
+            return
+        walked.add(id(node))
+        follow(node, resolver)
+        for sub, _ in _in_place({key: value for key, value in node.items() if key != "$ref"}, resolver):
+            walk(sub)
+        for sub in _nested(node):
+            walk(sub)
+
+    walk(schema)
+
+def _path(path) -> str:
+    text = ""
+    for key in path:
+        text += f"[{key}]" if isinstance(key, int) else (f".{key}" if text else str(key))
+    return text or "inputs"
+
+class CompiledSchema:
+    """A JSON Schema checked once and held as a jsonschema validator
+
+    The draft comes from "$schema" (2020-12 when absent). Names in `reserved`
+    that the schema does not declare are left out before validation, so
+    additionalProperties: false does not reject them.
+    """
+
+    __slots__ = ("schema", "validator", "ignored")
+
+    def __init__(self, schema: Any, reserved: Collection[str] = ()):
+        self.schema = schema
+        cls = validators.validator_for(schema, default=Draft202012Validator)
+        try:
+            cls.check_schema(schema)
+        except exceptions.SchemaError as e:
+            location = "/".join(str(part) for part in e.absolute_path)
+            raise SchemaError(f"{e.message}{f' (at {location})' if location else ''}")
+        _check_refs(schema, specification_with(cls.META_SCHEMA["$id"], default=DRAFT202012))
+        self.validator = cls(schema)
+        properties = schema.get("properties") if isinstance(schema, dict) else None
+        self.ignored = frozenset(name for name in reserved if not (isinstance(properties, dict) and name in properties))
+
+    def errors(self, value: Any) -> List[str]:
+        if self.ignored and isinstance(value, dict) and not self.ignored.isdisjoint(value):
+            value = {key: item for key, item in value.items() if key not in self.ignored}
+        return [f"{_path(error.absolute_path)}: {error.message}" for error in self.validator.iter_errors(value)]
+
+@lru_cache(maxsize=1024)
+def compile_schema(schema_json: str, reserved: tuple = ()) -> CompiledSchema:
+    """Compile a schema from its JSON text; identical schemas share one validator"""
+    return CompiledSchema(json.loads(schema_json or "{}"), reserved)
@@ -0,0 +1,153 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+from typing import Dict, Any, Optional
+
+# LOG_LEVEL sets the root level; LOG_LEVELS overrides it per module, e.g.
+#   LOG_LEVELS="services.providers=DEBUG,routers.functions=WARNING"
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.environ.get("LOG_LEVELS", "")
+# "text" or "json" (one object per line)
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+# Fraction of DEBUG records kept; per-request debug lines add up quickly
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1.0"))
+# Log input values (secrets still masked) instead of only their keys
+LOG_INPUTS = os.environ.get("LOG_INPUTS", "").lower() in ("1", "true", "yes")
+
+SECRET_KEYS = {"api_key", "apikey", "authorization", "password", "secret", "token", "connection_string"}
+REDACTED = "***"
+
+# Secrets that end up inside free-form messages (error strings, URLs)
+_SECRET_PATTERN = re.compile(
+    r"(sk-[A-Za-z0-9_\-]{8,}|pplx-[A-Za-z0-9]{8,}|(?i:bearer)\s+[A-Za-z0-9._\-]{8,}"
+    r"|(?i:api_key|password)=[^\s&,;]+|://[^/\s:@]+:[^/\s@]+@)"
+)
+
+# Standard LogRecord attributes; anything else was passed with extra={...}
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def redact(value: Any) -> Any:
+    """Copy of a JSON-like value with secret-looking keys masked"""
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if str(key).lower() in SECRET_KEYS else redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+def redact_text(text: str) -> str:
+    def mask(match: re.Match) -> str:
+        secret = match.group(0)
+        if secret.startswith("://"):
+            return "://" + REDACTED + "@"
+        if "=" in secret:
+            return secret.split("=", 1)[0] + "=" + REDACTED
+        return REDACTED
+    return _SECRET_PATTERN.sub(mask, text)
+
+def loggable_inputs(inputs: Dict[str, Any]) -> Any:
+    """What to log for a call's inputs: their keys, or masked values with LOG_INPUTS"""
+    return redact(inputs) if LOG_INPUTS else sorted(inputs)
+
+class RedactingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that masks secrets in the message, traceback and extra fields"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # prepare() renders the message and any traceback into record.msg
+        record = super().prepare(record)
+        record.msg = record.message = redact_text(record.msg)
+        for key, value in list(vars(record).items()):
+            if key not in _RECORD_FIELDS:
+                setattr(record, key, REDACTED if key.lower() in SECRET_KEYS else redact(value))
+        return record
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of DEBUG records; INFO and above always pass"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or self.rate >= 1.0 or random.random() < self.rate
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_FIELDS})
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        extra = {key: value for key, value in vars(record).items() if key not in _RECORD_FIELDS}
+        if extra:
+            text += " " + " ".join(f"{key}={value}" for key, value in extra.items())
+        return text
+
+def parse_levels(spec: str) -> Dict[str, str]:
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, level = item.partition("=")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+def setup_logging(
+    level: str = LOG_LEVEL,
+    levels: str = LOG_LEVELS,
+    format: str = LOG_FORMAT,
+    sample_rate: float = LOG_SAMPLE_RATE,
+) -> None:
+    """Route all logging through a queue so request handlers never wait on stdout
+
+    Records are sampled and redacted on the calling thread and written by a
+    background listener thread. Safe to call more than once.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JSONFormatter() if format == "json" else TextFormatter())
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    handler = RedactingQueueHandler(records)
+    handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    for existing in [h for h in root.handlers if isinstance(h, logging.handlers.QueueHandler)]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name, module_level in parse_levels(levels).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+
+def stop_logging() -> None:
+    """Flush queued records; called at shutdown"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(stop_logging)
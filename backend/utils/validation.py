@@ -1,34 +1,135 @@
 import json
-from typing import Dict, Any, Optional
+import re
+import string
+from functools import lru_cache
+from typing import Dict, Any, Optional, Union
 from fastapi import HTTPException
 
+from utils.json_schema import CompiledSchema, SchemaError, compile_schema
+
+_formatter = string.Formatter()
+
+def validate_json_config(config_str: str) -> Dict[str, Any]:
+    """Validate that a string contains valid JSON"""
+    try:
+        return json.loads(config_str)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON config: {str(e)}")
+
 def validate_json_schema(schema_str: str) -> Dict[str, Any]:
-    """Validate that a string contains valid JSON schema"""
+    """Validate that a string contains a valid JSON schema"""
     try:
         schema = json.loads(schema_str)
-        # TODO: Add more advanced schema validation if needed
-        return schema
     except json.JSONDecodeError as e:
         raise HTTPException(status_code=400, detail=f"Invalid JSON schema: {str(e)}")
+    try:
+        compile_schema(schema_str)
+    except SchemaError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON schema: {str(e)}")
+    return schema
 
-def validate_inputs(inputs: Dict[str, Any], schema: Dict[str, Any]) -> Dict[str, Any]:
-    """Validate inputs against a JSON schema"""
-    # TODO: Add more sophisticated schema validation
-    # For now, just check required fields
-    if "properties" in schema and "required" in schema:
-        for field in schema.get("required", []):
-            if field not in inputs:
-                raise HTTPException(status_code=400, detail=f"Missing required field: {field}")
+# Errors listed in one 400 response; the rest are counted
+MAX_INPUT_ERRORS = 10
+
+def validate_inputs(inputs: Dict[str, Any], schema: Union[CompiledSchema, Dict[str, Any]]) -> Dict[str, Any]:
+    """Validate inputs against a JSON schema (compiled, or a dict compiled on first use)"""
+    if not isinstance(schema, CompiledSchema):
+        schema = compile_schema(json.dumps(schema, sort_keys=True))
+    errors = schema.errors(inputs)
+    if errors:
+        detail = "; ".join(errors[:MAX_INPUT_ERRORS])
+        if len(errors) > MAX_INPUT_ERRORS:
+            detail += f"; and {len(errors) - MAX_INPUT_ERRORS} more"
+        raise HTTPException(status_code=400, detail=f"Invalid inputs: {detail}")
     return inputs
 
+# Leading name of a replacement field: "user" in "user.name" or "user[0]"
+_FIELD_ROOT = re.compile(r"[^.\[]*")
+
+# Segment kinds
+_LITERAL, _NAME, _FIELD = 0, 1, 2
+
+class CompiledTemplate:
+    """A template string parsed once into literal text and replacement fields
+
+    `fields` holds the top-level input names the template references. Plain
+    `{name}` fields render with a dict lookup; attribute/index access,
+    conversions and format specs take the general str.format path.
+    """
+
+    __slots__ = ("source", "segments", "fields")
+
+    def __init__(self, source: str):
+        self.source = source
+        self.segments = []
+        fields = set()
+        # Raises ValueError for malformed templates (e.g. a single '}')
+        for literal, field_name, format_spec, conversion in _formatter.parse(source):
+            if literal:
+                self.segments.append((_LITERAL, literal))
+            if field_name is None:
+                continue
+            root = _FIELD_ROOT.match(field_name).group(0)
+            if not root or root.isdigit():
+                raise ValueError(f"Positional field '{{{field_name}}}' is not supported; name the input")
+            fields.add(root)
+            if format_spec and "{" in format_spec:
+                fields.update(CompiledTemplate(format_spec).fields)
+            if root == field_name and not format_spec and not conversion:
+                self.segments.append((_NAME, field_name))
+            else:
+                self.segments.append((_FIELD, field_name, format_spec, conversion))
+        self.fields = frozenset(fields)
+
+    def render(self, inputs: Dict[str, Any]) -> str:
+        """Substitute input values into the pre-parsed segments"""
+        parts = []
+        for segment in self.segments:
+            kind = segment[0]
+            if kind == _LITERAL:
+                parts.append(segment[1])
+            elif kind == _NAME:
+                value = inputs[segment[1]]
+                parts.append(value if type(value) is str else format(value, ""))
+            else:
+                _, field_name, format_spec, conversion = segment
+                value = _formatter.get_field(field_name, (), inputs)[0]
+                if conversion:
+                    value = _formatter.convert_field(value, conversion)
+                if format_spec and "{" in format_spec:
+                    format_spec = _formatter.vformat(format_spec, (), inputs)
+                parts.append(format(value, format_spec or ""))
+        return "".join(parts)
+
+@lru_cache(maxsize=1024)
+def compile_template(template: str) -> CompiledTemplate:
+    """Parse a template once; repeated calls with the same string are cached"""
+    return CompiledTemplate(template)
+
 def format_template(template: str, inputs: Dict[str, Any]) -> str:
     """Format a template string with input values"""
     try:
-        return template.format(**inputs)
+        return compile_template(template).render(inputs)
     except KeyError as e:
         raise HTTPException(
             status_code=400, 
             detail=f"Missing required input: {str(e)}. Available inputs: {list(inputs.keys())}"
         )
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error formatting template: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error formatting template: {str(e)}")
+
+def validate_template(template: str, input_schema: Dict[str, Any], key: str = "prompt_template") -> CompiledTemplate:
+    """Compile a template when a function is saved and check its fields against input_schema"""
+    try:
+        compiled = compile_template(template)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid {key}: {str(e)}")
+    properties = input_schema.get("properties") if isinstance(input_schema, dict) else None
+    if isinstance(properties, dict):
+        unknown = sorted(compiled.fields - set(properties))
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"{key} references inputs not in input_schema: {', '.join(unknown)}"
+            )
+    return compiled